@@ -0,0 +1,160 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+import metrics
+from pricing import price_sale_lines
+from products import NonStockedProduct
+from store import OrderResult
+
+# How long the batcher waits for more orders before committing, in seconds
+BATCH_WINDOW = 0.002
+# Commit as soon as this many orders are waiting
+MAX_BATCH_SIZE = 1000
+
+
+def commit_orders(store_class, shopping_lists: List[List[tuple]]) \
+        -> List[OrderResult]:
+    """Commits many orders against a store as a single group.
+    Carts are merged per product, so stock is read and written once per
+    product for the whole group. Orders are served in arrival order, each
+    one all-or-nothing like Store.checkout, and every order gets its own
+    OrderResult. A malformed shopping list only fails its own order.
+    """
+    start = time.perf_counter() if metrics.ENABLED else None
+    carts = []
+    for shopping_list in shopping_lists:
+        try:
+            carts.append(store_class.generate_order_dict(shopping_list))
+        except (ValueError, TypeError, AttributeError) as error:
+            carts.append(OrderResult([], [f"Invalid shopping list: "
+                                          f"{error}"]))
+    products = {product for cart in carts if isinstance(cart, dict)
+                for product in cart}
+    results = []
+    sales = []
+    with store_class.lock_products(products):
+        buy_start = time.perf_counter() if metrics.ENABLED else None
+        # Stock held by reservations can't be sold
+        reserved = {product: store_class.get_reserved(product)
+                    for product in products
+                    if not isinstance(product, NonStockedProduct)}
+        available = {product: product.quantity - held
+                     for product, held in reserved.items()}
+        for cart in carts:
+            # Carts that couldn't be aggregated fail on their own
+            if isinstance(cart, OrderResult):
+                results.append(cart)
+                continue
+            errors = []
+            for product, quantity in cart.items():
+                try:
+                    product.check_withdraw(quantity)
+                except (ValueError, TypeError) as error:
+                    errors.append(str(error) or f"Invalid quantity "
+                                                f"for {product.name}")
+                    continue
+                if product in available and quantity > available[product]:
+                    if metrics.ENABLED:
+                        metrics.STOCK_OUTS.inc()
+                    errors.append(f"Insufficient stock of {product.name}")
+            if errors:
+                results.append(OrderResult([], errors))
+                continue
+            for product, quantity in cart.items():
+                if product in available:
+                    available[product] -= quantity
+            cart_sales = price_sale_lines(list(cart.items()))
+            sales += cart_sales
+            results.append(OrderResult(
+                [(line.product, line.quantity, line.cents)
+                 for line in cart_sales], []))
+        for product, quantity in available.items():
+            quantity += reserved[product]
+            if quantity != product.quantity:
+                product.set_quantity(quantity)
+        if buy_start is not None:
+            metrics.record_buys(len(sales), buy_start)
+    store_class.record_sales(sales)
+    if start is not None:
+        metrics.record_orders(len(results),
+                              sum(not result.success for result in results),
+                              start)
+    return results
+
+
+class OrderBatcher:
+    """Background order queue that groups incoming orders.
+    Orders submitted from any thread are collected until the batch window
+    passes or the batch is full, then committed together with
+    commit_orders. Each submit returns a Future of the order's OrderResult.
+    """
+    def __init__(self, store_class, window=BATCH_WINDOW,
+                 max_batch_size=MAX_BATCH_SIZE):
+        """Initiate batcher and start its worker thread"""
+        self.store = store_class
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.pending = []
+        self.condition = threading.Condition()
+        self.closed = False
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, shopping_list: List[tuple]) -> Future:
+        """Queues an order and returns a Future of its OrderResult"""
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Order batcher is closed")
+            self.pending.append((shopping_list, future))
+            self.condition.notify()
+        return future
+
+    def order(self, shopping_list: List[tuple]) -> OrderResult:
+        """Submits an order and waits for its OrderResult"""
+        return self.submit(shopping_list).result()
+
+    def close(self):
+        """Commits the orders still waiting and stops the worker thread"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.worker.join()
+
+    def run(self):
+        """Worker loop, collects and commits batches until closed"""
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                deadline = time.monotonic() + self.window
+                while len(self.pending) < self.max_batch_size \
+                        and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch = self.pending[:self.max_batch_size]
+                del self.pending[:self.max_batch_size]
+            self.commit(batch)
+
+    def commit(self, batch: List[tuple]):
+        """Commits one batch and resolves its futures"""
+        try:
+            results = commit_orders(self.store, [shopping_list for
+                                                 shopping_list, _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,269 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import timeit
+import tracemalloc
+from products import Product, NonStockedProduct, LimitedProduct
+from promotions import SecondHalfPrice, ThirdOneFree, PercentDiscount
+from search import scan_products
+from sharding import ShardedStore
+from store import Store
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+CART_SIZES = [1, 5, 25]
+# Stock of generated products, high enough that benchmarks never run out
+STOCK = 10 ** 12
+# Benchmarks slower than this fraction of the baseline are regressions
+REGRESSION_THRESHOLD = 0.8
+# Queries run by the search benchmarks, against the linear scan baseline
+SEARCH_QUERIES = {
+    "substring": {"text": "uct 12"},
+    "prefix": {"prefix": "Product 99", "sort_by": "name"},
+    "filters": {"product_type": "LimitedProduct", "in_stock": True,
+                "min_price": 100, "max_price": 500, "sort_by": "price"},
+    "promotion_page": {"promotion": "30% off!", "sort_by": "price",
+                       "offset": 100},
+}
+# Carts sent to a sharded store in every order_many call
+SHARDED_BATCH = 2000
+
+
+def make_promotions() -> list:
+    """Returns the promotion mix of generated products,
+    None means no promotion."""
+    return [None, None,
+            SecondHalfPrice("Second Half price!"),
+            ThirdOneFree("Third One Free!"),
+            PercentDiscount("30% off!", percent=30)]
+
+
+def make_catalog(size, seed=0) -> Store:
+    """Creates a store with size synthetic products.
+    About 80% are regular products, 10% non stocked and 10% limited.
+    """
+    rng = random.Random(seed)
+    promotions = make_promotions()
+    product_list = []
+    for i in range(size):
+        kind = rng.random()
+        price = rng.randint(1, 2000)
+        if kind < 0.8:
+            product = Product(f"Product {i}", price, STOCK)
+        elif kind < 0.9:
+            product = NonStockedProduct(f"Product {i}", price)
+        else:
+            product = LimitedProduct(f"Product {i}", price, STOCK,
+                                     maximum=10 ** 6)
+        product.set_promotion(rng.choice(promotions))
+        product_list.append(product)
+    return Store(product_list)
+
+
+def make_carts(store_class, cart_size, count=100, seed=0) -> list:
+    """Creates count random shopping lists of cart_size lines"""
+    rng = random.Random(seed)
+    product_list = store_class.get_all_products()
+    return [[(rng.choice(product_list), rng.randint(1, 5))
+             for _ in range(cart_size)]
+            for _ in range(count)]
+
+
+def measure(func) -> dict:
+    """Runs func repeatedly for at least 0.2 seconds and returns
+    the number of calls, time taken and calls per second."""
+    calls, seconds = timeit.Timer(func).autorange()
+    return {"calls": calls, "seconds": round(seconds, 6),
+            "ops_per_sec": round(calls / seconds, 1)}
+
+
+def measure_memory(size, seed=0) -> int:
+    """Returns the peak traced memory in bytes of building a catalog"""
+    tracemalloc.start()
+    try:
+        store_class = make_catalog(size, seed)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del store_class
+    return peak
+
+
+def cycle(items):
+    """Returns a function that returns the next item on every call"""
+    state = {"index": 0}
+
+    def next_item():
+        item = items[state["index"] % len(items)]
+        state["index"] += 1
+        return item
+    return next_item
+
+
+def benchmark_size(size, seed=0) -> list:
+    """Runs all benchmarks on a catalog of the given size"""
+    results = []
+
+    def record(name, func):
+        results.append({"size": size, "benchmark": name, **measure(func)})
+
+    start = time.perf_counter()
+    store_class = make_catalog(size, seed)
+    seconds = time.perf_counter() - start
+    results.append({"size": size, "benchmark": "make_catalog", "calls": 1,
+                    "seconds": round(seconds, 6),
+                    "ops_per_sec": round(size / seconds, 1)})
+
+    record("get_total_quantity", store_class.get_total_quantity)
+    record("get_all_products", store_class.get_all_products)
+
+    start = time.perf_counter()
+    store_class.search()
+    seconds = time.perf_counter() - start
+    results.append({"size": size, "benchmark": "search_index_build",
+                    "calls": 1, "seconds": round(seconds, 6),
+                    "ops_per_sec": round(size / seconds, 1)})
+    for name, query in SEARCH_QUERIES.items():
+        record(f"search[{name}]",
+               lambda query=query: store_class.search(**query))
+        record(f"scan[{name}]",
+               lambda query=query: scan_products(store_class, **query))
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for cart_size in CART_SIZES:
+            carts = make_carts(store_class, cart_size, seed=seed)
+            next_cart = cycle(carts)
+            record(f"generate_order_dict[{cart_size}]",
+                   lambda: store_class.generate_order_dict(next_cart()))
+            record(f"order[{cart_size}]",
+                   lambda: store_class.order(next_cart()))
+
+    product = store_class.get_product("Product 0")
+    record("Product.buy", lambda: product.buy(1))
+
+    quantities = cycle(list(range(1, 50)))
+    for promotion in make_promotions()[2:]:
+        record(f"{type(promotion).__name__}.apply_promotion",
+               lambda promotion=promotion:
+               promotion.apply_promotion(product, quantities()))
+        prices = [product.price] * 1000
+        batch = list(range(1, 1001))
+        record(f"{type(promotion).__name__}.apply_promotion_batch[1000]",
+               lambda promotion=promotion:
+               promotion.apply_promotion_batch(prices, batch))
+    return results
+
+
+def benchmark_sharding(size, shard_counts, cart_size=5, seed=0) -> list:
+    """Measures ShardedStore order throughput for every shard count.
+    Carts are committed in batches of SHARDED_BATCH, speedup is relative
+    to the first shard count."""
+    store_class = make_catalog(size, seed)
+    carts = [[(product.name, quantity) for product, quantity in cart]
+             for cart in make_carts(store_class, cart_size,
+                                    count=SHARDED_BATCH, seed=seed)]
+    results = []
+    for shards in shard_counts:
+        with ShardedStore(store_class.products_list, shards) as sharded:
+            timing = measure(lambda: sharded.order_many(carts))
+        orders_per_sec = timing["ops_per_sec"] * SHARDED_BATCH
+        results.append({"size": size, "shards": shards,
+                        "orders_per_sec": round(orders_per_sec, 1),
+                        "speedup": round(orders_per_sec
+                                         / results[0]["orders_per_sec"], 2)
+                        if results else 1.0})
+    return results
+
+
+def git_commit() -> str:
+    """Returns the current git commit, or None outside a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, seed=0, memory=True, shard_counts=None) -> dict:
+    """Runs the benchmark suite for every catalog size, and the sharded
+    store scaling benchmark if shard counts are given."""
+    report = {"meta": {"commit": git_commit(),
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "seed": seed},
+              "results": [], "memory": [], "sharding": []}
+    for size in sizes:
+        if memory:
+            report["memory"].append({"size": size,
+                                     "peak_bytes": measure_memory(size,
+                                                                  seed)})
+        report["results"].extend(benchmark_size(size, seed))
+        if shard_counts:
+            report["sharding"].extend(benchmark_sharding(size, shard_counts,
+                                                         seed=seed))
+    return report
+
+
+def compare(report, baseline) -> list:
+    """Returns (size, benchmark, ratio) for every benchmark found in both
+    reports, where ratio is new ops/sec divided by baseline ops/sec."""
+    old = {(result["size"], result["benchmark"]): result["ops_per_sec"]
+           for result in baseline["results"]}
+    return [(result["size"], result["benchmark"],
+             result["ops_per_sec"] / old[(result["size"],
+                                          result["benchmark"])])
+            for result in report["results"]
+            if old.get((result["size"], result["benchmark"]))]
+
+
+def main():
+    """Run the benchmark suite and write the results as JSON"""
+    parser = argparse.ArgumentParser(description="Best Buy benchmarks")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated catalog sizes, "
+                             "up to 10000000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="baseline JSON results file")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the traced memory measurement")
+    parser.add_argument("--shards", help="comma separated shard counts of "
+                                         "the sharded store benchmark, "
+                                         "e.g. 1,2,4")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    shard_counts = [int(shards) for shards in args.shards.split(",")] \
+        if args.shards else None
+    report = run_benchmarks(sizes, args.seed, memory=not args.no_memory,
+                            shard_counts=shard_counts)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+
+    for result in report["results"]:
+        print(f"{result['size']:>10} {result['benchmark']:<45} "
+              f"{result['ops_per_sec']:>14,.1f} ops/s")
+    for result in report["sharding"]:
+        print(f"{result['size']:>10} sharded x{result['shards']:<37} "
+              f"{result['orders_per_sec']:>14,.1f} orders/s "
+              f"{result['speedup']:>6.2f}x")
+    for result in report["memory"]:
+        print(f"{result['size']:>10} peak memory "
+              f"{result['peak_bytes'] / 2 ** 20:,.1f} MiB")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        for size, name, ratio in compare(report, baseline):
+            flag = "  REGRESSION" if ratio < REGRESSION_THRESHOLD else ""
+            print(f"{size:>10} {name:<45} {ratio:>6.2f}x{flag}")
+
+
+if __name__ == '__main__':
+    main()
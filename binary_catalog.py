@@ -0,0 +1,171 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+from products import product_from_dict
+from promotions import promotion_from_dict
+
+# File header: magic, format version, records, highest product id, total
+# quantity, active records, and the offsets of the records, the name
+# order, the string table and the promotions, plus the promotions size.
+# Files are shared between machines, so the byte order is fixed.
+HEADER = struct.Struct("<8sqqqqqqqqqq")
+BINARY_MAGIC = b"BBCATBIN"
+BINARY_VERSION = 1
+# Product record: id, price, quantity, max per order, name offset in the
+# string table and length in bytes, promotion index or -1, type code and
+# active flag, padded to a multiple of 8 bytes
+RECORD = struct.Struct("<qqqqqIibb6x")
+PRODUCT_ID = struct.Struct("<q")
+TYPE_NAMES = ("Product", "NonStockedProduct", "LimitedProduct")
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+
+
+def write_binary_catalog(store_class, path) -> int:
+    """Writes all products of a store to a binary catalog file, in id
+    order. The file is written next to path and then renamed over it, so
+    readers never see a partial catalog.
+    Returns the number of written products.
+    """
+    products = sorted(((store_class.get_product_id(product), product)
+                       for product in store_class.catalog),
+                      key=lambda entry: entry[0])
+    records = bytearray()
+    strings = bytearray()
+    names = []
+    promotions = {}
+    total_quantity = active_count = 0
+    for product_id, product in products:
+        name = product.name.encode("utf-8")
+        promotion = -1
+        if product.promotion is not None:
+            promotion = promotions.setdefault(id(product.promotion),
+                                              (len(promotions),
+                                               product.promotion))[0]
+        records += RECORD.pack(product_id, product.price, product.quantity,
+                               getattr(product, "max_per_order", 0),
+                               len(strings), len(name), promotion,
+                               TYPE_CODES[type(product).__name__],
+                               product.active)
+        strings += name
+        names.append(product.name)
+        total_quantity += product.quantity
+        active_count += product.active
+    by_name = array("q", sorted(range(len(names)), key=names.__getitem__))
+    if struct.pack("=q", 1) != PRODUCT_ID.pack(1):
+        by_name.byteswap()
+    promotions_data = json.dumps([promotion.to_dict() for _, promotion
+                                  in promotions.values()]).encode("utf-8")
+
+    records_offset = HEADER.size
+    by_name_offset = records_offset + len(records)
+    strings_offset = by_name_offset + len(by_name) * by_name.itemsize
+    promotions_offset = strings_offset + len(strings)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as catalog_file:
+        catalog_file.write(HEADER.pack(
+            BINARY_MAGIC, BINARY_VERSION, len(products),
+            products[-1][0] if products else 0, total_quantity,
+            active_count, records_offset, by_name_offset, strings_offset,
+            promotions_offset, len(promotions_data)))
+        catalog_file.write(records)
+        by_name.tofile(catalog_file)
+        catalog_file.write(strings)
+        catalog_file.write(promotions_data)
+    os.replace(temporary_path, path)
+    return len(products)
+
+
+class BinaryCatalogSource:
+    """Rows of a memory mapped binary catalog file, for LazyCatalog.
+    Records are read in place with struct.unpack_from, so opening the
+    file doesn't depend on its size, and processes opening the same file
+    share its pages through the OS page cache.
+    Raises ValueError if the file is not a binary catalog.
+    """
+    def __init__(self, path):
+        """Initiate source over a binary catalog file"""
+        with open(path, "rb") as catalog_file:
+            self.data = mmap.mmap(catalog_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size:
+            self.data.close()
+            raise ValueError(f"{path} is not a binary catalog")
+        (magic, version, self.size, self.max_id, self.total_quantity,
+         self.active_count, self.records_offset, by_name_offset,
+         self.strings_offset, promotions_offset, promotions_size) = \
+            HEADER.unpack_from(self.data)
+        if (magic, version) != (BINARY_MAGIC, BINARY_VERSION):
+            self.data.close()
+            raise ValueError(f"{path} is not a binary catalog")
+        self.view = memoryview(self.data)
+        self.by_name = self.view[by_name_offset:self.strings_offset]
+        if struct.pack("=q", 1) == PRODUCT_ID.pack(1):
+            self.by_name = self.by_name.cast("q")
+        else:
+            self.by_name = array("q", self.by_name)
+            self.by_name.byteswap()
+        self.promotions = [promotion_from_dict(data) for data in json.loads(
+            self.data[promotions_offset:promotions_offset + promotions_size])]
+
+    def record(self, index) -> tuple:
+        """Returns the unpacked record of a row"""
+        return RECORD.unpack_from(self.data,
+                                  self.records_offset + index * RECORD.size)
+
+    def id_of(self, index) -> int:
+        """Returns the product id of a row"""
+        return PRODUCT_ID.unpack_from(
+            self.data, self.records_offset + index * RECORD.size)[0]
+
+    def index_of(self, product_id):
+        """Returns the row index of a product id, or None.
+        Rows are in id order, ids are usually their position plus one,
+        otherwise they are found by binary search."""
+        index = product_id - 1
+        if 0 <= index < self.size and self.id_of(index) == product_id:
+            return index
+        low, high = 0, min(max(index, 0), self.size)
+        while low < high:
+            middle = (low + high) // 2
+            if self.id_of(middle) < product_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.size and self.id_of(low) == product_id:
+            return low
+        return None
+
+    def name_of(self, record) -> str:
+        """Returns the name of an unpacked record"""
+        start = self.strings_offset + record[4]
+        return str(self.view[start:start + record[5]], "utf-8")
+
+    def name_at(self, position) -> tuple:
+        """Returns the name and row index of the position-th row in name
+        order"""
+        index = self.by_name[position]
+        return self.name_of(self.record(index)), index
+
+    def load(self, index):
+        """Creates the product of a row"""
+        record = self.record(index)
+        _, price, quantity, max_per_order, _, _, promotion, type_code, \
+            active = record
+        product = product_from_dict({"type": TYPE_NAMES[type_code],
+                                     "name": self.name_of(record),
+                                     "price": price,
+                                     "quantity": quantity,
+                                     "max_per_order": max_per_order,
+                                     "active": bool(active)})
+        if promotion >= 0:
+            product.set_promotion(self.promotions[promotion])
+        return product
+
+    def close(self):
+        """Unmaps the catalog file"""
+        if isinstance(self.by_name, memoryview):
+            self.by_name.release()
+        self.view.release()
+        self.data.close()
@@ -0,0 +1,193 @@
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from itertools import chain
+from typing import Dict, Iterator, List
+
+# Entries per price index block, blocks are split at twice this size
+BLOCK_SIZE = 1000
+
+
+class PriceIndex:
+    """Sorted (price, product id) entries, kept in blocks of up to
+    2 * BLOCK_SIZE sorted lists along with the last entry of each block.
+    Adding or removing an entry bisects the block ends and then changes a
+    single block, so it takes O(log n + BLOCK_SIZE) instead of shifting
+    the whole index.
+    """
+    def __init__(self, entries=()):
+        """Initiate index from entries in any order, with a single sort"""
+        entries = sorted(entries)
+        self.blocks = [entries[start:start + BLOCK_SIZE]
+                       for start in range(0, len(entries), BLOCK_SIZE)]
+        self.maxes = [block[-1] for block in self.blocks]
+        self.size = len(entries)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self) -> Iterator[tuple]:
+        return chain.from_iterable(self.blocks)
+
+    def add(self, entry):
+        """Adds an entry at its sorted position"""
+        if not self.blocks:
+            self.blocks.append([entry])
+            self.maxes.append(entry)
+            self.size += 1
+            return
+        index = bisect_left(self.maxes, entry)
+        if index == len(self.maxes):
+            index -= 1
+            self.blocks[index].append(entry)
+            self.maxes[index] = entry
+        else:
+            insort(self.blocks[index], entry)
+        self.size += 1
+        block = self.blocks[index]
+        if len(block) > 2 * BLOCK_SIZE:
+            self.blocks[index:index + 1] = [block[:BLOCK_SIZE],
+                                            block[BLOCK_SIZE:]]
+            self.maxes[index:index + 1] = [block[BLOCK_SIZE - 1], block[-1]]
+
+    def discard(self, entry):
+        """Removes an entry, if it is there"""
+        index = bisect_left(self.maxes, entry)
+        if index == len(self.maxes):
+            return
+        block = self.blocks[index]
+        position = bisect_left(block, entry)
+        if block[position] != entry:
+            return
+        del block[position]
+        self.size -= 1
+        if not block:
+            del self.blocks[index]
+            del self.maxes[index]
+        elif position == len(block):
+            self.maxes[index] = block[-1]
+
+    def irange(self, low, high) -> Iterator[tuple]:
+        """Yields the entries with low <= entry <= high, in order"""
+        index = bisect_left(self.maxes, low)
+        if index == len(self.maxes):
+            return
+        position = bisect_left(self.blocks[index], low)
+        for block in self.blocks[index:]:
+            for entry in block[position:]:
+                if entry > high:
+                    return
+                yield entry
+            position = 0
+
+
+class Catalog:
+    """Indexed collection of products.
+    Every product gets a stable integer id when added. Products can be
+    looked up by id or name in O(1), and a sorted price index supports
+    price range queries without scanning the whole catalog. Adding,
+    removing and repricing a product update the price index in
+    O(log n + BLOCK_SIZE).
+    """
+    def __init__(self):
+        """Initiate empty catalog with its indexes"""
+        self.next_id = 1
+        self.products: Dict[int, object] = {}
+        self.ids: Dict[object, int] = {}
+        self.names: Dict[str, int] = {}
+        self.price_index = PriceIndex()
+        self.price_index_deferred = False
+
+    def __len__(self):
+        return len(self.products)
+
+    def __iter__(self):
+        return iter(self.products.values())
+
+    def __contains__(self, product_id):
+        return product_id in self.products
+
+    def __getitem__(self, product_id):
+        return self.products[product_id]
+
+    def add(self, product, product_id=None) -> int:
+        """Adds a product to the catalog and returns its stable id.
+        A specific id can be given, for example when restoring a saved store.
+        Raises ValueError if the product, its name or id is already in use.
+        """
+        if product in self.ids:
+            raise ValueError(f"{product.name} is already in the catalog")
+        if product.name in self.names:
+            raise ValueError(f"Product named {product.name} already exists")
+        if product_id is None:
+            product_id = self.next_id
+        elif product_id in self.products:
+            raise ValueError(f"Product id {product_id} is already in use")
+        self.next_id = max(self.next_id, product_id + 1)
+        self.products[product_id] = product
+        self.ids[product] = product_id
+        self.names[product.name] = product_id
+        if not self.price_index_deferred:
+            self.price_index.add((product.price, product_id))
+        return product_id
+
+    def remove(self, product) -> int:
+        """Removes a product from the catalog and returns its id.
+        Raises ValueError if the product is not in the catalog.
+        """
+        product_id = self.ids.pop(product, None)
+        if product_id is None:
+            raise ValueError(f"{product.name} is not in the catalog")
+        del self.products[product_id]
+        del self.names[product.name]
+        if not self.price_index_deferred:
+            self.price_index.discard((product.price, product_id))
+        return product_id
+
+    def get_id(self, product) -> int:
+        """Returns the stable id of a product"""
+        return self.ids[product]
+
+    def get_by_id(self, product_id):
+        """Returns the product with the given id, or None"""
+        return self.products.get(product_id)
+
+    def get_by_name(self, name):
+        """Returns the product with the given name, or None"""
+        product_id = self.names.get(name)
+        if product_id is None:
+            return None
+        return self.products[product_id]
+
+    def update_price(self, product, old_price, new_price):
+        """Moves a product to its new position in the price index"""
+        if self.price_index_deferred:
+            return
+        product_id = self.ids[product]
+        self.price_index.discard((old_price, product_id))
+        self.price_index.add((new_price, product_id))
+
+    def rebuild_price_index(self):
+        """Sorts the price index again from the current product prices,
+        faster than updating it for many price changes at once"""
+        self.price_index = PriceIndex((product.price, product_id)
+                                      for product_id, product
+                                      in self.products.items())
+
+    @contextmanager
+    def deferred_price_index(self):
+        """Context manager that stops maintaining the price index while
+        many products are added, and builds it with a single sort at the
+        end"""
+        self.price_index_deferred = True
+        try:
+            yield
+        finally:
+            self.price_index_deferred = False
+            self.rebuild_price_index()
+
+    def price_range(self, min_price, max_price) -> List:
+        """Returns all products with min_price <= price <= max_price,
+        ordered by price."""
+        return [self.products[product_id] for _, product_id
+                in self.price_index.irange((min_price, 0),
+                                           (max_price, self.next_id))]
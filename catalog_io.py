@@ -0,0 +1,162 @@
+import csv
+import json
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+from products import product_from_dict
+
+FIELDS = ["type", "name", "price", "quantity", "max_per_order", "active",
+          "promotion"]
+# Number of rows validated and added to the store together
+BATCH_SIZE = 1000
+# Only this many bad rows are kept in the report, the rest are counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    """Summary of a catalog import, with the bad rows that were skipped"""
+    def __init__(self):
+        """Initiate empty report"""
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row_number, message):
+        """Records a bad row, keeping at most MAX_REPORTED_ERRORS messages"""
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, message))
+
+
+def detect_format(path) -> str:
+    """Returns "csv" or "jsonl" according to the file extension"""
+    return "csv" if str(path).lower().endswith(".csv") else "jsonl"
+
+
+def read_rows(catalog_file, file_format) -> Iterator[tuple]:
+    """Yields (row number, row dict) from an open CSV or JSON lines file"""
+    if file_format == "csv":
+        for row_number, row in enumerate(csv.DictReader(catalog_file), 2):
+            yield row_number, row
+        return
+    for row_number, line in enumerate(catalog_file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            row = None
+        yield row_number, row
+
+
+def batched(rows: Iterable, size) -> Iterator[List]:
+    """Groups an iterable into lists of up to size items"""
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_int(value):
+    """Converts a CSV cell to int, leaving other values untouched"""
+    if isinstance(value, str):
+        return int(value) if value.strip() else None
+    return value
+
+
+def parse_active(value) -> bool:
+    """Converts an active cell to bool, missing values mean active"""
+    if value is None or value == "":
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+def row_to_product(row: dict, promotions: Dict):
+    """Creates a product from a catalog row.
+    Raises ValueError or TypeError if the row is invalid.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Row is not a JSON object")
+    promotion_name = row.get("promotion") or None
+    if promotion_name is not None and promotion_name not in promotions:
+        raise ValueError(f"Unknown promotion {promotion_name!r}")
+    try:
+        data = {"type": row.get("type") or "Product",
+                "name": row.get("name"),
+                "price": parse_int(row.get("price")),
+                "quantity": parse_int(row.get("quantity")),
+                "max_per_order": parse_int(row.get("max_per_order")),
+                "active": parse_active(row.get("active"))}
+        product = product_from_dict(data)
+    except KeyError as error:
+        raise ValueError(f"Missing field {error}") from error
+    if promotion_name is not None:
+        product.set_promotion(promotions[promotion_name])
+    return product
+
+
+def import_catalog(store_class, path, promotions=None, file_format=None,
+                   batch_size=BATCH_SIZE) -> ImportReport:
+    """Streams a CSV or JSON lines catalog file into a store.
+    Rows are validated and added in batches, so memory use doesn't depend
+    on the file size. Promotions are attached by name from the promotions
+    dictionary. Bad rows are skipped and reported, they don't stop
+    the import.
+    """
+    promotions = promotions or {}
+    file_format = file_format or detect_format(path)
+    report = ImportReport()
+    with open(path, newline="", encoding="utf-8") as catalog_file:
+        for batch in batched(read_rows(catalog_file, file_format),
+                             batch_size):
+            valid = []
+            for row_number, row in batch:
+                try:
+                    valid.append((row_number, row_to_product(row, promotions)))
+                except (ValueError, TypeError) as error:
+                    report.add_error(row_number,
+                                     str(error) or "Invalid field type")
+            for row_number, product in valid:
+                try:
+                    store_class.add_product(product)
+                except ValueError as error:
+                    report.add_error(row_number, str(error))
+                    continue
+                report.imported += 1
+    return report
+
+
+def product_to_row(product) -> dict:
+    """Returns a catalog row for a product"""
+    data = product.to_dict()
+    return {"type": data["type"],
+            "name": data["name"],
+            "price": data["price"],
+            "quantity": data["quantity"],
+            "max_per_order": data.get("max_per_order"),
+            "active": data["active"],
+            "promotion": product.promotion.name if product.promotion
+            else None}
+
+
+def export_catalog(store_class, path, file_format=None) -> int:
+    """Streams all products of a store to a CSV or JSON lines file.
+    Returns the number of exported products.
+    """
+    file_format = file_format or detect_format(path)
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as catalog_file:
+        if file_format == "csv":
+            writer = csv.DictWriter(catalog_file, fieldnames=FIELDS)
+            writer.writeheader()
+        for product in store_class.catalog:
+            row = product_to_row(product)
+            if file_format == "csv":
+                writer.writerow(row)
+            else:
+                catalog_file.write(json.dumps(row) + "\n")
+            count += 1
+    return count
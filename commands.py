@@ -0,0 +1,151 @@
+import json
+from typing import Iterable, List
+from batching import commit_orders
+
+# Request fields passed on to Store.search
+SEARCH_FIELDS = ("text", "prefix", "product_type", "promotion", "in_stock",
+                 "min_price", "max_price", "sort_by", "descending", "offset",
+                 "limit")
+# Maximum number of consecutive orders committed as one group, and of
+# responses written to the output at once
+BATCH_SIZE = 1000
+
+
+def describe_product(store_class, product) -> dict:
+    """Returns a JSON friendly description of a product"""
+    promotion = product.get_promotion()
+    return {"id": store_class.get_product_id(product),
+            "name": product.name,
+            "price": product.price,
+            "quantity": product.get_quantity(),
+            "promotion": promotion.name if promotion else None}
+
+
+def parse_items(store_class, items) -> List[tuple]:
+    """Converts request items to a shopping list of
+    (product, quantity) tuples. Items reference products by id or name.
+    Raises ValueError for unknown products and for quantities that
+    aren't non negative integers.
+    """
+    if not isinstance(items, list):
+        raise ValueError("Order items have to be a list")
+    shopping_list = []
+    for item in items:
+        reference = item.get("product")
+        if isinstance(reference, int):
+            product = store_class.get_product_by_id(reference)
+        else:
+            product = store_class.get_product(reference)
+        if product is None:
+            raise ValueError(f"Unknown product {reference!r}")
+        quantity = item.get("quantity")
+        if not isinstance(quantity, int) or isinstance(quantity, bool) \
+                or quantity < 0:
+            raise ValueError(f"Invalid quantity for {product.name}")
+        shopping_list.append((product, quantity))
+    return shopping_list
+
+
+def order_response(result) -> dict:
+    """Returns the response of a committed or rejected OrderResult"""
+    if not result.success:
+        return {"ok": False, "errors": result.errors}
+    return {"ok": True, "total": result.total}
+
+
+def handle_command(store_class, request) -> dict:
+    """Handles a list, total, search or quote request and returns its
+    response. Orders are committed in groups by run_commands instead."""
+    try:
+        action = request.get("action")
+        if action == "list":
+            return {"ok": True, "products": [
+                describe_product(store_class, product)
+                for product in store_class.get_all_products()]}
+        if action == "total":
+            return {"ok": True,
+                    "total_quantity": store_class.get_total_quantity()}
+        if action == "search":
+            result = store_class.search(**{field: request[field]
+                                           for field in SEARCH_FIELDS
+                                           if field in request})
+            return {"ok": True, "total": result.total, "products": [
+                describe_product(store_class, product)
+                for product in result.products]}
+        if action == "quote":
+            result = store_class.quote(parse_items(store_class,
+                                                   request.get("items")))
+            return {"ok": True, "total": result.total,
+                    "discount": result.discount}
+        raise ValueError(f"Unknown action {action!r}")
+    except (ValueError, TypeError, AttributeError) as error:
+        return {"ok": False, "errors": [str(error) or "Invalid request"]}
+
+
+def run_commands(store_class, lines: Iterable[str], output,
+                 batch_size=BATCH_SIZE) -> int:
+    """Executes JSON lines commands against a store, in order, and writes
+    one JSON response line per command to output.
+    Consecutive orders are committed together with commit_orders, up to
+    batch_size at a time, and responses are written to output in blocks
+    instead of line by line. A command that fails gets an error
+    response, the others are still executed. Returns the number of
+    commands executed.
+    """
+    responses = []
+    orders = []
+    count = 0
+
+    def commit():
+        try:
+            results = commit_orders(store_class, [shopping_list for _,
+                                                  shopping_list in orders])
+            for (index, _), result in zip(orders, results):
+                responses[index] = order_response(result)
+        except Exception:
+            # Commit the orders one by one, so only the bad ones fail
+            for index, shopping_list in orders:
+                try:
+                    responses[index] = order_response(
+                        commit_orders(store_class, [shopping_list])[0])
+                except Exception as error:
+                    responses[index] = {"ok": False, "errors": [
+                        str(error) or "Invalid request"]}
+        orders.clear()
+
+    def flush():
+        if orders:
+            commit()
+        output.write("".join(json.dumps(response) + "\n"
+                             for response in responses))
+        responses.clear()
+
+    for line in lines:
+        if not line.strip():
+            continue
+        count += 1
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError:
+            responses.append({"ok": False, "errors": ["Invalid JSON"]})
+        else:
+            if isinstance(request, dict) and request.get("action") == "order":
+                try:
+                    orders.append((len(responses),
+                                   parse_items(store_class,
+                                               request.get("items"))))
+                    responses.append(None)
+                except (ValueError, TypeError, AttributeError) as error:
+                    responses.append({"ok": False, "errors": [
+                        str(error) or "Invalid request"]})
+            else:
+                # Other commands have to see the orders before them
+                if orders:
+                    commit()
+                if not isinstance(request, dict):
+                    request = {}
+                responses.append(handle_command(store_class, request))
+        if len(responses) >= batch_size:
+            flush()
+    flush()
+    return count
@@ -0,0 +1,60 @@
+import pytest
+from products import Product, NonStockedProduct, LimitedProduct
+from store import Store
+
+# Test products by name, as (class, price, quantity, extra arguments).
+# Same as the default store of main.py.
+TEST_PRODUCTS = {
+    "MacBook Air M2": (Product, 1450, 100, {}),
+    "Bose QuietComfort Earbuds": (Product, 250, 500, {}),
+    "Google Pixel 7": (Product, 500, 250, {}),
+    "Windows License": (NonStockedProduct, 125, None, {}),
+    "Shipping": (LimitedProduct, 10, 250, {"maximum": 1}),
+}
+
+
+class FakeClock:
+    """Clock that returns the time set by the test"""
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def create_products(*names, quantities=None) -> list:
+    """Creates the named test products in order, all of them by default.
+    quantities maps product names to their stock, instead of the default
+    one."""
+    quantities = quantities or {}
+    product_list = []
+    for name in names or TEST_PRODUCTS:
+        product_type, price, quantity, extra = TEST_PRODUCTS[name]
+        if quantity is None:
+            product_list.append(product_type(name, price=price))
+        else:
+            product_list.append(product_type(
+                name, price=price, quantity=quantities.get(name, quantity),
+                **extra))
+    return product_list
+
+
+@pytest.fixture
+def make_products():
+    """Factory of test product lists, see create_products"""
+    return create_products
+
+
+@pytest.fixture
+def make_store():
+    """Factory of (store, product list) pairs over the test products"""
+    def make(*names, quantities=None):
+        product_list = create_products(*names, quantities=quantities)
+        return Store(product_list), product_list
+    return make
+
+
+@pytest.fixture
+def clock():
+    """Fake clock starting at 0"""
+    return FakeClock()
@@ -0,0 +1,222 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+# Inventory event kinds
+STOCK_CHANGED = "stock_changed"
+LOW_STOCK = "low_stock"
+RESTOCKED = "restocked"
+DEACTIVATED = "deactivated"
+REACTIVATED = "reactivated"
+PROMOTION_CHANGED = "promotion_changed"
+EVENT_KINDS = (STOCK_CHANGED, LOW_STOCK, RESTOCKED, DEACTIVATED, REACTIVATED,
+               PROMOTION_CHANGED)
+
+# Kinds that flip the same product state back and forth, their events
+# are coalesced with each other
+STATE_GROUPS = {LOW_STOCK: "stock_level", RESTOCKED: "stock_level",
+                DEACTIVATED: "active", REACTIVATED: "active"}
+
+# Stock at or below which a product is low, unless set per product
+DEFAULT_LOW_STOCK = 10
+# Events a subscription holds before dropping the oldest ones
+SUBSCRIPTION_SIZE = 10000
+
+
+class InventoryEvent:
+    """Change of a store product. Bursts of events of the same product
+    state are coalesced into one, keeping the first old value and the
+    last kind and new value, and count tells how many events were
+    merged."""
+    __slots__ = ("kind", "product", "product_id", "old_value", "new_value",
+                 "count", "time")
+
+    def __init__(self, kind, product, product_id, old_value, new_value):
+        """Initiate event"""
+        self.kind = kind
+        self.product = product
+        self.product_id = product_id
+        self.old_value = old_value
+        self.new_value = new_value
+        self.count = 1
+        self.time = time.time()
+
+    def to_dict(self) -> dict:
+        """Returns a JSON friendly representation of the event"""
+        old_value, new_value = self.old_value, self.new_value
+        if self.kind == PROMOTION_CHANGED:
+            old_value = old_value.name if old_value else None
+            new_value = new_value.name if new_value else None
+        return {"kind": self.kind, "id": self.product_id,
+                "name": self.product.name, "old": old_value,
+                "new": new_value, "count": self.count, "time": self.time}
+
+
+class Subscription:
+    """Bounded queue of inventory events for one consumer.
+    Publishing never blocks: a pending event of the same product state is
+    coalesced with the new one and moved to the tail of the queue, or
+    dropped when the state flipped back to where it was. When the queue
+    is full the oldest event is dropped and counted. Events can be
+    consumed from threads with get, or from asyncio with get_async.
+    """
+    def __init__(self, kinds=None, max_size=SUBSCRIPTION_SIZE):
+        """Initiate empty subscription to the given kinds, or all kinds"""
+        self.kinds = frozenset(kinds or EVENT_KINDS)
+        self.max_size = max_size
+        self.pending = OrderedDict()
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.waiters = []
+
+    def __len__(self):
+        return len(self.pending)
+
+    def publish(self, event):
+        """Queues an event, coalescing it with a pending one of the same
+        product state"""
+        if event.kind not in self.kinds:
+            return
+        key = (STATE_GROUPS.get(event.kind, event.kind), event.product_id)
+        with self.condition:
+            pending = self.pending.pop(key, None)
+            if pending is not None:
+                # The state is back to what it was before the pending event
+                if pending.kind != event.kind \
+                        or pending.old_value == event.new_value:
+                    return
+                pending.new_value = event.new_value
+                pending.count += event.count
+                pending.time = event.time
+            else:
+                if len(self.pending) >= self.max_size:
+                    self.pending.popitem(last=False)
+                    self.dropped += 1
+                pending = InventoryEvent(
+                    event.kind, event.product, event.product_id,
+                    event.old_value, event.new_value)
+            self.pending[key] = pending
+            self.condition.notify()
+            waiters, self.waiters = self.waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(self._wake, future)
+
+    @staticmethod
+    def _wake(future):
+        """Resolves the future of an asyncio consumer"""
+        if not future.done():
+            future.set_result(None)
+
+    def poll(self):
+        """Returns the oldest pending event, or None without waiting"""
+        with self.condition:
+            if not self.pending:
+                return None
+            return self.pending.popitem(last=False)[1]
+
+    def drain(self) -> List[InventoryEvent]:
+        """Returns and removes all pending events, oldest first"""
+        with self.condition:
+            events = list(self.pending.values())
+            self.pending.clear()
+        return events
+
+    def get(self, timeout=None):
+        """Waits for the oldest pending event and returns it.
+        Returns None if timeout seconds pass without events."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.pending, timeout):
+                return None
+            return self.pending.popitem(last=False)[1]
+
+    async def get_async(self):
+        """Waits without blocking the event loop for the oldest pending
+        event and returns it"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                if self.pending:
+                    return self.pending.popitem(last=False)[1]
+                future = loop.create_future()
+                self.waiters.append((loop, future))
+            await future
+
+
+class InventoryEvents:
+    """Store listener that turns product changes into inventory events
+    and publishes them to subscriptions.
+    Low stock and restocked events are sent when a product's stock
+    crosses its low stock threshold downwards or upwards.
+    """
+    def __init__(self, store_class, low_stock=DEFAULT_LOW_STOCK):
+        """Initiate stream and start listening to the store changes"""
+        self.store = store_class
+        self.low_stock = low_stock
+        self.thresholds: Dict[int, int] = {}
+        self.subscriptions: List[Subscription] = []
+        store_class.add_listener(self)
+
+    def close(self):
+        """Stops listening to the store"""
+        self.store.remove_listener(self)
+
+    def subscribe(self, kinds=None, max_size=SUBSCRIPTION_SIZE) \
+            -> Subscription:
+        """Returns a new subscription to the given event kinds,
+        all kinds by default"""
+        subscription = Subscription(kinds, max_size)
+        self.subscriptions = [*self.subscriptions, subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stops publishing events to a subscription"""
+        self.subscriptions = [existing for existing in self.subscriptions
+                              if existing is not subscription]
+
+    def set_threshold(self, product, threshold):
+        """Sets the low stock threshold of a product"""
+        self.thresholds[self.store.get_product_id(product)] = threshold
+
+    def get_threshold(self, product) -> int:
+        """Returns the low stock threshold of a product"""
+        return self.thresholds.get(self.store.get_product_id(product),
+                                   self.low_stock)
+
+    def product_added(self, product, product_id):
+        pass
+
+    def product_removed(self, product, product_id):
+        self.thresholds.pop(product_id, None)
+
+    def product_changed(self, product, field, old_value, new_value):
+        if not self.subscriptions:
+            return
+        try:
+            product_id = self.store.get_product_id(product)
+        except KeyError:
+            return
+        if field == "quantity":
+            self.emit(STOCK_CHANGED, product, product_id, old_value,
+                      new_value)
+            threshold = self.thresholds.get(product_id, self.low_stock)
+            if old_value > threshold >= new_value:
+                self.emit(LOW_STOCK, product, product_id, old_value,
+                          new_value)
+            elif old_value <= threshold < new_value:
+                self.emit(RESTOCKED, product, product_id, old_value,
+                          new_value)
+        elif field == "active":
+            self.emit(REACTIVATED if new_value else DEACTIVATED, product,
+                      product_id, old_value, new_value)
+        elif field == "promotion":
+            self.emit(PROMOTION_CHANGED, product, product_id, old_value,
+                      new_value)
+
+    def emit(self, kind, product, product_id, old_value, new_value):
+        """Publishes an event to every subscription"""
+        event = InventoryEvent(kind, product, product_id, old_value,
+                               new_value)
+        for subscription in self.subscriptions:
+            subscription.publish(event)
@@ -0,0 +1,416 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+from typing import Dict, List
+from binary_catalog import BINARY_MAGIC, BinaryCatalogSource
+from catalog_io import row_to_product
+from search import SearchResult, scan_products
+from store import Store
+
+# Index file header: magic, format version, indexed rows, total quantity,
+# active rows, size and modification time of the indexed catalog file.
+# The index is a local cache, so it uses the native byte order.
+INDEX_HEADER = struct.Struct("=8sqqqqqq")
+INDEX_MAGIC = b"BBCATIDX"
+INDEX_VERSION = 1
+# Number of unmodified products kept in memory
+CACHE_SIZE = 10000
+
+
+def index_path(path) -> str:
+    """Returns the path of the index file of a JSON lines catalog"""
+    return f"{path}.idx"
+
+
+def build_index(path):
+    """Writes the index file of a JSON lines catalog, as written by
+    catalog_io.export_catalog. It holds the start and end offset of every
+    valid row, the rows ordered by name, and the catalog totals.
+    Rows that aren't JSON objects with a name are left out.
+    """
+    starts, ends = array("q"), array("q")
+    names = []
+    total_quantity = active_count = 0
+    with open(path, "rb") as catalog_file:
+        offset = 0
+        for line in catalog_file:
+            start, offset = offset, offset + len(line)
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(row, dict) or not isinstance(row.get("name"),
+                                                           str):
+                continue
+            starts.append(start)
+            ends.append(offset)
+            names.append(row["name"])
+            if row.get("active", True) is not False:
+                active_count += 1
+            total_quantity += row.get("quantity") or 0
+    by_name = array("q", sorted(range(len(names)), key=names.__getitem__))
+    stat = os.stat(path)
+    with open(index_path(path), "wb") as index_file:
+        index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION,
+                                           len(names), total_quantity,
+                                           active_count, stat.st_size,
+                                           stat.st_mtime_ns))
+        for values in (starts, ends, by_name):
+            values.tofile(index_file)
+
+
+def read_index(path) -> tuple:
+    """Returns the header and the (starts, ends, by name) arrays of the
+    index of a catalog, building the index if it is missing or stale.
+    The arrays are zero copy views of the memory mapped index."""
+    stat = os.stat(path)
+    for attempt in range(2):
+        try:
+            with open(index_path(path), "rb") as index_file:
+                index_map = mmap.mmap(index_file.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            index_map = None
+        if index_map is not None and len(index_map) >= INDEX_HEADER.size:
+            header = INDEX_HEADER.unpack_from(index_map)
+            magic, version, count, *_, size, mtime = header
+            if (magic, version, size, mtime) == \
+                    (INDEX_MAGIC, INDEX_VERSION, stat.st_size,
+                     stat.st_mtime_ns):
+                body = memoryview(index_map)[INDEX_HEADER.size:].cast("q")
+                return (header, body[:count], body[count:2 * count],
+                        body[2 * count:3 * count])
+        if attempt == 0:
+            build_index(path)
+    raise ValueError(f"Can't build an index for {path}")
+
+
+class JsonLinesSource:
+    """Rows of a memory mapped JSON lines catalog file, read through its
+    index. Row n has the product id n + 1."""
+    def __init__(self, path, promotions=None):
+        """Initiate source over a JSON lines catalog file"""
+        self.promotions = promotions or {}
+        header, self.starts, self.ends, self.by_name = read_index(path)
+        self.size = header[2]
+        self.max_id = self.size
+        self.total_quantity = header[3]
+        self.active_count = header[4]
+        with open(path, "rb") as catalog_file:
+            self.data = mmap.mmap(catalog_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ) \
+                if header[5] else b""
+
+    def read_row(self, index) -> dict:
+        """Returns the row with the given index as a dict"""
+        return json.loads(self.data[self.starts[index]:self.ends[index]])
+
+    def index_of(self, product_id):
+        """Returns the row index of a product id, or None"""
+        return product_id - 1 if 1 <= product_id <= self.size else None
+
+    def id_of(self, index) -> int:
+        """Returns the product id of a row"""
+        return index + 1
+
+    def name_at(self, position) -> tuple:
+        """Returns the name and row index of the position-th row in name
+        order"""
+        index = self.by_name[position]
+        return self.read_row(index)["name"], index
+
+    def load(self, index):
+        """Creates the product of a row"""
+        return row_to_product(self.read_row(index), self.promotions)
+
+    def close(self):
+        """Unmaps the catalog file"""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+def open_source(path, promotions=None):
+    """Opens a binary catalog, or else a JSON lines catalog.
+    Binary catalogs have their own promotions."""
+    with open(path, "rb") as catalog_file:
+        magic = catalog_file.read(len(BINARY_MAGIC))
+    if magic == BINARY_MAGIC:
+        return BinaryCatalogSource(path)
+    return JsonLinesSource(path, promotions)
+
+
+class LazyCatalog:
+    """Catalog backed by a memory mapped catalog source.
+    Products are created from their row on first access and stay in
+    memory while used: the most recently used ones are kept in an LRU
+    cache, and changed products are pinned so their changes are never
+    lost. Opening is O(1), a JSON lines file index is only built once
+    per catalog file version.
+    """
+    def __init__(self, source, cache_size=CACHE_SIZE, on_load=None):
+        """Initiate catalog over a catalog source"""
+        self.source = source
+        self.cache_size = cache_size
+        self.on_load = on_load
+        self.total_quantity = source.total_quantity
+        self.active_count = source.active_count
+        self.next_id = source.max_id + 1
+        self.lock = threading.RLock()
+        self.loaded = weakref.WeakValueDictionary()
+        self.ids = weakref.WeakKeyDictionary()
+        self.resident = OrderedDict()
+        self.pinned: Dict[int, object] = {}
+        self.added: Dict[int, object] = {}
+        self.added_names: Dict[str, int] = {}
+        self.removed = set()
+
+    def __len__(self):
+        return self.source.size + len(self.added) - len(self.removed)
+
+    def __iter__(self):
+        """Iterates the products in id order, loading them as needed"""
+        for product_id in self.iter_ids():
+            product = self.get_by_id(product_id)
+            if product is not None:
+                yield product
+
+    def __contains__(self, product_id):
+        return self.get_by_id(product_id) is not None
+
+    def __getitem__(self, product_id):
+        product = self.get_by_id(product_id)
+        if product is None:
+            raise KeyError(product_id)
+        return product
+
+    def iter_ids(self, after_id=0):
+        """Iterates the ids greater than after_id of the file products and
+        then of the added ones, removed ids included. File rows are in id
+        order, so the first one is found by binary search."""
+        low, high = 0, self.source.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.source.id_of(middle) <= after_id:
+                low = middle + 1
+            else:
+                high = middle
+        for index in range(low, self.source.size):
+            yield self.source.id_of(index)
+        yield from sorted(product_id for product_id in self.added
+                          if product_id > after_id)
+
+    def get_by_id(self, product_id):
+        """Returns the product with the given id, or None"""
+        with self.lock:
+            if product_id in self.removed:
+                return None
+            if product_id in self.added:
+                return self.added[product_id]
+            product = self.loaded.get(product_id)
+            if product is None:
+                index = self.source.index_of(product_id)
+                if index is None:
+                    return None
+                product = self.source.load(index)
+                self.loaded[product_id] = product
+                self.ids[product] = product_id
+                if self.on_load:
+                    self.on_load(product)
+            if product_id not in self.pinned:
+                self.resident[product_id] = product
+                self.resident.move_to_end(product_id)
+                while len(self.resident) > self.cache_size:
+                    self.resident.popitem(last=False)
+            return product
+
+    def get_by_name(self, name):
+        """Returns the product with the given name, or None.
+        Names are found by binary search over the name ordered rows."""
+        if name in self.added_names:
+            return self.added[self.added_names[name]]
+        low, high = 0, self.source.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.source.name_at(middle)[0] < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.source.size:
+            found, index = self.source.name_at(low)
+            if found == name:
+                return self.get_by_id(self.source.id_of(index))
+        return None
+
+    def get_id(self, product) -> int:
+        """Returns the stable id of a product"""
+        return self.ids[product]
+
+    def pin(self, product):
+        """Keeps a changed product in memory for good"""
+        with self.lock:
+            product_id = self.ids.get(product)
+            if product_id is not None and product_id not in self.added:
+                self.pinned[product_id] = product
+                self.resident.pop(product_id, None)
+
+    def add(self, product, product_id=None) -> int:
+        """Adds a product, kept in memory, and returns its stable id.
+        Raises ValueError if the product, its name or id is already in use.
+        """
+        with self.lock:
+            if product in self.ids:
+                raise ValueError(f"{product.name} is already in the catalog")
+            if self.get_by_name(product.name) is not None:
+                raise ValueError(f"Product named {product.name} "
+                                 f"already exists")
+            if product_id is None:
+                product_id = self.next_id
+            elif self.get_by_id(product_id) is not None:
+                raise ValueError(f"Product id {product_id} is already "
+                                 f"in use")
+            self.next_id = max(self.next_id, product_id + 1)
+            self.removed.discard(product_id)
+            self.added[product_id] = product
+            self.added_names[product.name] = product_id
+            self.ids[product] = product_id
+            return product_id
+
+    def remove(self, product) -> int:
+        """Removes a product and returns its id.
+        Raises ValueError if the product is not in the catalog.
+        """
+        with self.lock:
+            product_id = self.ids.pop(product, None)
+            if product_id is None or product_id in self.removed:
+                raise ValueError(f"{product.name} is not in the catalog")
+            if self.added.pop(product_id, None) is not None:
+                del self.added_names[product.name]
+            else:
+                self.removed.add(product_id)
+                self.pinned.pop(product_id, None)
+                self.resident.pop(product_id, None)
+            return product_id
+
+    def update_price(self, product, old_price, new_price):
+        """Nothing to do, the lazy catalog has no price index"""
+
+    def price_range(self, min_price, max_price) -> List:
+        """Returns all products with min_price <= price <= max_price,
+        ordered by price. Scans the whole catalog."""
+        return sorted((product for product in self
+                       if min_price <= product.price <= max_price),
+                      key=lambda product: product.price)
+
+    def page(self, after_id, limit, active_only=True) -> List[tuple]:
+        """Returns up to limit (id, product) pairs in id order, with ids
+        greater than after_id, the last id of the previous page. Only the
+        rows of the page are loaded, plus the inactive ones between them
+        when active_only filters them."""
+        page = []
+        for product_id in self.iter_ids(after_id):
+            product = self.get_by_id(product_id)
+            if product is None or active_only and not product.active:
+                continue
+            page.append((product_id, product))
+            if len(page) == limit:
+                break
+        return page
+
+    def close(self):
+        """Closes the catalog source"""
+        self.source.close()
+
+
+class LazyStore(Store):
+    """Store over a LazyCatalog of a binary or JSON lines catalog file.
+    Startup doesn't depend on the catalog size: totals come from the
+    file header or index and products are loaded on first access.
+    Queries over all products, like get_all_products and search, stream
+    through the whole file. Snapshots are not supported.
+    """
+    def __init__(self, path, promotions=None, cache_size=CACHE_SIZE):
+        """Initiate store over a catalog file. Promotions are looked up
+        by name for JSON lines catalogs."""
+        super().__init__([])
+        self.catalog = LazyCatalog(open_source(path, promotions), cache_size,
+                                   on_load=self._product_loaded)
+        self.total_quantity = self.catalog.total_quantity
+        self.active_count = self.catalog.active_count
+
+    def _product_loaded(self, product):
+        """Starts observing a product loaded from the catalog file"""
+        product.add_observer(self)
+
+    def close(self):
+        """Closes the catalog file"""
+        self.catalog.close()
+
+    def add_product(self, product, product_id=None) -> int:
+        """Adds a product to store and returns its id"""
+        with self.aggregate_lock:
+            product_id = self.catalog.add(product, product_id)
+            self.total_quantity += product.get_quantity()
+            self.active_count += product.is_active()
+        product.add_observer(self)
+        for listener in self.listeners:
+            listener.product_added(product, product_id)
+        return product_id
+
+    def remove_product(self, product):
+        """Removes a product from store"""
+        with self.aggregate_lock:
+            product_id = self.catalog.remove(product)
+            product.remove_observer(self)
+            self.total_quantity -= product.get_quantity()
+            self.active_count -= product.is_active()
+        for listener in self.listeners:
+            listener.product_removed(product, product_id)
+
+    def product_changed(self, product, field, old_value, new_value):
+        """Observer callback, pins the changed product in memory and keeps
+        the store totals in sync"""
+        self.catalog.pin(product)
+        with self.aggregate_lock:
+            if field == "quantity":
+                self.total_quantity += new_value - old_value
+            elif field == "active":
+                self.active_count += 1 if new_value else -1
+        for listener in self.listeners:
+            listener.product_changed(product, field, old_value, new_value)
+
+    def get_products_page(self, after_id, limit) -> List[tuple]:
+        """Returns up to limit (id, product) pairs of active products in
+        id order, with ids greater than after_id"""
+        return self.catalog.page(after_id, limit)
+
+    def enable_snapshots(self):
+        """Not supported, a snapshot would load and keep every product of
+        the catalog file. Raises TypeError."""
+        raise TypeError("A LazyStore can't publish catalog snapshots")
+
+    def search(self, **query) -> SearchResult:
+        """Returns a page of the products matching a query, like
+        Store.search. Builds no index, which would load and keep every
+        product: the catalog is scanned through the LRU cache instead,
+        keeping only the ids of the matches."""
+        return scan_products(self, **query)
+
+    def get_all_products(self) -> List:
+        """Returns all products in the store that are active."""
+        return [product for product in self.catalog if product.active]
+
+    def get_active_count(self) -> int:
+        """Returns how many products in the store are active."""
+        return self.active_count
+
+    def get_products_in_price_range(self, min_price, max_price) -> List:
+        """Returns active products priced between min_price and max_price,
+        ordered by price."""
+        return [product
+                for product in self.catalog.price_range(min_price, max_price)
+                if product.active]
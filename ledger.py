@@ -0,0 +1,302 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from typing import Dict, Iterator
+from money import to_dollars
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Number of order lines per ledger chunk
+CHUNK_SIZE = 4096
+# Below this many rows, summing with plain Python is faster than NumPy setup
+NUMPY_MIN_ROWS = 256
+# Promotion column value of lines bought without a promotion
+NO_PROMOTION = -1
+# Integer columns of a chunk, times are kept apart as doubles
+COLUMNS = ("product_ids", "quantities", "list_cents", "cents",
+           "promotions")
+
+LedgerEntry = namedtuple("LedgerEntry", [
+    "time", "product_id", "quantity", "list_cents", "cents", "promotion"])
+
+
+class SalesTotals(namedtuple("SalesTotals", [
+        "lines", "quantity", "list_cents", "cents"])):
+    """Sums of a set of ledger lines, prices in integer cents"""
+    __slots__ = ()
+
+    @property
+    def discount_cents(self) -> int:
+        """Amount saved by promotions, in cents"""
+        return self.list_cents - self.cents
+
+    @property
+    def revenue(self) -> float:
+        """Amount paid, in dollars"""
+        return to_dollars(self.cents)
+
+    @property
+    def discount(self) -> float:
+        """Amount saved by promotions, in dollars"""
+        return to_dollars(self.discount_cents)
+
+    def __add__(self, other):
+        return SalesTotals(*(mine + theirs
+                             for mine, theirs in zip(self, other)))
+
+
+NO_SALES = SalesTotals(0, 0, 0, 0)
+
+
+class LedgerChunk:
+    """Up to CHUNK_SIZE ledger lines in typed columns.
+    Lines are appended in time order, so each chunk covers a time range
+    and can be searched by time with bisect. Once sealed, when the
+    ledger moves on to a new chunk, a chunk never changes.
+    """
+    def __init__(self):
+        """Initiate empty columns"""
+        self.sealed = False
+        self.times = array("d")
+        self.product_ids = array("q")
+        self.quantities = array("q")
+        self.list_cents = array("q")
+        self.cents = array("q")
+        self.promotions = array("q")
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, line_time, values):
+        """Appends a line, values are in COLUMNS order"""
+        self.times.append(line_time)
+        for column, value in zip(COLUMNS, values):
+            getattr(self, column).append(value)
+
+    def window(self, start, end) -> tuple:
+        """Returns the row range of the lines with start <= time < end,
+        None meaning unbounded"""
+        low = 0 if start is None else bisect_left(self.times, start)
+        high = len(self.times) if end is None else \
+            bisect_left(self.times, end)
+        return low, max(low, high)
+
+    def sum_rows(self, low, high, product_id=None, promotion=None) \
+            -> SalesTotals:
+        """Returns the totals of the rows low to high, optionally only of
+        one product id or promotion index.
+        Sealed chunks are summed with NumPy when it is installed."""
+        if numpy is not None and self.sealed \
+                and high - low >= NUMPY_MIN_ROWS:
+            return self._sum_numpy(low, high, product_id, promotion)
+        if product_id is None and promotion is None:
+            return SalesTotals(high - low, sum(self.quantities[low:high]),
+                               sum(self.list_cents[low:high]),
+                               sum(self.cents[low:high]))
+        rows = [row for row in range(low, high)
+                if (product_id is None or self.product_ids[row] == product_id)
+                and (promotion is None or self.promotions[row] == promotion)]
+        return SalesTotals(len(rows),
+                           sum(self.quantities[row] for row in rows),
+                           sum(self.list_cents[row] for row in rows),
+                           sum(self.cents[row] for row in rows))
+
+    def sum_by_product(self, low, high) -> Dict[int, SalesTotals]:
+        """Returns the totals of the rows low to high per product id.
+        Sealed chunks are grouped with NumPy when it is installed."""
+        if numpy is not None and self.sealed \
+                and high - low >= NUMPY_MIN_ROWS:
+            return self._sum_by_product_numpy(low, high)
+        sums = {}
+        for product_id, quantity, list_cents, cents in zip(
+                self.product_ids[low:high], self.quantities[low:high],
+                self.list_cents[low:high], self.cents[low:high]):
+            totals = sums.get(product_id)
+            if totals is None:
+                sums[product_id] = [1, quantity, list_cents, cents]
+            else:
+                totals[0] += 1
+                totals[1] += quantity
+                totals[2] += list_cents
+                totals[3] += cents
+        return {product_id: SalesTotals(*totals)
+                for product_id, totals in sums.items()}
+
+    def _sum_by_product_numpy(self, low, high) -> Dict[int, SalesTotals]:
+        """NumPy version of sum_by_product, sorts the rows by product id
+        and sums each run of equal ids"""
+        columns = self._numpy_columns(low, high)
+        order = numpy.argsort(columns["product_ids"], kind="stable")
+        product_ids = columns["product_ids"][order]
+        starts = numpy.flatnonzero(numpy.concatenate(
+            ([True], product_ids[1:] != product_ids[:-1])))
+        lines = numpy.diff(numpy.append(starts, len(product_ids)))
+        sums = [numpy.add.reduceat(columns[column][order], starts)
+                for column in ("quantities", "list_cents", "cents")]
+        return {product_id: SalesTotals(*totals)
+                for product_id, *totals in zip(
+                    product_ids[starts].tolist(), lines.tolist(),
+                    *(column_sums.tolist() for column_sums in sums))}
+
+    def _numpy_columns(self, low, high) -> dict:
+        """Returns NumPy views of the rows low to high of the integer
+        columns"""
+        return {column: numpy.frombuffer(getattr(self, column),
+                                         dtype=numpy.int64)[low:high]
+                for column in COLUMNS}
+
+    def _sum_numpy(self, low, high, product_id, promotion) -> SalesTotals:
+        """NumPy version of sum_rows"""
+        columns = self._numpy_columns(low, high)
+        mask = numpy.ones(high - low, dtype=bool)
+        if product_id is not None:
+            mask &= columns["product_ids"] == product_id
+        if promotion is not None:
+            mask &= columns["promotions"] == promotion
+        return SalesTotals(int(mask.sum()),
+                           int(columns["quantities"][mask].sum()),
+                           int(columns["list_cents"][mask].sum()),
+                           int(columns["cents"][mask].sum()))
+
+
+class OrderLedger:
+    """Append only history of the order lines committed by a store.
+    Each line keeps the time, product id, quantity, list price, paid
+    price and promotion in compact columnar chunks. Running totals per
+    product and per promotion are updated on every append, so they are
+    O(1) reads, and time window queries only look at the chunks covering
+    the window.
+    """
+    def __init__(self, store_class, chunk_size=CHUNK_SIZE,
+                 clock=time.time):
+        """Initiate empty ledger"""
+        self.store = store_class
+        self.chunk_size = chunk_size
+        self.clock = clock
+        self.chunks = [LedgerChunk()]
+        self.last_time = float("-inf")
+        self.promotion_names = []
+        self.promotion_index: Dict[str, int] = {}
+        self.by_product: Dict[int, SalesTotals] = {}
+        self.by_promotion: Dict[int, SalesTotals] = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def record(self, lines):
+        """Appends committed order lines, as SaleLine tuples of
+        pricing.price_sale_lines, so the recorded prices and promotions
+        are the ones the order was priced with. Lines of products that are
+        no longer in the store are skipped."""
+        with self.lock:
+            # Times never go backwards, so chunks stay sorted by time
+            line_time = self.last_time = max(self.clock(), self.last_time)
+            for product, quantity, list_cents, cents, promotion in lines:
+                try:
+                    product_id = self.store.get_product_id(product)
+                except KeyError:
+                    continue
+                promotion = NO_PROMOTION if promotion is None else \
+                    self._promotion_index(promotion.name)
+                chunk = self.chunks[-1]
+                if len(chunk) >= self.chunk_size:
+                    chunk.sealed = True
+                    chunk = LedgerChunk()
+                    self.chunks.append(chunk)
+                chunk.append(line_time, (product_id, quantity, list_cents,
+                                         cents, promotion))
+                line = SalesTotals(1, quantity, list_cents, cents)
+                self.by_product[product_id] = \
+                    self.by_product.get(product_id, NO_SALES) + line
+                if promotion != NO_PROMOTION:
+                    self.by_promotion[promotion] = \
+                        self.by_promotion.get(promotion, NO_SALES) + line
+
+    def _promotion_index(self, name) -> int:
+        """Returns the column value of a promotion name, the ledger lock
+        must be held"""
+        index = self.promotion_index.get(name)
+        if index is None:
+            index = self.promotion_index[name] = len(self.promotion_names)
+            self.promotion_names.append(name)
+        return index
+
+    def product_totals(self, product) -> SalesTotals:
+        """Returns the running totals of a store product"""
+        product_id = self.store.get_product_id(product)
+        with self.lock:
+            return self.by_product.get(product_id, NO_SALES)
+
+    def promotion_totals(self, name) -> SalesTotals:
+        """Returns the running totals of the lines bought with a promotion,
+        by promotion name"""
+        with self.lock:
+            return self.by_promotion.get(self.promotion_index.get(name),
+                                         NO_SALES)
+
+    def totals(self, start=None, end=None, product=None, promotion=None) \
+            -> SalesTotals:
+        """Returns the totals of the lines recorded with
+        start <= time < end, None meaning unbounded, optionally only of a
+        store product or a promotion name"""
+        product_id = None if product is None else \
+            self.store.get_product_id(product)
+        with self.lock:
+            promotion_index = None
+            if promotion is not None:
+                promotion_index = self.promotion_index.get(promotion)
+                if promotion_index is None:
+                    return NO_SALES
+            totals = NO_SALES
+            for chunk, low, high in self._windows(start, end):
+                totals += chunk.sum_rows(low, high, product_id,
+                                         promotion_index)
+            return totals
+
+    def sales_by_product(self, start=None, end=None) \
+            -> Dict[int, SalesTotals]:
+        """Returns the totals of the lines recorded with
+        start <= time < end per product id. Every chunk in the window is
+        grouped on its columns, then the chunk results are merged."""
+        sales = {}
+        with self.lock:
+            for chunk, low, high in self._windows(start, end):
+                for product_id, totals in \
+                        chunk.sum_by_product(low, high).items():
+                    sales[product_id] = sales.get(product_id, NO_SALES) \
+                        + totals
+        return sales
+
+    def entries(self, start=None, end=None) -> Iterator[LedgerEntry]:
+        """Yields the lines recorded with start <= time < end, oldest
+        first"""
+        with self.lock:
+            windows = [(chunk, low, min(high, len(chunk)))
+                       for chunk, low, high in self._windows(start, end)]
+            names = list(self.promotion_names)
+        for chunk, low, high in windows:
+            for row in range(low, high):
+                promotion = chunk.promotions[row]
+                yield LedgerEntry(chunk.times[row], chunk.product_ids[row],
+                                  chunk.quantities[row],
+                                  chunk.list_cents[row], chunk.cents[row],
+                                  None if promotion == NO_PROMOTION
+                                  else names[promotion])
+
+    def _windows(self, start, end) -> Iterator[tuple]:
+        """Yields (chunk, low row, high row) of the chunks with lines in
+        the time window. The ledger lock must be held."""
+        for chunk in self.chunks:
+            if not chunk or start is not None and chunk.times[-1] < start:
+                continue
+            if end is not None and chunk.times[0] >= end:
+                break
+            low, high = chunk.window(start, end)
+            if low < high:
+                yield chunk, low, high
@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from service import StoreService
+from main import create_default_store
+
+
+def percentile(sorted_values, percent):
+    """Returns the given percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = round(percent / 100 * (len(sorted_values) - 1))
+    return sorted_values[index]
+
+
+async def run_client(host, port, requests_count, latencies, seed):
+    """Sends requests_count random list/quote/order requests over
+    one connection, appending each round trip latency to latencies."""
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(requests_count):
+        action = rng.choice(["list", "quote", "order", "order"])
+        request = {"action": action}
+        if action != "list":
+            request["items"] = [{"product": rng.randint(1, 5),
+                                 "quantity": 1}]
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        await reader.readline()
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_load_test(clients, requests_per_client, host=None, port=None):
+    """Runs concurrent clients against a store service and returns a report.
+    If no host is given, a service for the default store is started
+    in-process on a free port.
+    """
+    server = None
+    if host is None:
+        server = await StoreService(create_default_store()).start(port=0)
+        host, port = server.sockets[0].getsockname()[:2]
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(host, port, requests_per_client,
+                                      latencies, seed)
+                           for seed in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+
+    latencies.sort()
+    return {"requests": len(latencies),
+            "seconds": round(elapsed, 3),
+            "throughput": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3)}
+
+
+def main():
+    """Run a load test and print throughput and latency percentiles"""
+    parser = argparse.ArgumentParser(description="Store service load test")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200,
+                        help="requests per client")
+    parser.add_argument("--host", help="target an already running service")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args.clients, args.requests,
+                                       args.host, args.port))
+    print(f"{report['requests']} requests in {report['seconds']}s, "
+          f"{report['throughput']} req/s, "
+          f"p50 {report['p50_ms']}ms, p99 {report['p99_ms']}ms")
+
+
+if __name__ == '__main__':
+    main()
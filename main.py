@@ -1,23 +1,39 @@
+import argparse
+import sys
 import products
 import store
 import promotions
+from commands import run_commands
+from lazy_catalog import LazyStore
+from persistence import StorePersistence
+
+# Size of the stdout buffer used by the batch mode
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+# Number of products listed before asking whether to show more
+LIST_PAGE_SIZE = 50
 
 
 def list_all_products_in_store(store_class):
-    """Print all products in store with their name, price and quantity,
-    Returns dictionary with number key and product object as value.
+    """Print all products in store with their id, name, price and quantity,
+    a page at a time, so large catalogs aren't loaded all at once.
+    Returns the store catalog, which maps product ids to product objects.
     """
     print("------")
-    products_dict = {}
-    active_products = store_class.get_all_products()
-    if active_products:
-        for i, product in enumerate(active_products, 1):
-            print(f"{i}. {product.show()}")
-            products_dict[i] = product
-    else:
+    last_id = 0
+    while True:
+        page = store_class.get_products_page(last_id, LIST_PAGE_SIZE)
+        for product_id, product in page:
+            print(f"{product_id}. {product.show()}")
+        if page:
+            last_id = page[-1][0]
+        if len(page) < LIST_PAGE_SIZE or \
+                input("Press enter to show more products, "
+                      "any other key to stop: "):
+            break
+    if not last_id:
         print("No more products in store. ")
     print("------")
-    return products_dict
+    return store_class.catalog
 
 
 def show_total_amount_in_store(store_class):
@@ -26,13 +42,25 @@ def show_total_amount_in_store(store_class):
     print(f"Total of {total_quantity} items in store")
 
 
+def search_products(store_class):
+    """Searches active products by name, and prints the first page of
+    matches ordered by name"""
+    text = input("Search for: ")
+    result = store_class.search(text=text, sort_by="name")
+    print("------")
+    for product in result.products:
+        print(f"{store_class.get_product_id(product)}. {product.show()}")
+    print(f"Found {result.total} products")
+    print("------")
+
+
 def make_an_order(store_class):
     """Makes an order, takes user inputs and calls the store class
     order method with the user shopping list.
     Buys each item in shopping list and returns final total order price.
     """
     products_dict = list_all_products_in_store(store_class)
-    if not products_dict:
+    if not store_class.get_active_count():
         print("Sorry, we have no products in stock. Action unavailable.")
         return
     order_list = []
@@ -62,7 +90,8 @@ def get_order_item(products_dict) -> tuple:
     prod_num = input("Which product # do you want? ")
     if prod_num == "":
         return "", ""
-    if prod_num.isnumeric() and int(prod_num) in products_dict:
+    if prod_num.isnumeric() and int(prod_num) in products_dict \
+            and products_dict[int(prod_num)].is_active():
         quantity = input("What amount do you want? ")
         if quantity == "":
             return "", ""
@@ -99,15 +128,16 @@ def get_action_num(func_list):
         print("Wrong input, try again")
 
 
-def main():
-    """Initiate main function"""
-    functions_list = {
-        1: list_all_products_in_store,
-        2: show_total_amount_in_store,
-        3: make_an_order,
-        4: quit_program
-    }
+def create_default_promotions():
+    """Creates the Best Buy promotions, by name"""
+    return {promotion.name: promotion for promotion in (
+        promotions.SecondHalfPrice("Second Half price!"),
+        promotions.ThirdOneFree("Third One Free!"),
+        promotions.PercentDiscount("30% off!", percent=30))}
 
+
+def create_default_store():
+    """Creates the Best Buy store with its default products and promotions"""
     product_list = [products.Product("MacBook Air M2", price=1450,
                                      quantity=100),
                     products.Product("Bose QuietComfort Earbuds", price=250,
@@ -119,22 +149,74 @@ def main():
                                             quantity=250, maximum=1)
                     ]
 
-    second_half_price = promotions.SecondHalfPrice("Second Half price!")
-    third_one_free = promotions.ThirdOneFree("Third One Free!")
-    thirty_percent = promotions.PercentDiscount("30% off!", percent=30)
+    default_promotions = create_default_promotions()
+    product_list[0].set_promotion(default_promotions["Second Half price!"])
+    product_list[1].set_promotion(default_promotions["Third One Free!"])
+    product_list[3].set_promotion(default_promotions["30% off!"])
+
+    return store.Store(product_list)
 
-    product_list[0].set_promotion(second_half_price)
-    product_list[1].set_promotion(third_one_free)
-    product_list[3].set_promotion(thirty_percent)
 
-    best_buy = store.Store(product_list)
+def run_batch(store_class, path):
+    """Executes the JSON lines commands of a file, or of stdin if path is
+    -, and writes one JSON response per command to stdout.
+    Uses the same commands as the store service, for example
+    {"action": "order", "items": [{"product": 1, "quantity": 2}]}.
+    """
+    with open(sys.stdout.fileno(), "w", buffering=OUTPUT_BUFFER_SIZE,
+              encoding="utf-8", closefd=False) as output:
+        if path == "-":
+            run_commands(store_class, sys.stdin, output)
+        else:
+            with open(path, encoding="utf-8") as commands_file:
+                run_commands(store_class, commands_file, output)
+
+
+def main():
+    """Initiate main function"""
+    functions_list = {
+        1: list_all_products_in_store,
+        2: show_total_amount_in_store,
+        3: make_an_order,
+        4: search_products,
+        5: quit_program
+    }
+
+    parser = argparse.ArgumentParser(description="Best Buy store")
+    parser.add_argument("--data-dir",
+                        help="keep the store state in this directory "
+                             "between runs")
+    parser.add_argument("--catalog", metavar="FILE",
+                        help="open the store over a binary or JSON lines "
+                             "catalog file, loading products on demand")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="execute JSON lines commands from FILE, "
+                             "- for stdin, instead of the interactive menu")
+    args = parser.parse_args()
+
+    persistence = None
+    if args.catalog and args.data_dir:
+        parser.error("--catalog can't be used with --data-dir")
+    if args.catalog:
+        best_buy = LazyStore(args.catalog, create_default_promotions())
+    elif args.data_dir:
+        persistence = StorePersistence(args.data_dir)
+        best_buy = persistence.open(create_default_store)
+    else:
+        best_buy = create_default_store()
 
     try:
+        if args.batch:
+            run_batch(best_buy, args.batch)
+            return
         while True:
             action = get_action_num(functions_list)
             functions_list[action](best_buy)
     except BreakException:
         pass
+    finally:
+        if persistence:
+            persistence.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,279 @@
+import argparse
+import cProfile
+import json
+import pstats
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List
+
+# Instrumented code checks this flag first, so disabled metrics cost a
+# single attribute lookup
+ENABLED = False
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01,
+                   0.05, 0.1, 0.5, 1.0)
+
+
+class Counter:
+    """Monotonic counter"""
+    def __init__(self, name, description):
+        """Initiate counter at 0"""
+        self.name = name
+        self.description = description
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """Increments the counter"""
+        with self.lock:
+            self.value += amount
+
+    def to_dict(self) -> dict:
+        return {"type": "counter", "value": self.value}
+
+
+class Histogram:
+    """Histogram of observed values, latencies in seconds by default"""
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        """Initiate empty histogram with the given bucket upper bounds"""
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """Adds a value to the histogram"""
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def to_dict(self) -> dict:
+        return {"type": "histogram", "count": self.count, "sum": self.sum,
+                "buckets": dict(zip([*map(str, self.buckets), "+Inf"],
+                                    self.counts))}
+
+
+class MetricsRegistry:
+    """Named collection of metrics that can be flushed to sinks"""
+    def __init__(self):
+        """Initiate empty registry"""
+        self.metrics: Dict[str, object] = {}
+        self.sinks: List = []
+
+    def counter(self, name, description) -> Counter:
+        """Returns the counter with the given name, creating it if needed"""
+        if name not in self.metrics:
+            self.metrics[name] = Counter(name, description)
+        return self.metrics[name]
+
+    def histogram(self, name, description) -> Histogram:
+        """Returns the histogram with the given name, creating it if needed"""
+        if name not in self.metrics:
+            self.metrics[name] = Histogram(name, description)
+        return self.metrics[name]
+
+    def snapshot(self) -> dict:
+        """Returns the current value of every metric"""
+        return {name: metric.to_dict()
+                for name, metric in self.metrics.items()}
+
+    def reset(self):
+        """Sets every metric back to zero"""
+        for metric in self.metrics.values():
+            with metric.lock:
+                if isinstance(metric, Counter):
+                    metric.value = 0
+                else:
+                    metric.counts = [0] * len(metric.counts)
+                    metric.count = 0
+                    metric.sum = 0.0
+
+    def add_sink(self, sink):
+        """Registers a sink, which must implement write(registry)"""
+        self.sinks.append(sink)
+
+    def flush(self):
+        """Writes the current metrics to every sink"""
+        for sink in self.sinks:
+            sink.write(self)
+
+
+class InMemorySink:
+    """Sink that keeps every flushed snapshot in a list"""
+    def __init__(self):
+        self.snapshots = []
+
+    def write(self, registry):
+        self.snapshots.append(registry.snapshot())
+
+
+class PrometheusFileSink:
+    """Sink that rewrites a file in the Prometheus text exposition format"""
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, registry):
+        with open(self.path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(prometheus_text(registry))
+
+
+class JsonLogSink:
+    """Sink that appends one JSON line per flush to a file"""
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, registry):
+        record = {"time": time.time(), "metrics": registry.snapshot()}
+        with open(self.path, "a", encoding="utf-8") as log_file:
+            log_file.write(json.dumps(record) + "\n")
+
+
+def prometheus_text(registry) -> str:
+    """Returns all metrics of a registry in Prometheus text format"""
+    lines = []
+    for name, metric in registry.metrics.items():
+        lines.append(f"# HELP {name} {metric.description}")
+        if isinstance(metric, Counter):
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {metric.value}")
+            continue
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip([*map(str, metric.buckets), "+Inf"],
+                                metric.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum {metric.sum}")
+        lines.append(f"{name}_count {metric.count}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+ORDERS = REGISTRY.counter("store_orders_total", "Orders processed")
+ORDERS_REJECTED = REGISTRY.counter("store_orders_rejected_total",
+                                   "Atomic orders rejected as a whole")
+ORDER_SECONDS = REGISTRY.histogram("store_order_seconds",
+                                   "Order processing time")
+BUYS = REGISTRY.counter("product_buys_total",
+                        "Products taken out of stock")
+BUY_SECONDS = REGISTRY.histogram("product_buy_seconds",
+                                 "Time to take a product out of stock")
+PROMOTION_EVALUATIONS = REGISTRY.counter("promotion_evaluations_total",
+                                         "Order lines priced by a promotion")
+STOCK_OUTS = REGISTRY.counter("product_stock_outs_total",
+                              "Purchases refused for insufficient stock")
+LIMIT_REJECTIONS = REGISTRY.counter("product_limit_rejections_total",
+                                    "Purchases refused by a per order limit")
+
+
+def record_buys(count, start):
+    """Counts products taken out of stock together, start being the
+    perf_counter time their stock checks began. Each one is observed with
+    its share of the elapsed time."""
+    if count:
+        elapsed = (time.perf_counter() - start) / count
+        BUYS.inc(count)
+        for _ in range(count):
+            BUY_SECONDS.observe(elapsed)
+
+
+def record_orders(count, rejected, start):
+    """Counts orders committed together, rejected of them as a whole,
+    start being the perf_counter time the commit began. Every order waited
+    for the whole commit, so each one is observed with its elapsed time."""
+    elapsed = time.perf_counter() - start
+    ORDERS.inc(count)
+    ORDERS_REJECTED.inc(rejected)
+    for _ in range(count):
+        ORDER_SECONDS.observe(elapsed)
+
+
+def enable():
+    """Turns instrumentation on"""
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    """Turns instrumentation off"""
+    global ENABLED
+    ENABLED = False
+
+
+@contextmanager
+def profile_session(cpu_output=None, memory=False, top=20):
+    """Context manager that enables metrics for its duration, and
+    optionally profiles CPU with cProfile (stats saved to cpu_output) and
+    memory with tracemalloc (top allocation sites printed at the end).
+    """
+    was_enabled = ENABLED
+    enable()
+    profiler = cProfile.Profile() if cpu_output else None
+    if memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield REGISTRY
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(cpu_output)
+            pstats.Stats(profiler, stream=sys.stderr) \
+                .sort_stats("cumulative").print_stats(top)
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"Peak traced memory: {peak / 2 ** 20:.1f} MiB",
+                  file=sys.stderr)
+            for stat in snapshot.statistics("lineno")[:top]:
+                print(stat, file=sys.stderr)
+        if not was_enabled:
+            disable()
+
+
+def main():
+    """Run a script, e.g. main.py or benchmark.py, with metrics and
+    optional profiling, then write the collected metrics."""
+    parser = argparse.ArgumentParser(
+        description="Run a script with store instrumentation")
+    parser.add_argument("--cprofile", help="save cProfile stats to this file")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="report memory allocations")
+    parser.add_argument("--prometheus", default="metrics.prom",
+                        help="Prometheus text output file")
+    parser.add_argument("--json-log", help="also append metrics to this "
+                                           "JSON lines file")
+    parser.add_argument("script")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    REGISTRY.add_sink(PrometheusFileSink(args.prometheus))
+    if args.json_log:
+        REGISTRY.add_sink(JsonLogSink(args.json_log))
+    sys.argv = [args.script, *args.arguments]
+    try:
+        with profile_session(args.cprofile, args.tracemalloc):
+            runpy.run_path(args.script, run_name="__main__")
+    finally:
+        REGISTRY.flush()
+
+
+if __name__ == '__main__':
+    # Run through the importable module, so the scripts being measured
+    # share its ENABLED flag and registry
+    import metrics
+    metrics.main()
@@ -0,0 +1,50 @@
+from decimal import Decimal, ROUND_HALF_UP as DECIMAL_HALF_UP
+
+# Rounding modes for promoted line prices, applied once per line in cents
+ROUND_HALF_UP = "half_up"
+ROUND_HALF_EVEN = "half_even"
+ROUND_DOWN = "down"
+ROUND_UP = "up"
+ROUNDING_MODES = (ROUND_HALF_UP, ROUND_HALF_EVEN, ROUND_DOWN, ROUND_UP)
+
+
+def validate_rounding(rounding):
+    """Validate rounding is a known rounding mode,
+    otherwise raise ValueError"""
+    if rounding not in ROUNDING_MODES:
+        raise ValueError(f"Unknown rounding mode {rounding!r}")
+
+
+def div_round(numerator, denominator, rounding=ROUND_HALF_UP):
+    """Divides a non negative integer numerator by a positive integer
+    denominator, rounding the result to an integer with the given mode.
+    Works on plain ints and on NumPy int64 arrays alike.
+    """
+    quotient, remainder = numerator // denominator, numerator % denominator
+    if rounding == ROUND_HALF_UP:
+        return quotient + (2 * remainder >= denominator)
+    if rounding == ROUND_HALF_EVEN:
+        return quotient + ((2 * remainder > denominator)
+                           | ((2 * remainder == denominator)
+                              & (quotient % 2 == 1)))
+    if rounding == ROUND_DOWN:
+        return quotient
+    if rounding == ROUND_UP:
+        return quotient + (remainder > 0)
+    raise ValueError(f"Unknown rounding mode {rounding!r}")
+
+
+def to_cents(dollars) -> int:
+    """Converts a dollar amount (int, float or str) to integer cents"""
+    return int(Decimal(str(dollars)).scaleb(2).quantize(
+        Decimal(1), rounding=DECIMAL_HALF_UP))
+
+
+def to_dollars(cents) -> float:
+    """Converts integer cents to a dollar amount"""
+    return cents / 100
+
+
+def format_cents(cents) -> str:
+    """Returns integer cents formatted as a dollar amount, e.g. $12.30"""
+    return f"${cents // 100}.{cents % 100:02d}"
@@ -0,0 +1,304 @@
+import json
+import os
+import threading
+import time
+from typing import Iterator
+from products import product_from_dict
+from promotions import promotion_from_dict
+from store import Store
+
+SNAPSHOT_FILE = "snapshot.json"
+LOG_FILE = "wal.log"
+# fsync the log after this many records, or when SYNC_INTERVAL has passed
+SYNC_EVERY = 100
+SYNC_INTERVAL = 0.05
+# Take a new snapshot after this many logged records
+SNAPSHOT_EVERY = 10000
+
+
+class WriteAheadLog:
+    """Append-only log of JSON records, one per line.
+    Records are flushed to the OS on every append, but fsync is batched:
+    it runs once every sync_every records or sync_interval seconds,
+    and on sync().
+    """
+    def __init__(self, path, sync_every=SYNC_EVERY,
+                 sync_interval=SYNC_INTERVAL):
+        """Initiate log, opening path for appending"""
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.drop_torn_record(path)
+        self.file = open(path, "a", encoding="utf-8")
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def append(self, record: dict):
+        """Appends a record to the log"""
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every or \
+                time.monotonic() - self.last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Forces all appended records to disk"""
+        if self.unsynced:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def truncate(self, after_seq=None):
+        """Drops the records covered by a snapshot, the ones with seq up to
+        after_seq, or all of them if not given"""
+        self.file.flush()
+        kept = [] if after_seq is None else \
+            list(self.read(self.path, after_seq))
+        self.file.truncate(0)
+        self.file.seek(0)
+        for record in kept:
+            self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+        self.unsynced = 1
+        self.sync()
+
+    def close(self):
+        """Syncs and closes the log"""
+        self.sync()
+        self.file.close()
+
+    @staticmethod
+    def drop_torn_record(path):
+        """Cuts an incomplete last record, left by a crash mid-write,
+        so new records don't get appended to it."""
+        if not os.path.exists(path):
+            return
+        with open(path, "r+b") as log_file:
+            end = log_file.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                chunk_start = max(0, position - 4096)
+                log_file.seek(chunk_start)
+                chunk = log_file.read(position - chunk_start)
+                newline = chunk.rfind(b"\n")
+                if newline != -1:
+                    position = chunk_start + newline + 1
+                    break
+                position = chunk_start
+            if position != end:
+                log_file.truncate(position)
+
+    @staticmethod
+    def read(path, after_seq=0) -> Iterator[dict]:
+        """Yields the records of a log file with seq greater than after_seq.
+        Stops at the first incomplete record, left by a crash mid-write.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    return
+                if record["seq"] > after_seq:
+                    yield record
+
+
+class StorePersistence:
+    """Durable storage for a Store in a directory.
+    Listens to store changes and appends them to a write-ahead log, and
+    writes a compact snapshot of the whole store every snapshot_every
+    records, after which the log is emptied. Snapshots are taken by a
+    background thread, so logging a change never waits for one. Loading
+    reads the latest snapshot and replays only the log records written
+    after it.
+    """
+    def __init__(self, directory, sync_every=SYNC_EVERY,
+                 sync_interval=SYNC_INTERVAL, snapshot_every=SNAPSHOT_EVERY):
+        """Initiate persistence for a data directory"""
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        self.lock = threading.RLock()
+        self.condition = threading.Condition(self.lock)
+        self.snapshot_lock = threading.Lock()
+        self.store = None
+        self.log = None
+        self.seq = 0
+        self.records_since_snapshot = 0
+        self.closed = False
+        self.worker = threading.Thread(target=self.run, daemon=True)
+
+    def open(self, default_factory=None) -> Store:
+        """Loads the store from disk and starts logging its changes.
+        If nothing was saved yet, default_factory is called to create the
+        initial store (an empty store if not given), which is snapshotted.
+        """
+        store_class = self.load()
+        if store_class is None:
+            store_class = default_factory() if default_factory else Store([])
+            self.store = store_class
+            self.snapshot()
+        self.log = WriteAheadLog(self.log_path, self.sync_every,
+                                 self.sync_interval)
+        store_class.add_listener(self)
+        self.worker.start()
+        return store_class
+
+    def load(self):
+        """Returns the saved store, or None if nothing was saved"""
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, encoding="utf-8") as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        self.seq = snapshot["seq"]
+        promotions = {}
+        store_class = Store([])
+        for data in snapshot["products"]:
+            self.restore_product(store_class, data, promotions)
+        store_class.catalog.next_id = max(store_class.catalog.next_id,
+                                          snapshot["next_id"])
+        for record in WriteAheadLog.read(self.log_path, self.seq):
+            self.replay(store_class, record, promotions)
+            self.seq = record["seq"]
+            self.records_since_snapshot += 1
+        self.store = store_class
+        return store_class
+
+    @staticmethod
+    def shared_promotion(data, promotions):
+        """Creates a saved promotion, reusing an equal one created before,
+        so products keep sharing their promotion objects."""
+        if not data:
+            return None
+        key = json.dumps(data, sort_keys=True)
+        if key not in promotions:
+            promotions[key] = promotion_from_dict(data)
+        return promotions[key]
+
+    def restore_product(self, store_class, data, promotions):
+        """Creates a saved product and adds it to the store with its id"""
+        product = product_from_dict({**data, "promotion": None})
+        promotion = self.shared_promotion(data.get("promotion"), promotions)
+        if promotion:
+            product.set_promotion(promotion)
+        store_class.add_product(product, data["id"])
+
+    def replay(self, store_class, record, promotions):
+        """Applies a single log record to the store.
+        Changes are logged right after the store applies them, so the
+        records written while a snapshot was taken may already be in it:
+        adds of products that exist and changes of products that don't
+        are skipped, and field records hold the new value, so applying
+        them again is harmless."""
+        event = record["event"]
+        if event == "add":
+            if store_class.get_product_by_id(record["product"]["id"]) \
+                    is None:
+                self.restore_product(store_class, record["product"],
+                                     promotions)
+            return
+        product = store_class.get_product_by_id(record["id"])
+        if product is None:
+            return
+        if event == "remove":
+            store_class.remove_product(product)
+        elif event == "quantity":
+            product.set_quantity(record["value"])
+        elif event == "price":
+            product.set_price(record["value"])
+        elif event == "active":
+            if record["value"]:
+                product.activate()
+            else:
+                product.deactivate()
+        elif event == "promotion":
+            product.set_promotion(self.shared_promotion(record["value"],
+                                                        promotions))
+
+    def append(self, record: dict):
+        """Logs a record, waking the snapshot thread when enough records
+        piled up"""
+        with self.lock:
+            self.seq += 1
+            self.log.append({"seq": self.seq, **record})
+            self.records_since_snapshot += 1
+            if self.records_since_snapshot >= self.snapshot_every:
+                self.condition.notify()
+
+    def run(self):
+        """Snapshot thread loop, takes a snapshot whenever enough records
+        were logged, until closed"""
+        while True:
+            with self.lock:
+                while self.records_since_snapshot < self.snapshot_every \
+                        and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+            self.snapshot()
+
+    def product_added(self, product, product_id):
+        """Store listener callback, logs a new product"""
+        self.append({"event": "add",
+                     "product": {**product.to_dict(), "id": product_id}})
+
+    def product_removed(self, product, product_id):
+        """Store listener callback, logs a removed product"""
+        self.append({"event": "remove", "id": product_id})
+
+    def product_changed(self, product, field, old_value, new_value):
+        """Store listener callback, logs the new value of a product field"""
+        if field == "promotion":
+            new_value = new_value.to_dict() if new_value else None
+        self.append({"event": field,
+                     "id": self.store.get_product_id(product),
+                     "value": new_value})
+
+    def snapshot(self):
+        """Writes a snapshot of the whole store and drops the log records
+        it covers.
+        The products are copied under the store aggregate lock, so no
+        product is added or removed meanwhile, together with the log
+        position. The file is written after releasing the locks, so changes
+        go on being logged while it is written."""
+        with self.snapshot_lock:
+            with self.store.aggregate_lock, self.lock:
+                catalog = self.store.catalog
+                snapshot = {"seq": self.seq,
+                            "next_id": catalog.next_id,
+                            "products": [{**product.to_dict(),
+                                          "id": catalog.get_id(product)}
+                                         for product in catalog]}
+                self.records_since_snapshot = 0
+            temp_path = self.snapshot_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as snapshot_file:
+                json.dump(snapshot, snapshot_file, separators=(",", ":"))
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            with self.lock:
+                os.replace(temp_path, self.snapshot_path)
+                if self.log is not None:
+                    self.log.truncate(snapshot["seq"])
+
+    def sync(self):
+        """Forces all logged changes to disk"""
+        with self.lock:
+            self.log.sync()
+
+    def close(self):
+        """Stops logging store changes and the snapshot thread, and closes
+        the log"""
+        with self.lock:
+            self.closed = True
+            self.condition.notify()
+        self.worker.join()
+        with self.lock:
+            self.store.remove_listener(self)
+            self.log.close()
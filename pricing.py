@@ -0,0 +1,138 @@
+import threading
+from collections import OrderedDict, namedtuple
+from typing import List
+import metrics
+from money import to_dollars
+
+# Default number of promotion results kept by a PriceCache
+PRICE_CACHE_SIZE = 100000
+
+# Priced order line, with the list and final prices in integer cents and
+# the promotion they were priced with, or None
+SaleLine = namedtuple("SaleLine", [
+    "product", "quantity", "list_cents", "cents", "promotion"])
+
+
+def price_sale_lines(lines: List[tuple]) -> List[SaleLine]:
+    """Gets a list of (product, quantity) tuples and returns a SaleLine
+    per line, in the same order.
+    The price and promotion of every product are read once, so the list
+    and final prices of a line always match each other. Lines are grouped
+    by promotion and each group is priced in a single batch call, instead
+    of one apply_promotion call per line.
+    """
+    terms = [(product.price_cents, product.promotion, quantity)
+             for product, quantity in lines]
+    return [SaleLine(product, quantity, unit_cents * quantity, cents,
+                     promotion or None)
+            for (product, quantity), (unit_cents, promotion, _), cents
+            in zip(lines, terms, price_terms_cents(terms))]
+
+
+def price_terms_cents(terms: List[tuple]) -> List[int]:
+    """Gets a list of (unit price in cents, promotion or None, quantity)
+    tuples, read from the products beforehand, and returns the final
+    price in integer cents of each one, in the same order.
+    """
+    prices = [0] * len(terms)
+    groups = {}
+    for index, (unit_cents, promotion, quantity) in enumerate(terms):
+        if promotion:
+            groups.setdefault(promotion, []).append(index)
+        else:
+            prices[index] = unit_cents * quantity
+
+    if metrics.ENABLED:
+        metrics.PROMOTION_EVALUATIONS.inc(sum(map(len, groups.values())))
+    for promotion, indexes in groups.items():
+        batch = promotion.apply_promotion_batch_cents(
+            [terms[index][0] for index in indexes],
+            [terms[index][2] for index in indexes])
+        for index, final_price in zip(indexes, batch):
+            prices[index] = final_price
+    return prices
+
+
+def price_lines_cents(lines: List[tuple]) -> List[int]:
+    """Gets a list of (product, quantity) tuples and returns the final
+    price in integer cents of each line, in the same order, see
+    price_sale_lines.
+    """
+    return [line.cents for line in price_sale_lines(lines)]
+
+
+def price_lines(lines: List[tuple]) -> List[float]:
+    """Same as price_lines_cents, with prices in dollars (float)"""
+    return [to_dollars(cents) for cents in price_lines_cents(lines)]
+
+
+def quote(shopping_list: List[tuple]) -> float:
+    """Returns the total price of a shopping list without buying anything.
+    Lines are summed in integer cents, so the total is exact.
+    """
+    return to_dollars(sum(price_lines_cents(shopping_list)))
+
+
+class PriceCache:
+    """Bounded LRU cache of promoted line prices.
+    Keys are (promotion, unit price in cents, quantity), so a product
+    whose price or promotion changes never hits an entry computed for the
+    old values.
+    If a promotion object itself is modified, invalidate it explicitly.
+    """
+    def __init__(self, max_size=PRICE_CACHE_SIZE):
+        """Initiate empty cache holding up to max_size prices"""
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def price_lines_cents(self, lines: List[tuple]) -> List[int]:
+        """Same as pricing.price_lines_cents, served from the cache when
+        possible. Lines missing from the cache are priced in one batch.
+        The price and promotion of every product are read once, and used
+        both to price the line and as its cache key.
+        """
+        terms = [(product.price_cents, product.promotion, quantity)
+                 for product, quantity in lines]
+        prices = [0] * len(lines)
+        missing = []
+        with self.lock:
+            for index, (unit_cents, promotion, quantity) in enumerate(terms):
+                if not promotion:
+                    prices[index] = unit_cents * quantity
+                    continue
+                key = (promotion, unit_cents, quantity)
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    prices[index] = self.entries[key]
+                    self.hits += 1
+                else:
+                    missing.append(index)
+                    self.misses += 1
+        if not missing:
+            return prices
+
+        missing_prices = price_terms_cents([terms[index]
+                                            for index in missing])
+        with self.lock:
+            for index, final_price in zip(missing, missing_prices):
+                unit_cents, promotion, quantity = terms[index]
+                prices[index] = final_price
+                self.entries[(promotion, unit_cents, quantity)] = final_price
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return prices
+
+    def invalidate(self, promotion=None):
+        """Drops the cached prices of a promotion, or all of them"""
+        with self.lock:
+            if promotion is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if key[0] is promotion]:
+                del self.entries[key]
@@ -0,0 +1,68 @@
+import threading
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ProductTable:
+    """Struct-of-arrays backing store for product numeric fields.
+    Every product owns one row, and price, quantity and active flag are kept
+    in compact typed columns instead of per-instance Python objects.
+    Released rows are reused by products created later. Rows are
+    allocated and released under a lock, so products created from
+    several threads never share a row.
+    """
+    def __init__(self):
+        """Initiate empty columns and free rows list"""
+        self.prices = array("q")
+        self.quantities = array("q")
+        self.active = array("b")
+        self.free_rows = []
+        # Reentrant, because garbage collection during an allocation can
+        # release the row of a collected product from the same thread
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        """Returns number of rows currently in use"""
+        return len(self.prices) - len(self.free_rows)
+
+    def allocate(self, price, quantity, active=True) -> int:
+        """Allocates a row for a new product and returns its index"""
+        with self.lock:
+            if self.free_rows:
+                row = self.free_rows.pop()
+                self.prices[row] = price
+                self.quantities[row] = quantity
+                self.active[row] = active
+                return row
+            row = len(self.prices)
+            self.prices.append(price)
+            self.quantities.append(quantity)
+            self.active.append(active)
+            return row
+
+    def release(self, row):
+        """Releases a row so it can be reused by another product"""
+        with self.lock:
+            self.quantities[row] = 0
+            self.active[row] = False
+            self.free_rows.append(row)
+
+    def as_numpy(self) -> dict:
+        """Returns NumPy copies of the columns. Views would pin the arrays
+        and make every later allocation fail while they are alive.
+        Raises ImportError if NumPy is not installed.
+        """
+        if numpy is None:
+            raise ImportError("NumPy is required for NumPy columns")
+        with self.lock:
+            return {"prices": numpy.array(self.prices, dtype=numpy.int64),
+                    "quantities": numpy.array(self.quantities,
+                                              dtype=numpy.int64),
+                    "active": numpy.array(self.active, dtype=numpy.int8)}
+
+
+DEFAULT_TABLE = ProductTable()
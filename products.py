@@ -1,4 +1,8 @@
-from promotions import Promotion
+from time import perf_counter
+import metrics
+from money import to_dollars
+from promotions import Promotion, promotion_from_dict
+from product_table import DEFAULT_TABLE
 
 
 def validate_positive_number(input_value):
@@ -16,8 +20,14 @@ def validate_type(input_val, req_type):
 
 
 class Product:
-    """Single product class that holds name, price and quantity properties"""
-    def __init__(self, name, price, quantity):
+    """Single product class that holds name, price and quantity properties.
+    Price, quantity and active flag live in a columnar ProductTable row,
+    the product object itself is a lightweight view over that row.
+    """
+    __slots__ = ("name", "promotion", "observers", "table", "row",
+                 "__weakref__")
+
+    def __init__(self, name, price, quantity, table=None):
         """Initiate product class, set name, price, quantity and active"""
         validate_type(name, str)
         validate_type(price, int)
@@ -30,10 +40,75 @@ class Product:
             raise ValueError("Invalid product input")
 
         self.name: str = name
-        self.price: float = price
-        self.quantity: int = quantity
-        self.active: bool = True
+        self.table = DEFAULT_TABLE if table is None else table
+        self.row: int = self.table.allocate(price, quantity)
         self.promotion = None
+        self.observers = ()
+
+    def __del__(self):
+        """Releases the product row back to its table"""
+        try:
+            self.table.release(self.row)
+        except AttributeError:
+            pass
+
+    @property
+    def price(self) -> int:
+        return self.table.prices[self.row]
+
+    @price.setter
+    def price(self, price):
+        """Writes the price and notifies observers on change"""
+        old_price = self.table.prices[self.row]
+        self.table.prices[self.row] = price
+        if old_price != price:
+            self.notify_observers("price", old_price, price)
+
+    @property
+    def price_cents(self) -> int:
+        """Unit price in integer cents"""
+        return self.table.prices[self.row] * 100
+
+    @property
+    def quantity(self) -> int:
+        return self.table.quantities[self.row]
+
+    @quantity.setter
+    def quantity(self, quantity):
+        """Writes the quantity and notifies observers on change"""
+        old_quantity = self.table.quantities[self.row]
+        self.table.quantities[self.row] = quantity
+        if old_quantity != quantity:
+            self.notify_observers("quantity", old_quantity, quantity)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.table.active[self.row])
+
+    @active.setter
+    def active(self, active):
+        """Writes the active flag and notifies observers on change"""
+        old_active = bool(self.table.active[self.row])
+        self.table.active[self.row] = active
+        if old_active != bool(active):
+            self.notify_observers("active", old_active, bool(active))
+
+    def add_observer(self, observer):
+        """Registers an observer that is notified on every product change.
+        The observer must implement product_changed(product, field, old, new).
+        """
+        self.observers = self.observers + (observer,)
+
+    def remove_observer(self, observer):
+        """Unregisters a previously added observer"""
+        observers = list(self.observers)
+        observers.remove(observer)
+        self.observers = tuple(observers)
+
+    def notify_observers(self, field, old_value, new_value):
+        """Notifies all observers that a product field has changed"""
+        for observer in self.observers:
+            observer.product_changed(self, field, old_value, new_value)
 
     def get_quantity(self) -> float:
         """Getter function for quantity. Returns the quantity (float)."""
@@ -49,6 +124,12 @@ class Product:
         if self.get_quantity() == 0:
             self.deactivate()
 
+    def set_price(self, price):
+        """Setter function for price. Notifies observers on change."""
+        validate_type(price, int)
+        validate_positive_number(price)
+        self.price = price
+
     def is_active(self) -> bool:
         """Getter function for active. Returns True if the product is active,
         otherwise False.
@@ -65,7 +146,10 @@ class Product:
 
     def set_promotion(self, promotion: Promotion):
         """Sets a promotion to product"""
+        old_promotion = self.promotion
         self.promotion = promotion
+        if old_promotion is not promotion:
+            self.notify_observers("promotion", old_promotion, promotion)
 
     def get_promotion(self):
         """Returns active promotion on product"""
@@ -80,11 +164,19 @@ class Product:
         return f"{self.name}, Price: ${self.price}, " \
                f"Quantity: {self.quantity}, Promotion: {promo_text}"
 
-    def buy(self, quantity) -> float:
-        """Buys a given quantity of the product.
-        Returns the total price (float) of the purchase.
-        Updates the quantity of the product.
-        In case of a problem, raises an Exception.
+    def to_dict(self) -> dict:
+        """Returns a JSON friendly representation of the product"""
+        return {"type": type(self).__name__,
+                "name": self.name,
+                "price": self.price,
+                "quantity": self.quantity,
+                "active": self.active,
+                "promotion": self.promotion.to_dict() if self.promotion
+                else None}
+
+    def check_withdraw(self, quantity):
+        """Checks a given quantity of the product can be bought, without
+        changing anything. In case of a problem, raises an Exception.
         """
         validate_type(quantity, int)
         validate_positive_number(quantity)
@@ -92,16 +184,43 @@ class Product:
         if not self.is_active():
             raise ValueError(f"{self.name} product is inactive")
 
-        new_quantity = self.quantity - quantity
-        if new_quantity < 0:
+        if self.quantity - quantity < 0:
+            if metrics.ENABLED:
+                metrics.STOCK_OUTS.inc()
             raise ValueError(f"Insufficient stock of {self.name}")
-        self.set_quantity(new_quantity)
 
+    def withdraw(self, quantity):
+        """Takes a given quantity of the product out of stock,
+        without pricing it. In case of a problem, raises an Exception.
+        """
+        start = perf_counter() if metrics.ENABLED else None
+        self.check_withdraw(quantity)
+        self.set_quantity(self.quantity - quantity)
+        if start is not None:
+            metrics.record_buys(1, start)
+
+    def get_price_cents(self, quantity) -> int:
+        """Returns the total price in integer cents of a given quantity of
+        the product, after applying its promotion."""
         if self.promotion:
-            final_price = self.promotion.apply_promotion(self, quantity)
-        else:
-            final_price = self.price * quantity
-        return round(final_price, 2)
+            if metrics.ENABLED:
+                metrics.PROMOTION_EVALUATIONS.inc()
+            return self.promotion.apply_promotion_cents(self, quantity)
+        return self.price_cents * quantity
+
+    def get_price(self, quantity) -> float:
+        """Returns the total price (float) of a given quantity of the
+        product, after applying its promotion."""
+        return to_dollars(self.get_price_cents(quantity))
+
+    def buy(self, quantity) -> float:
+        """Buys a given quantity of the product.
+        Returns the total price (float) of the purchase.
+        Updates the quantity of the product.
+        In case of a problem, raises an Exception.
+        """
+        self.withdraw(quantity)
+        return self.get_price(quantity)
 
 
 class NonStockedProduct(Product):
@@ -109,8 +228,10 @@ class NonStockedProduct(Product):
     Has name and price attributes.
     Doesn't track quantity, and quantity is automatically set to 0.
     """
-    def __init__(self, name, price):
-        super().__init__(name, price, quantity=0)
+    __slots__ = ()
+
+    def __init__(self, name, price, table=None):
+        super().__init__(name, price, quantity=0, table=table)
 
     def set_quantity(self, quantity):
         pass
@@ -124,9 +245,9 @@ class NonStockedProduct(Product):
         return f"{self.name}, Price: ${self.price}, Quantity: Unlimited, " \
                f"Promotion: {promo_text}"
 
-    def buy(self, quantity) -> float:
-        """Buys a given quantity of the product.
-        Returns the total price (float) of the purchase.
+    def check_withdraw(self, quantity):
+        """Checks a given quantity of the product can be bought.
+        Quantity isn't tracked, so stock is never insufficient.
         In case of a problem, raises an Exception.
         """
         validate_type(quantity, int)
@@ -135,21 +256,21 @@ class NonStockedProduct(Product):
         if not self.is_active():
             raise ValueError(f"{self.name} product is inactive")
 
-        if self.promotion:
-            final_price = self.promotion.apply_promotion(self, quantity)
-        else:
-            final_price = self.price * quantity
-        return round(final_price, 2)
-
 
 class LimitedProduct(Product):
     """Limited product, has a maximum attribute, which sets a limit on buying
     the product a maximum number of times in a single order"""
-    def __init__(self, name, price, quantity, maximum):
-        super().__init__(name, price, quantity)
+    __slots__ = ("max_per_order",)
+
+    def __init__(self, name, price, quantity, maximum, table=None):
+        super().__init__(name, price, quantity, table=table)
         validate_type(maximum, int)
         self.max_per_order = maximum
 
+    def to_dict(self) -> dict:
+        """Returns a JSON friendly representation of the product"""
+        return {**super().to_dict(), "max_per_order": self.max_per_order}
+
     def show(self) -> str:
         """Returns a string that represents the product"""
         if self.promotion:
@@ -160,14 +281,37 @@ class LimitedProduct(Product):
                f"Limited to {self.max_per_order} per order!, " \
                f"Promotion: {promo_text}"
 
-    def buy(self, quantity) -> float:
-        """Buys a given product with max per order amount.
+    def check_withdraw(self, quantity):
+        """Checks a given quantity of the product can be bought.
         If quantity is higher than allowed amount, raises an error.
-        Returns the total price (float) of the purchase.
-        Updates the quantity of the product.
         In case of any other problem, raises an Exception.
         """
         if quantity > self.max_per_order:
+            if metrics.ENABLED:
+                metrics.LIMIT_REJECTIONS.inc()
             raise ValueError(f"Only {self.max_per_order} "
                              f"allowed per order for this product.")
-        return super().buy(quantity)
+        super().check_withdraw(quantity)
+
+
+def product_from_dict(data: dict, table=None) -> Product:
+    """Creates a product from its to_dict representation.
+    Raises ValueError or TypeError if the data is invalid.
+    """
+    product_type = data.get("type", "Product")
+    if product_type == "Product":
+        product = Product(data["name"], data["price"], data["quantity"],
+                          table=table)
+    elif product_type == "NonStockedProduct":
+        product = NonStockedProduct(data["name"], data["price"], table=table)
+    elif product_type == "LimitedProduct":
+        product = LimitedProduct(data["name"], data["price"],
+                                 data["quantity"], data["max_per_order"],
+                                 table=table)
+    else:
+        raise ValueError(f"Unknown product type {product_type!r}")
+    if data.get("promotion"):
+        product.set_promotion(promotion_from_dict(data["promotion"]))
+    if not data.get("active", True):
+        product.deactivate()
+    return product
@@ -1,41 +1,298 @@
 from abc import ABC, abstractmethod
+from fractions import Fraction
+from typing import List, Sequence
+from money import div_round, validate_rounding, ROUND_HALF_UP
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Below this many lines, a plain Python loop is faster than NumPy setup
+NUMPY_MIN_BATCH = 32
+
+
+def exact(value) -> Fraction:
+    """Returns a number as an exact Fraction, floats by their decimal form"""
+    if isinstance(value, float):
+        return Fraction(str(value))
+    return Fraction(value)
 
 
 class Promotion(ABC):
-    """Abstract promotion class template"""
-    def __init__(self, name):
+    """Abstract promotion class template.
+    Prices in cents are computed with exact integer arithmetic and rounded
+    once per line with the promotion rounding mode.
+    """
+    def __init__(self, name, rounding=ROUND_HALF_UP):
+        validate_rounding(rounding)
         self.name = name
+        self.rounding = rounding
 
-    @abstractmethod
     def apply_promotion(self, product, quantity) -> float:
-        pass
+        return self.calculate(product.price, quantity)
+
+    def apply_promotion_cents(self, product, quantity) -> int:
+        """Returns the promoted total in integer cents"""
+        return self.calculate_cents(product.price_cents, quantity)
+
+    def to_dict(self) -> dict:
+        """Returns a JSON friendly representation of the promotion"""
+        data = {"type": type(self).__name__, "name": self.name}
+        if self.rounding != ROUND_HALF_UP:
+            data["rounding"] = self.rounding
+        return data
+
+    def to_rules(self) -> List[dict]:
+        """Returns the equivalent CompiledPromotion rules.
+        Raises TypeError if the promotion has no rule form.
+        """
+        raise TypeError(f"{type(self).__name__} promotion {self.name!r} "
+                        f"can't be compiled to rules")
+
+    @abstractmethod
+    def calculate(self, price, quantity) -> float:
+        """Returns the promoted total for quantity items at a unit price"""
+
+    def calculate_array(self, prices, quantities):
+        """Vectorized calculate over NumPy int64 arrays.
+        Subclasses override it, the default falls back to calculate.
+        """
+        return numpy.array([self.calculate(int(price), int(quantity))
+                            for price, quantity in zip(prices, quantities)])
+
+    def calculate_cents(self, price_cents, quantity) -> int:
+        """Returns the promoted total in cents for quantity items at a unit
+        price in cents. Subclasses override it with exact integer formulas,
+        the default rounds the result of calculate.
+        """
+        total = Fraction(self.calculate(price_cents, quantity))
+        return div_round(total.numerator, total.denominator, self.rounding)
+
+    def calculate_cents_array(self, prices_cents, quantities):
+        """Vectorized calculate_cents over NumPy int64 arrays.
+        Subclasses override it, the default falls back to calculate_cents.
+        """
+        return numpy.array([self.calculate_cents(int(price), int(quantity))
+                            for price, quantity
+                            in zip(prices_cents, quantities)],
+                           dtype=numpy.int64)
+
+    def apply_promotion_batch(self, prices: Sequence[int],
+                              quantities: Sequence[int]) -> List[float]:
+        """Prices many (unit price, quantity) lines in a single pass.
+        Uses NumPy when it is installed and the batch is large enough,
+        otherwise a pure Python loop. Results equal the scalar formulas.
+        """
+        if numpy is None or len(prices) < NUMPY_MIN_BATCH:
+            return [self.calculate(price, quantity)
+                    for price, quantity in zip(prices, quantities)]
+        result = self.calculate_array(numpy.asarray(prices, dtype=numpy.int64),
+                                      numpy.asarray(quantities,
+                                                    dtype=numpy.int64))
+        return result.tolist()
+
+    def apply_promotion_batch_cents(self, prices_cents: Sequence[int],
+                                    quantities: Sequence[int]) -> List[int]:
+        """Integer cents version of apply_promotion_batch"""
+        if numpy is None or len(prices_cents) < NUMPY_MIN_BATCH:
+            return [self.calculate_cents(price, quantity)
+                    for price, quantity in zip(prices_cents, quantities)]
+        result = self.calculate_cents_array(
+            numpy.asarray(prices_cents, dtype=numpy.int64),
+            numpy.asarray(quantities, dtype=numpy.int64))
+        return [int(cents) for cents in result.tolist()]
 
 
 class SecondHalfPrice(Promotion):
     """Second item half price promotion"""
-    def apply_promotion(self, product, quantity) -> float:
+    def to_rules(self) -> List[dict]:
+        """Returns the equivalent CompiledPromotion rules"""
+        return [{"type": "bundle", "buy": 1, "get": 1, "discount": 50}]
+
+    def calculate(self, price, quantity) -> float:
         if quantity % 2 == 1:
-            return 0.75 * (quantity - 1) * product.price + product.price
-        return 0.75 * quantity * product.price
+            return 0.75 * (quantity - 1) * price + price
+        return 0.75 * quantity * price
+
+    def calculate_array(self, prices, quantities):
+        odd = quantities % 2 == 1
+        return numpy.where(odd, 0.75 * (quantities - 1) * prices + prices,
+                           0.75 * quantities * prices)
+
+    def calculate_cents(self, price_cents, quantity) -> int:
+        # Every pair costs 1.5 items, so twice the total is an integer
+        return div_round(price_cents * (2 * quantity - quantity // 2), 2,
+                         self.rounding)
+
+    def calculate_cents_array(self, prices_cents, quantities):
+        return self.calculate_cents(prices_cents, quantities)
 
 
 class ThirdOneFree(Promotion):
     """Third item for free promotion"""
-    def apply_promotion(self, product, quantity) -> float:
+    def to_rules(self) -> List[dict]:
+        """Returns the equivalent CompiledPromotion rules"""
+        return [{"type": "bundle", "buy": 2, "get": 1, "discount": 100}]
+
+    def calculate(self, price, quantity) -> float:
         if quantity % 3 == 0:
-            return 2 * quantity * product.price / 3
-        return product.price * (2 * (quantity // 3) + quantity % 3)
+            return 2 * quantity * price / 3
+        return price * (2 * (quantity // 3) + quantity % 3)
+
+    def calculate_array(self, prices, quantities):
+        divides = quantities % 3 == 0
+        return numpy.where(divides, 2 * quantities * prices / 3,
+                           prices * (2 * (quantities // 3) + quantities % 3))
+
+    def calculate_cents(self, price_cents, quantity) -> int:
+        return price_cents * (quantity - quantity // 3)
+
+    def calculate_cents_array(self, prices_cents, quantities):
+        return self.calculate_cents(prices_cents, quantities)
 
 
 class PercentDiscount(Promotion):
     """Percentage discount promotion"""
-    def __init__(self, name, percent):
-        super().__init__(name)
+    def __init__(self, name, percent, rounding=ROUND_HALF_UP):
+        super().__init__(name, rounding)
         self.percent = percent
 
-    def apply_promotion(self, product, quantity) -> float:
-        return quantity * product.price * (100 - self.percent) / 100
+    def to_dict(self) -> dict:
+        """Returns a JSON friendly representation of the promotion"""
+        return {**super().to_dict(), "percent": self.percent}
+
+    def to_rules(self) -> List[dict]:
+        """Returns the equivalent CompiledPromotion rules"""
+        return [{"type": "percent", "percent": self.percent}]
+
+    def calculate(self, price, quantity) -> float:
+        return quantity * price * (100 - self.percent) / 100
+
+    def calculate_array(self, prices, quantities):
+        return quantities * prices * (100 - self.percent) / 100
+
+    def calculate_cents(self, price_cents, quantity) -> int:
+        paid = exact(100 - self.percent)
+        return div_round(quantity * price_cents * paid.numerator,
+                         100 * paid.denominator, self.rounding)
+
+    def calculate_cents_array(self, prices_cents, quantities):
+        return self.calculate_cents(prices_cents, quantities)
+
+
+def compile_rule(rule: dict, first: bool, exact_math=False):
+    """Compiles one promotion rule into a function that maps
+    (unit price, quantity, total so far) to the total after the rule.
+    Works on plain numbers and on NumPy arrays alike, or with exact_math
+    on Fractions, for cents pricing.
+    Raises ValueError if the rule is invalid.
+    """
+    number = exact if exact_math else (lambda value: value)
+    rule_type = rule.get("type")
+    if rule_type == "percent":
+        percent = number(rule["percent"])
+        if not 0 <= percent <= 100:
+            raise ValueError("Percent has to be between 0 and 100")
+        return lambda price, quantity, total: total * (100 - percent) / 100
+
+    if rule_type == "bundle":
+        buy, get = rule["buy"], rule["get"]
+        discount = number(rule["discount"])
+        if buy < 1 or get < 1 or not 0 <= discount <= 100:
+            raise ValueError("Bundle needs buy >= 1, get >= 1 and "
+                             "a discount between 0 and 100")
+        group_size = buy + get
+        group_units = buy + get * (100 - discount) / 100
+        discounted = (100 - discount) / 100
+
+        def paid_units(quantity):
+            remainder = quantity % group_size
+            extra = remainder - buy
+            extra = (extra + abs(extra)) // 2
+            return (quantity // group_size * group_units
+                    + remainder - extra + extra * discounted)
+
+        if first:
+            return lambda price, quantity, total: price * paid_units(quantity)
+        # On top of earlier rules, the bundle scales the total by the
+        # fraction of items it makes the customer pay for
+        return lambda price, quantity, total: \
+            total * paid_units(quantity) / quantity
+
+    raise ValueError(f"Unknown promotion rule type {rule_type!r}")
+
+
+class CompiledPromotion(Promotion):
+    """Promotion defined by declarative rules instead of a subclass.
+    Rules are applied in order, each on top of the previous ones:
+    {"type": "percent", "percent": 30} takes 30% off, and
+    {"type": "bundle", "buy": 2, "get": 1, "discount": 100} makes every
+    item after 2 bought, up to 1, 100% off.
+    Rules are compiled once, so pricing is O(1) in quantity, and a single
+    compiled promotion can be shared by any number of products.
+    """
+    def __init__(self, name, rules: List[dict], rounding=ROUND_HALF_UP):
+        super().__init__(name, rounding)
+        self.rules = [dict(rule) for rule in rules]
+        if not self.rules:
+            raise ValueError("A promotion needs at least one rule")
+        self.stages = [compile_rule(rule, index == 0)
+                       for index, rule in enumerate(self.rules)]
+        self.exact_stages = [compile_rule(rule, index == 0, exact_math=True)
+                             for index, rule in enumerate(self.rules)]
+
+    def to_dict(self) -> dict:
+        """Returns a JSON friendly representation of the promotion"""
+        return {**super().to_dict(), "rules": self.rules}
+
+    def to_rules(self) -> List[dict]:
+        """Returns the rules of the promotion"""
+        return [dict(rule) for rule in self.rules]
+
+    def calculate(self, price, quantity) -> float:
+        if quantity == 0:
+            return 0
+        total = quantity * price
+        for stage in self.stages:
+            total = stage(price, quantity, total)
+        return total
+
+    def calculate_array(self, prices, quantities):
+        total = quantities * prices
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            for stage in self.stages:
+                total = stage(prices, quantities, total)
+        return numpy.where(quantities == 0, 0, total)
+
+    def calculate_cents(self, price_cents, quantity) -> int:
+        if quantity == 0:
+            return 0
+        total = Fraction(quantity * price_cents)
+        for stage in self.exact_stages:
+            total = stage(price_cents, quantity, total)
+        total = Fraction(total)
+        return div_round(total.numerator, total.denominator, self.rounding)
+
+
+def stack_promotions(name, promotions: List[Promotion]) -> CompiledPromotion:
+    """Compiles several promotions, applied in the given order,
+    into a single promotion. Raises TypeError if one of them has no rule
+    form."""
+    return CompiledPromotion(name, [rule for promotion in promotions
+                                    for rule in promotion.to_rules()])
 
 
+PROMOTION_TYPES = {promotion_type.__name__: promotion_type
+                   for promotion_type in (SecondHalfPrice, ThirdOneFree,
+                                          PercentDiscount,
+                                          CompiledPromotion)}
 
 
+def promotion_from_dict(data: dict) -> Promotion:
+    """Creates a promotion from its to_dict representation"""
+    arguments = dict(data)
+    promotion_type = PROMOTION_TYPES.get(arguments.pop("type", None))
+    if promotion_type is None:
+        raise ValueError(f"Unknown promotion type {data.get('type')!r}")
+    return promotion_type(**arguments)
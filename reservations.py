@@ -0,0 +1,186 @@
+import heapq
+import math
+import itertools
+import threading
+import time
+from typing import Dict, List
+import metrics
+from pricing import price_sale_lines
+from products import NonStockedProduct
+from store import OrderResult
+
+# Seconds a reservation holds stock unless another ttl is given
+DEFAULT_TTL = 15 * 60
+
+
+class Reservation:
+    """Stock held for a cart until expires_at, lines map products to the
+    reserved quantities"""
+    def __init__(self, reservation_id, lines: Dict, expires_at):
+        """Initiate reservation"""
+        self.reservation_id = reservation_id
+        self.lines = lines
+        self.expires_at = expires_at
+
+
+class ReservationManager:
+    """Holds stock of store products for carts, for a limited time.
+    Reserved quantities are kept per product next to the product stock,
+    so available and reserved quantities are O(1) reads. Expiry times
+    are kept in a heap and only due reservations are looked at, instead
+    of scanning all of them.
+    The manager registers itself as the store reservation manager, so
+    every purchase path of the store only sells stock that isn't held.
+    """
+    def __init__(self, store_class, ttl=DEFAULT_TTL, clock=time.monotonic):
+        """Initiate manager without reservations"""
+        self.store = store_class
+        self.ttl = ttl
+        self.clock = clock
+        self.reservations: Dict[int, Reservation] = {}
+        self.reserved: Dict = {}
+        self.expiry_heap: List[tuple] = []
+        self.next_id = itertools.count(1)
+        self.lock = threading.Lock()
+        store_class.reservations = self
+
+    def __len__(self):
+        return len(self.reservations)
+
+    def get_reserved(self, product) -> int:
+        """Returns how many items of a product are held by reservations"""
+        self.expire()
+        return self.reserved.get(product, 0)
+
+    def get_available(self, product) -> int:
+        """Returns how many items of a product can still be sold or
+        reserved. Non stocked products are never held and are
+        unlimited."""
+        if isinstance(product, NonStockedProduct):
+            return math.inf
+        return product.quantity - self.get_reserved(product)
+
+    def expire(self, now=None) -> int:
+        """Releases every reservation whose time is up.
+        Returns how many reservations expired."""
+        now = self.clock() if now is None else now
+        expired = 0
+        with self.lock:
+            while self.expiry_heap and self.expiry_heap[0][0] <= now:
+                expires_at, reservation_id = heapq.heappop(self.expiry_heap)
+                reservation = self.reservations.get(reservation_id)
+                # Entries of released or extended reservations are stale
+                if reservation is None or reservation.expires_at != \
+                        expires_at:
+                    continue
+                self._release(reservation)
+                expired += 1
+        return expired
+
+    def reserve(self, shopping_list: List[tuple], ttl=None) -> Reservation:
+        """Holds stock for a shopping list of (product, quantity) tuples.
+        Quantities of the same product are aggregated, and the whole cart
+        is checked like Store.checkout, against the stock not held by
+        other reservations. Raises ValueError if any line fails, nothing
+        is reserved in that case.
+        """
+        self.expire()
+        cart = self.store.generate_order_dict(shopping_list)
+        errors = []
+        with self.store.lock_products(cart), self.lock:
+            for product, quantity in cart.items():
+                try:
+                    product.check_withdraw(quantity)
+                except (ValueError, TypeError) as error:
+                    errors.append(str(error) or f"Invalid quantity "
+                                                f"for {product.name}")
+                    continue
+                if not isinstance(product, NonStockedProduct) and \
+                        quantity > product.quantity \
+                        - self.reserved.get(product, 0):
+                    errors.append(f"Insufficient stock of {product.name}")
+            if errors:
+                raise ValueError("; ".join(errors))
+
+            reservation = Reservation(
+                next(self.next_id), cart,
+                self.clock() + (self.ttl if ttl is None else ttl))
+            for product, quantity in cart.items():
+                if not isinstance(product, NonStockedProduct):
+                    self.reserved[product] = \
+                        self.reserved.get(product, 0) + quantity
+            self.reservations[reservation.reservation_id] = reservation
+            heapq.heappush(self.expiry_heap, (reservation.expires_at,
+                                              reservation.reservation_id))
+        return reservation
+
+    def extend(self, reservation, ttl=None):
+        """Restarts the time to live of a reservation.
+        Raises ValueError if the reservation is no longer held."""
+        self.expire()
+        with self.lock:
+            if reservation.reservation_id not in self.reservations:
+                raise ValueError("Reservation is no longer held")
+            reservation.expires_at = \
+                self.clock() + (self.ttl if ttl is None else ttl)
+            heapq.heappush(self.expiry_heap, (reservation.expires_at,
+                                              reservation.reservation_id))
+
+    def release(self, reservation):
+        """Gives the stock of a reservation back, if it is still held"""
+        with self.lock:
+            if reservation.reservation_id in self.reservations:
+                self._release(reservation)
+
+    def _release(self, reservation):
+        """Drops a held reservation, the manager lock must be held"""
+        del self.reservations[reservation.reservation_id]
+        for product, quantity in reservation.lines.items():
+            if product in self.reserved:
+                self.reserved[product] -= quantity
+                if not self.reserved[product]:
+                    del self.reserved[product]
+
+    def commit(self, reservation) -> OrderResult:
+        """Buys the reserved cart. The stock was validated when it was
+        reserved, so the lines are only checked again in case the
+        products were changed directly since then.
+        Returns an OrderResult, the reservation is released either way.
+        """
+        start = time.perf_counter() if metrics.ENABLED else None
+        result = self._commit(reservation)
+        if start is not None:
+            metrics.record_orders(1, int(not result.success), start)
+        return result
+
+    def _commit(self, reservation) -> OrderResult:
+        """Buys a reserved cart, see commit"""
+        self.expire()
+        cart = reservation.lines
+        errors = []
+        with self.store.lock_products(cart), self.lock:
+            if reservation.reservation_id not in self.reservations:
+                return OrderResult([], ["Reservation is no longer held"])
+            self._release(reservation)
+            buy_start = time.perf_counter() if metrics.ENABLED else None
+            for product, quantity in cart.items():
+                try:
+                    product.check_withdraw(quantity)
+                except (ValueError, TypeError) as error:
+                    errors.append(str(error) or f"Invalid quantity "
+                                                f"for {product.name}")
+                    continue
+                held = self.reserved.get(product, 0)
+                if held and quantity > product.quantity - held:
+                    errors.append(f"Insufficient stock of {product.name}")
+            if not errors:
+                for product, quantity in cart.items():
+                    product.set_quantity(product.quantity - quantity)
+                if buy_start is not None:
+                    metrics.record_buys(len(cart), buy_start)
+                sales = price_sale_lines(list(cart.items()))
+        if errors:
+            return OrderResult([], errors)
+        self.store.record_sales(sales)
+        return OrderResult([(line.product, line.quantity, line.cents)
+                            for line in sales], [])
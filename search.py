@@ -0,0 +1,333 @@
+import heapq
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Set
+from products import NonStockedProduct
+
+# Length of the name n-grams of the substring index
+NGRAM = 3
+# Results returned per page unless another limit is given
+PAGE_SIZE = 20
+# Result sets smaller than 1 / SELECT_RATIO of the catalog are sorted
+# directly, bigger ones are picked while walking the sorted index
+SELECT_RATIO = 4
+SORT_KEYS = ("id", "name", "price", "quantity")
+# Above this many pending moves a sorted index is sorted again as a whole,
+# instead of moving its entries one by one
+RESORT_THRESHOLD = 64
+
+
+class SearchResult:
+    """Page of search results, with the total number of matches"""
+    def __init__(self, total, products: List):
+        """Initiate result"""
+        self.total = total
+        self.products = products
+
+
+def ngrams(text) -> Set[str]:
+    """Returns the set of NGRAM long substrings of a lowercase text"""
+    return {text[start:start + NGRAM]
+            for start in range(len(text) - NGRAM + 1)}
+
+
+def is_in_stock(product) -> bool:
+    """Returns True if the product can be bought right now"""
+    return product.active and (product.quantity > 0
+                               or isinstance(product, NonStockedProduct))
+
+
+def validate_query(sort_by, offset, limit):
+    """Validates sorting and paging arguments of a search,
+    otherwise raise ValueError"""
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"Unknown sort key {sort_by!r}")
+    if offset < 0 or limit < 0:
+        raise ValueError("Offset and limit can't be negative")
+
+
+class SearchIndex:
+    """Store listener that maintains search indexes of a store catalog.
+    Names are indexed by n-grams for substring search and kept sorted for
+    prefix search, products are grouped by type, promotion, active and
+    in stock state, and kept sorted by price and quantity, so searches
+    combine index lookups instead of scanning the catalog.
+    """
+    def __init__(self, store_class):
+        """Initiate indexes from the store products, and start listening
+        to the store changes"""
+        self.store = store_class
+        self.lock = threading.Lock()
+        self.products: Dict[int, object] = {}
+        self.names: Dict[int, str] = {}
+        self.name_ngrams: Dict[str, Set[int]] = {}
+        self.types: Dict[str, Set[int]] = {}
+        self.promotions: Dict[str, Set[int]] = {}
+        self.active: Set[int] = set()
+        self.in_stock: Set[int] = set()
+        self.by_name: List[tuple] = []
+        self.by_price: List[tuple] = []
+        self.by_quantity: List[tuple] = []
+        # Price and quantity changes are applied to the sorted indexes on
+        # the next search, these map product ids to their indexed value
+        self.moved: Dict[str, Dict[int, int]] = {"price": {},
+                                                 "quantity": {}}
+        with store_class.aggregate_lock:
+            store_class.add_listener(self)
+            products = [(store_class.get_product_id(product), product)
+                        for product in store_class.catalog]
+        with self.lock:
+            for product_id, product in products:
+                self._add(product, product_id, list.append)
+            for entries in (self.by_name, self.by_price, self.by_quantity):
+                entries.sort()
+
+    def product_added(self, product, product_id):
+        with self.lock:
+            self._add(product, product_id, insort)
+
+    def _add(self, product, product_id, add_entry):
+        """Indexes a product, add_entry puts entries in the sorted lists.
+        The index lock must be held."""
+        name = product.name.lower()
+        self.products[product_id] = product
+        self.names[product_id] = name
+        for ngram in ngrams(name):
+            self.name_ngrams.setdefault(ngram, set()).add(product_id)
+        self.types.setdefault(type(product).__name__, set()).add(product_id)
+        if product.promotion:
+            self.promotions.setdefault(product.promotion.name, set()).add(
+                product_id)
+        add_entry(self.by_name, (name, product_id))
+        add_entry(self.by_price, (product.price, product_id))
+        add_entry(self.by_quantity, (product.quantity, product_id))
+        self._update_state(product, product_id)
+
+    def product_removed(self, product, product_id):
+        with self.lock:
+            if self.products.pop(product_id, None) is None:
+                return
+            name = self.names.pop(product_id)
+            for ngram in ngrams(name):
+                self._discard(self.name_ngrams, ngram, product_id)
+            self._discard(self.types, type(product).__name__, product_id)
+            if product.promotion:
+                self._discard(self.promotions, product.promotion.name,
+                              product_id)
+            self._remove_entry(self.by_name, (name, product_id))
+            for field, entries in self._value_indexes():
+                indexed = self.moved[field].pop(product_id,
+                                                getattr(product, field))
+                self._remove_entry(entries, (indexed, product_id))
+            self.active.discard(product_id)
+            self.in_stock.discard(product_id)
+
+    def product_changed(self, product, field, old_value, new_value):
+        with self.lock:
+            product_id = self._get_id(product)
+            if product_id is None:
+                return
+            if field in self.moved:
+                self.moved[field].setdefault(product_id, old_value)
+            elif field == "promotion":
+                if old_value:
+                    self._discard(self.promotions, old_value.name,
+                                  product_id)
+                if new_value:
+                    self.promotions.setdefault(new_value.name, set()).add(
+                        product_id)
+            self._update_state(product, product_id)
+
+    def _value_indexes(self):
+        """Returns the (field, sorted entries) pairs of the price and
+        quantity indexes"""
+        return (("price", self.by_price), ("quantity", self.by_quantity))
+
+    def _refresh(self, field):
+        """Applies pending changes of a field, price or quantity, to its
+        sorted index. The index lock must be held."""
+        entries = dict(self._value_indexes())[field]
+        moved = self.moved[field]
+        if len(moved) > RESORT_THRESHOLD:
+            entries[:] = sorted((getattr(product, field), product_id)
+                                for product_id, product
+                                in self.products.items())
+        else:
+            for product_id, indexed in moved.items():
+                self._remove_entry(entries, (indexed, product_id))
+                insort(entries, (getattr(self.products[product_id], field),
+                                 product_id))
+        moved.clear()
+
+    def _get_id(self, product):
+        """Returns the id of an indexed product, or None"""
+        try:
+            product_id = self.store.get_product_id(product)
+        except KeyError:
+            return None
+        return product_id if product_id in self.products else None
+
+    def _update_state(self, product, product_id):
+        """Updates the active and in stock sets of a product"""
+        for ids, included in ((self.active, product.active),
+                              (self.in_stock, is_in_stock(product))):
+            if included:
+                ids.add(product_id)
+            else:
+                ids.discard(product_id)
+
+    @staticmethod
+    def _discard(groups: Dict, key, product_id):
+        """Removes a product id from a group, dropping empty groups"""
+        ids = groups.get(key)
+        if ids is not None:
+            ids.discard(product_id)
+            if not ids:
+                del groups[key]
+
+    @staticmethod
+    def _remove_entry(entries: List, entry):
+        """Removes an entry from a sorted list"""
+        index = bisect_left(entries, entry)
+        if index < len(entries) and entries[index] == entry:
+            del entries[index]
+
+    def search(self, text=None, prefix=None, product_type=None,
+               promotion=None, in_stock=None, min_price=None,
+               max_price=None, sort_by="id", descending=False, offset=0,
+               limit=PAGE_SIZE, include_inactive=False) -> SearchResult:
+        """Returns a page of the products matching all given filters.
+        text matches anywhere in the name and prefix at its start, both
+        ignoring case. Texts shorter than NGRAM can't use the n-gram index
+        and are checked on the products matching the other filters.
+        product_type is a product class name and promotion a promotion
+        name. Inactive products are left out unless
+        include_inactive is True. Results are sorted by id, name, price
+        or quantity and the page starts at offset.
+        Raises ValueError for an unknown sort key or negative paging.
+        """
+        validate_query(sort_by, offset, limit)
+        text = text.lower() if text else None
+        with self.lock:
+            # Sorted value indexes are only brought up to date when the
+            # query uses them, so order traffic doesn't slow other searches
+            if min_price is not None or max_price is not None \
+                    or sort_by == "price":
+                self._refresh("price")
+            if sort_by == "quantity":
+                self._refresh("quantity")
+            groups = []
+            if text and len(text) >= NGRAM:
+                groups.extend(self.name_ngrams.get(ngram, set())
+                              for ngram in ngrams(text))
+            if prefix:
+                prefix = prefix.lower()
+                groups.append(self._range_ids(self.by_name, prefix,
+                                              prefix + "\uffff"))
+            if product_type is not None:
+                groups.append(self.types.get(product_type, set()))
+            if promotion is not None:
+                groups.append(self.promotions.get(promotion, set()))
+            if in_stock:
+                groups.append(self.in_stock)
+            if min_price is not None or max_price is not None:
+                groups.append(self._range_ids(
+                    self.by_price,
+                    float("-inf") if min_price is None else min_price,
+                    float("inf") if max_price is None else max_price))
+            if not include_inactive:
+                groups.append(self.active)
+
+            if groups:
+                groups.sort(key=len)
+                matches = set(groups[0]).intersection(*groups[1:])
+            else:
+                matches = set(self.products)
+            if text:
+                matches = {product_id for product_id in matches
+                           if text in self.names[product_id]}
+            if in_stock is False:
+                matches -= self.in_stock
+            page = self._sorted_page(matches, sort_by, descending,
+                                     offset + limit)[offset:]
+            return SearchResult(len(matches),
+                                [self.products[product_id]
+                                 for product_id in page])
+
+    def _range_ids(self, entries: List, low, high) -> Set[int]:
+        """Returns the ids of sorted (key, id) entries with
+        low <= key <= high"""
+        start = bisect_left(entries, (low, ))
+        end = bisect_right(entries, (high, float("inf")))
+        return {product_id for _, product_id in entries[start:end]}
+
+    def _sort_key(self, sort_by):
+        """Returns the sort key function of product ids for a sort key.
+        Ties are broken by id, like in the sorted indexes."""
+        if sort_by == "name":
+            return lambda product_id: (self.names[product_id], product_id)
+        if sort_by == "price":
+            return lambda product_id: (self.products[product_id].price,
+                                       product_id)
+        if sort_by == "quantity":
+            return lambda product_id: (self.products[product_id].quantity,
+                                       product_id)
+        return None
+
+    def _sorted_page(self, matches: Set[int], sort_by, descending,
+                     count) -> List[int]:
+        """Returns the first count matching ids in sort order.
+        Few matches are sorted directly, otherwise the sorted index is
+        walked until count matches were seen."""
+        if not count or not matches:
+            return []
+        if sort_by == "id" or len(matches) * SELECT_RATIO < \
+                len(self.products):
+            select = heapq.nlargest if descending else heapq.nsmallest
+            return select(count, matches, key=self._sort_key(sort_by))
+        entries = {"name": self.by_name, "price": self.by_price,
+                   "quantity": self.by_quantity}[sort_by]
+        page = []
+        for _, product_id in (reversed(entries) if descending else entries):
+            if product_id in matches:
+                page.append(product_id)
+                if len(page) == count:
+                    break
+        return page
+
+
+def scan_products(store_class, text=None, prefix=None, product_type=None,
+                  promotion=None, in_stock=None, min_price=None,
+                  max_price=None, sort_by="id", descending=False, offset=0,
+                  limit=PAGE_SIZE, include_inactive=False) -> SearchResult:
+    """Same as SearchIndex.search, implemented as a linear scan over all
+    store products. Only the sort keys and ids of the matches are kept,
+    the products of the page are looked up again at the end. Used as the
+    reference and benchmark baseline, and by stores without an index."""
+    validate_query(sort_by, offset, limit)
+    text = text.lower() if text else None
+    prefix = prefix.lower() if prefix else None
+    matches = []
+    for product in store_class.catalog:
+        name = product.name.lower()
+        if (text and text not in name
+                or prefix and not name.startswith(prefix)
+                or product_type is not None
+                and type(product).__name__ != product_type
+                or promotion is not None
+                and (product.promotion is None
+                     or product.promotion.name != promotion)
+                or in_stock is not None and is_in_stock(product) != in_stock
+                or min_price is not None and product.price < min_price
+                or max_price is not None and product.price > max_price
+                or not include_inactive and not product.active):
+            continue
+        product_id = store_class.get_product_id(product)
+        sort_key = {"id": product_id, "name": name, "price": product.price,
+                    "quantity": product.quantity}[sort_by]
+        matches.append((sort_key, product_id))
+    select = heapq.nlargest if descending else heapq.nsmallest
+    page = select(offset + limit, matches)[offset:]
+    return SearchResult(len(matches),
+                        [store_class.get_product_by_id(product_id)
+                         for _, product_id in page])
@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import json
+from typing import List
+from batching import commit_orders
+from commands import handle_command, order_response, parse_items
+from main import create_default_store
+
+# Maximum number of requests being processed at once across all clients
+MAX_IN_FLIGHT = 1000
+# Maximum length of a single request line
+MAX_LINE_LENGTH = 1024 * 1024
+
+
+class StoreService:
+    """Asyncio front-end for a Store.
+    Speaks a line protocol, each request and response is one JSON object
+    per line. Supported actions are list, total, search, quote and order.
+    Orders received during the same event loop tick are committed together
+    as one group with commit_orders, and the number of requests in flight
+    is bounded so slow processing pushes back on clients instead of
+    queueing without limit.
+    """
+    def __init__(self, store_class, max_in_flight=MAX_IN_FLIGHT):
+        """Initiate service around a store"""
+        self.store = store_class
+        self.max_in_flight = max_in_flight
+        self.slots = None
+        self.pending_orders = []
+        self.commit_scheduled = False
+        self.batches_committed = 0
+
+    async def handle_request(self, request: dict) -> dict:
+        """Handles a single decoded request and returns the response"""
+        try:
+            if request.get("action") != "order":
+                return handle_command(self.store, request)
+            shopping_list = parse_items(self.store, request.get("items"))
+            return order_response(await self.submit_order(shopping_list))
+        except (ValueError, TypeError, AttributeError) as error:
+            return {"ok": False, "errors": [str(error) or "Invalid request"]}
+
+    async def submit_order(self, shopping_list: List[tuple]):
+        """Queues an order for the next batch commit and waits
+        for its OrderResult."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending_orders.append((shopping_list, future))
+        if not self.commit_scheduled:
+            self.commit_scheduled = True
+            loop.call_soon(self.commit_pending_orders)
+        return await future
+
+    def commit_pending_orders(self):
+        """Commits all orders queued during the current loop tick.
+        Every queued future gets its result, or the error of the commit."""
+        self.commit_scheduled = False
+        batch, self.pending_orders = self.pending_orders, []
+        self.batches_committed += 1
+        try:
+            results = commit_orders(self.store, [shopping_list for
+                                                 shopping_list, _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.cancelled():
+                future.set_result(result)
+
+    async def handle_connection(self, reader, writer):
+        """Serves one client connection, request by request"""
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_in_flight)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # While all slots are taken this connection isn't read,
+                # so clients are throttled by TCP flow control
+                async with self.slots:
+                    try:
+                        request = json.loads(line)
+                    except json.JSONDecodeError:
+                        response = {"ok": False, "errors": ["Invalid JSON"]}
+                    else:
+                        response = await self.handle_request(request)
+                    writer.write(json.dumps(response).encode() + b"\n")
+                    await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """Starts listening and returns the asyncio server"""
+        return await asyncio.start_server(self.handle_connection, host, port,
+                                          limit=MAX_LINE_LENGTH)
+
+
+async def serve(store_class, host="127.0.0.1", port=8765):
+    """Runs a StoreService for a store until cancelled"""
+    server = await StoreService(store_class).start(host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    """Serve the default Best Buy store"""
+    parser = argparse.ArgumentParser(description="Best Buy store service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(create_default_store(), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
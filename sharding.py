@@ -0,0 +1,211 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import zlib
+from multiprocessing import shared_memory
+from typing import List
+from batching import commit_orders
+from money import to_dollars
+from products import product_from_dict
+from promotions import promotion_from_dict
+from store import Store, OrderResult
+
+# Shared memory counters kept per shard: total quantity and active count
+COUNTERS_PER_SHARD = 2
+
+
+def shard_of(name, shards) -> int:
+    """Returns the shard of a product name (its SKU).
+    Uses crc32 instead of hash, which is salted differently in every
+    process."""
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+def load_shard(product_rows: List[dict]) -> Store:
+    """Creates the store of a shard from product to_dict rows.
+    Equal promotions are created once and shared, so lines are still
+    priced in one batch per promotion."""
+    promotions = {}
+    store_class = Store([])
+    for row in product_rows:
+        row = dict(row)
+        promotion_data = row.pop("promotion", None)
+        product = product_from_dict(row)
+        if promotion_data:
+            key = json.dumps(promotion_data, sort_keys=True)
+            if key not in promotions:
+                promotions[key] = promotion_from_dict(promotion_data)
+            product.set_promotion(promotions[key])
+        store_class.add_product(product)
+    return store_class
+
+
+def commit_shard_carts(store_class, carts) -> List[tuple]:
+    """Commits carts of (product name, quantity) against a shard store
+    with commit_orders. Returns one (lines, errors) tuple per cart, lines
+    being (product name, quantity, price in cents)."""
+    results = [None] * len(carts)
+    lists, positions = [], []
+    for position, cart in enumerate(carts):
+        shopping_list = []
+        for name, quantity in cart:
+            product = store_class.get_product(name)
+            if product is None:
+                results[position] = ([], [f"Unknown product {name}"])
+                break
+            shopping_list.append((product, quantity))
+        else:
+            lists.append(shopping_list)
+            positions.append(position)
+    for position, result in zip(positions,
+                                commit_orders(store_class, lists)):
+        results[position] = ([(product.name, quantity, price)
+                              for product, quantity, price
+                              in result.lines], result.errors)
+    return results
+
+
+def publish_counters(store_class, counters, slot):
+    """Writes the aggregates of a shard store to its counter slots"""
+    counters[slot] = store_class.get_total_quantity()
+    counters[slot + 1] = store_class.get_active_count()
+
+
+def run_shard(index, product_rows, counters_name, connection):
+    """Worker process loop of a shard.
+    Receives batches of carts of (product name, quantity), commits them
+    with commit_shard_carts and replies with one (lines, errors) tuple
+    per cart. A batch that raises is answered with its error for every
+    cart, so a bad request never stops the worker.
+    The shard aggregates are published to its own slots of the shared
+    counters after every batch."""
+    store_class = load_shard(product_rows)
+    counters_memory = shared_memory.SharedMemory(name=counters_name)
+    counters = counters_memory.buf.cast("q")
+    slot = index * COUNTERS_PER_SHARD
+    publish_counters(store_class, counters, slot)
+    try:
+        while True:
+            carts = connection.recv()
+            if carts is None:
+                break
+            try:
+                results = commit_shard_carts(store_class, carts)
+            except Exception as error:
+                results = [([], [str(error) or "Invalid request"])
+                           for _ in carts]
+            publish_counters(store_class, counters, slot)
+            connection.send(results)
+    finally:
+        counters.release()
+        counters_memory.close()
+        connection.close()
+
+
+class ShardedStore:
+    """Store partitioned by product name hash over worker processes.
+    Each shard owns its products in its own interpreter, so orders on
+    different shards run on different cores. Carts are split by shard
+    and committed in parallel; every shard part is all-or-nothing, but
+    a cart spanning several shards may be partially bought, like
+    Store.order. Stock aggregates are read lock free from shared memory.
+    """
+    def __init__(self, products_list: list, shards=None):
+        """Initiate store, starting one worker process per shard.
+        Products are copied to the workers, so the given product objects
+        are not updated by orders."""
+        self.shards = shards or os.cpu_count() or 1
+        self.counters_memory = shared_memory.SharedMemory(
+            create=True, size=8 * COUNTERS_PER_SHARD * self.shards)
+        self.counters = self.counters_memory.buf.cast("q")
+        partitions = [[] for _ in range(self.shards)]
+        for product in products_list:
+            partitions[shard_of(product.name, self.shards)].append(
+                product.to_dict())
+        self.connections = []
+        self.workers = []
+        for index, product_rows in enumerate(partitions):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=run_shard, daemon=True,
+                args=(index, product_rows, self.counters_memory.name,
+                      worker_connection))
+            worker.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.workers.append(worker)
+        # Wait until every shard loaded its products
+        self.order_many([])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stops the workers and frees the shared counters"""
+        if not self.workers:
+            return
+        for connection in self.connections:
+            with contextlib.suppress(OSError):
+                connection.send(None)
+        for worker, connection in zip(self.workers, self.connections):
+            worker.join()
+            connection.close()
+        self.workers = []
+        del self.counters
+        self.counters_memory.close()
+        self.counters_memory.unlink()
+
+    def get_total_quantity(self) -> int:
+        """Returns how many items are in the store in total."""
+        return sum(self.counters[slot] for slot in
+                   range(0, len(self.counters), COUNTERS_PER_SHARD))
+
+    def get_active_count(self) -> int:
+        """Returns how many products in the store are active."""
+        return sum(self.counters[slot] for slot in
+                   range(1, len(self.counters), COUNTERS_PER_SHARD))
+
+    def order_many(self, shopping_lists: List[List[tuple]]) \
+            -> List[OrderResult]:
+        """Commits many shopping lists of (product name, quantity) tuples.
+        Each list is split by shard and every shard commits its parts of
+        all the lists as one group. Returns one OrderResult per list, with
+        lines of (product name, quantity, price in cents). A failed shard
+        part only adds errors, the other parts of the list stay bought.
+        """
+        parts = [[] for _ in range(self.shards)]
+        owners = [[] for _ in range(self.shards)]
+        for position, shopping_list in enumerate(shopping_lists):
+            carts = {}
+            for name, quantity in shopping_list:
+                carts.setdefault(shard_of(name, self.shards), []).append(
+                    (name, quantity))
+            for shard, cart in carts.items():
+                parts[shard].append(cart)
+                owners[shard].append(position)
+
+        # Send everything first, so all shards work at the same time
+        for connection, carts in zip(self.connections, parts):
+            connection.send(carts)
+        lines = [[] for _ in shopping_lists]
+        errors = [[] for _ in shopping_lists]
+        for connection, positions in zip(self.connections, owners):
+            for position, (cart_lines, cart_errors) in \
+                    zip(positions, connection.recv()):
+                lines[position].extend(cart_lines)
+                errors[position].extend(cart_errors)
+        return [OrderResult(order_lines, order_errors)
+                for order_lines, order_errors in zip(lines, errors)]
+
+    def order(self, shopping_list: List[tuple]) -> float:
+        """Buys a shopping list of (product name, quantity) tuples and
+        returns the total price of what was bought.
+        In case of a problem, prints the error."""
+        result = self.order_many([shopping_list])[0]
+        for error in result.errors:
+            print(f"Error while processing the order! {error}")
+        return to_dollars(result.total_cents)
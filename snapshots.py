@@ -0,0 +1,176 @@
+import threading
+from collections import namedtuple
+from typing import Iterator, List
+
+# Number of products per snapshot chunk. Publishing copies the chunks of
+# the changed products only, the others are shared with older snapshots.
+CHUNK_SIZE = 256
+
+# Product fields reported by change notifications
+SNAPSHOT_FIELDS = ("quantity", "active", "price", "promotion")
+
+
+class ProductSnapshot(namedtuple("ProductSnapshot", [
+        "product_id", "name", "price", "quantity", "active", "promotion",
+        "max_per_order", "product"])):
+    """Immutable copy of a product's state at publish time.
+    product is the live product, to be used when ordering. Snapshots can
+    be priced with the pricing functions just like products.
+    """
+    __slots__ = ()
+
+    @property
+    def price_cents(self) -> int:
+        """Unit price in integer cents"""
+        return self.price * 100
+
+    def is_active(self) -> bool:
+        """Returns True if the product was active"""
+        return self.active
+
+    def show(self) -> str:
+        """Returns a string that represents the product, like its show"""
+        return type(self.product).show(self)
+
+    @classmethod
+    def from_product(cls, product, product_id):
+        """Captures the current state of a product"""
+        return cls(product_id, product.name, product.price, product.quantity,
+                   product.active, product.promotion,
+                   getattr(product, "max_per_order", None), product)
+
+
+class CatalogSnapshot:
+    """Immutable, versioned view of a store catalog.
+    Products are kept in fixed size chunk tuples indexed by product id,
+    along with the total quantity and active count of the snapshot.
+    """
+    def __init__(self, version, chunks: tuple, size, total_quantity,
+                 active_count):
+        """Initiate snapshot from its chunks and aggregates"""
+        self.version = version
+        self.chunks = chunks
+        self.size = size
+        self.total_quantity = total_quantity
+        self.active_count = active_count
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self) -> Iterator[ProductSnapshot]:
+        """Iterates the products in product id order"""
+        return self.iter_after(0)
+
+    def iter_after(self, product_id) -> Iterator[ProductSnapshot]:
+        """Iterates the products with an id greater than product_id, in
+        product id order, starting at the chunk of product_id"""
+        chunk_index, offset = divmod(product_id + 1, CHUNK_SIZE)
+        for chunk in self.chunks[chunk_index:]:
+            for record in chunk[offset:]:
+                if record is not None:
+                    yield record
+            offset = 0
+
+    def get(self, product_id) -> ProductSnapshot:
+        """Returns the product with the given id, or None"""
+        if not 0 <= product_id < len(self.chunks) * CHUNK_SIZE:
+            return None
+        return self.chunks[product_id // CHUNK_SIZE][product_id % CHUNK_SIZE]
+
+    def get_all_products(self) -> List[ProductSnapshot]:
+        """Returns all products that were active"""
+        return [record for record in self if record.active]
+
+
+class SnapshotPublisher:
+    """Store listener that publishes copy on write catalog snapshots.
+    The products changed under the stock locks of a store batch, like an
+    order, are captured and published together when the batch ends, while
+    its locks are still held. Other changes are published on their own,
+    under the stock lock of their product. A snapshot so never shows part
+    of a batch, and readers take the current one without any lock.
+    The publisher registers itself as the store snapshot publisher.
+    """
+    def __init__(self, store_class):
+        """Initiate publisher with a snapshot of the whole store, and
+        start listening to its changes"""
+        self.store = store_class
+        self.lock = threading.Lock()
+        self.current = CatalogSnapshot(0, (), 0, 0, 0)
+        with store_class.lock_products(store_class.products_list), \
+                store_class.aggregate_lock:
+            store_class.snapshots = self
+            store_class.add_listener(self)
+            products = {store_class.get_product_id(product): product
+                        for product in store_class.catalog}
+            self.publish(products)
+
+    def _changed(self, product, product_id, removed=False):
+        """Adds a change to the batch of the current thread holding the
+        product stock lock, or publishes it under that lock"""
+        if not self.store.record_change(product, product_id, removed):
+            with self.store.lock_products((product,)):
+                self.store.record_change(product, product_id, removed)
+
+    def product_added(self, product, product_id):
+        self._changed(product, product_id)
+
+    def product_removed(self, product, product_id):
+        self._changed(product, product_id, removed=True)
+
+    def product_changed(self, product, field, old_value, new_value):
+        if field not in SNAPSHOT_FIELDS:
+            return
+        try:
+            product_id = self.store.get_product_id(product)
+        except KeyError:
+            return
+        self._changed(product, product_id)
+
+    def publish(self, products: dict):
+        """Publishes the current state of the given products by id, None
+        for removed ones. The stock locks of the products must be held,
+        so their state is consistent."""
+        records = {product_id: None if product is None else
+                   ProductSnapshot.from_product(product, product_id)
+                   for product_id, product in products.items()}
+        with self.lock:
+            self._apply(records)
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Returns the current snapshot"""
+        return self.current
+
+    def _apply(self, records: dict):
+        """Builds and publishes the next snapshot from the given product
+        snapshots by id, None for removed ones. Only the chunks of the
+        changed products are copied, the others are shared. The publisher
+        lock must be held."""
+        old = self.current
+        chunks = list(old.chunks)
+        edited = {}
+        size = old.size
+        total_quantity = old.total_quantity
+        active_count = old.active_count
+        for product_id, record in records.items():
+            chunk_index, offset = divmod(product_id, CHUNK_SIZE)
+            if chunk_index >= len(chunks):
+                chunks.extend((None,) * CHUNK_SIZE for _ in
+                              range(chunk_index + 1 - len(chunks)))
+            if chunk_index not in edited:
+                edited[chunk_index] = list(chunks[chunk_index])
+            chunk = edited[chunk_index]
+            previous = chunk[offset]
+            if previous is not None:
+                size -= 1
+                total_quantity -= previous.quantity
+                active_count -= previous.active
+            if record is not None:
+                size += 1
+                total_quantity += record.quantity
+                active_count += record.active
+            chunk[offset] = record
+        for chunk_index, chunk in edited.items():
+            chunks[chunk_index] = tuple(chunk)
+        self.current = CatalogSnapshot(old.version + 1, tuple(chunks), size,
+                                       total_quantity, active_count)
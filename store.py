@@ -1,30 +1,445 @@
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from time import perf_counter
 from typing import List, Dict
+import metrics
+from catalog import Catalog
+from ledger import OrderLedger
+from money import to_dollars
+from pricing import price_sale_lines, PriceCache
+from products import (NonStockedProduct, validate_positive_number,
+                      validate_type)
+from promotions import Promotion
+from search import SearchIndex, SearchResult
+from snapshots import CatalogSnapshot, SnapshotPublisher
+
+# Number of stock locks, products are spread over them by hash
+LOCK_STRIPES = 64
+# Fields a bulk update row can change
+UPDATE_FIELDS = ("quantity", "price", "promotion", "active")
+# Only this many failed rows are kept in an update report
+MAX_REPORTED_ERRORS = 1000
+# Bulk updates changing more prices than this rebuild the price index
+# once, instead of moving every changed product in it
+PRICE_INDEX_REBUILD = 64
+
+
+class OrderResult:
+    """Result of an all-or-nothing order.
+    Holds the purchased lines as (product, quantity, price in cents)
+    tuples, or the error messages that caused the whole order to be
+    rejected.
+    """
+    def __init__(self, lines: List[tuple], errors: List[str]):
+        """Initiate result with purchased lines and errors"""
+        self.lines = lines
+        self.errors = errors
+
+    @property
+    def success(self) -> bool:
+        """True if the order was committed"""
+        return not self.errors
+
+    @property
+    def total_cents(self) -> int:
+        """Total price in cents of the committed order, 0 if rejected"""
+        return sum(price for _, _, price in self.lines)
+
+    @property
+    def total(self) -> float:
+        """Total price of the committed order, 0 if it was rejected"""
+        return to_dollars(self.total_cents)
+
+
+class Quote:
+    """Price breakdown of a shopping list, computed without buying.
+    Holds (product, quantity, list price, price) tuples, one per product,
+    with prices in integer cents.
+    """
+    def __init__(self, lines: List[tuple]):
+        """Initiate quote with its priced lines"""
+        self.lines = lines
+
+    @property
+    def list_total_cents(self) -> int:
+        """Total price in cents before promotions"""
+        return sum(list_price for _, _, list_price, _ in self.lines)
+
+    @property
+    def total_cents(self) -> int:
+        """Total price in cents after promotions"""
+        return sum(price for _, _, _, price in self.lines)
+
+    @property
+    def list_total(self) -> float:
+        """Total price before promotions"""
+        return to_dollars(self.list_total_cents)
+
+    @property
+    def total(self) -> float:
+        """Total price after promotions"""
+        return to_dollars(self.total_cents)
+
+    @property
+    def discount(self) -> float:
+        """Total amount saved by promotions"""
+        return to_dollars(self.list_total_cents - self.total_cents)
+
+
+class UpdateReport:
+    """Summary of a bulk update, with the rows that failed"""
+    def __init__(self):
+        """Initiate empty report"""
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row_number, message):
+        """Records a failed row, keeping at most MAX_REPORTED_ERRORS"""
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, message))
 
 
 class Store:
     """Store class that holds current stock of available product items"""
     def __init__(self, products_list: list):
-        """Initiate class sets products list in the store class"""
-        self.products_list = products_list
+        """Initiate class sets products list in the store class.
+        Keeps a running total quantity and the set of active products,
+        which are updated by the products themselves on every change.
+        Stock changes made through order are guarded by striped per-product
+        locks, so orders on disjoint products don't block each other.
+        """
+        self.catalog = Catalog()
+        self.total_quantity = 0
+        self.active_products = {}
+        self.aggregate_lock = threading.Lock()
+        self.stock_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.held = threading.local()
+        self.listeners = []
+        self.price_cache = PriceCache()
+        self.snapshots = None
+        self.ledger = None
+        self.reservations = None
+        self.search_index = None
+        self.deferred_prices = None
+        with self.catalog.deferred_price_index():
+            for product in products_list:
+                self.add_product(product)
+
+    def add_listener(self, listener):
+        """Registers a listener for changes of the store contents.
+        The listener must implement product_added(product, product_id),
+        product_removed(product, product_id) and
+        product_changed(product, field, old, new).
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Unregisters a previously added listener"""
+        self.listeners.remove(listener)
 
-    def add_product(self, product):
-        """Adds a product to store products_list"""
-        self.products_list.append(product)
+    def add_product(self, product, product_id=None) -> int:
+        """Adds a product to store products_list and returns its id"""
+        with self.aggregate_lock:
+            product_id = self.catalog.add(product, product_id)
+            self.total_quantity += product.get_quantity()
+            if product.is_active():
+                self.active_products[product] = None
+        product.add_observer(self)
+        for listener in self.listeners:
+            listener.product_added(product, product_id)
+        return product_id
 
     def remove_product(self, product):
         """Removes a product from store products_list"""
-        self.products_list.remove(product)
+        with self.aggregate_lock:
+            product_id = self.catalog.remove(product)
+            product.remove_observer(self)
+            self.total_quantity -= product.get_quantity()
+            self.active_products.pop(product, None)
+        for listener in self.listeners:
+            listener.product_removed(product, product_id)
+
+    def product_changed(self, product, field, old_value, new_value):
+        """Observer callback, keeps store aggregates in sync with products"""
+        with self.aggregate_lock:
+            if field == "quantity":
+                self.total_quantity += new_value - old_value
+            elif field == "active":
+                if new_value:
+                    self.active_products[product] = None
+                else:
+                    self.active_products.pop(product, None)
+            elif field == "price":
+                if self.deferred_prices is not None:
+                    self.deferred_prices.append((product, old_value,
+                                                 new_value))
+                else:
+                    self.catalog.update_price(product, old_value, new_value)
+        for listener in self.listeners:
+            listener.product_changed(product, field, old_value, new_value)
+
+    def enable_snapshots(self) -> SnapshotPublisher:
+        """Starts publishing copy on write catalog snapshots, if not
+        already done, and returns the snapshot publisher"""
+        if self.snapshots is None:
+            self.snapshots = SnapshotPublisher(self)
+        return self.snapshots
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Returns an immutable snapshot of the catalog, for listing and
+        reporting without blocking orders. Every batch of changes made
+        under the stock locks is published as a whole, so a snapshot
+        never shows part of an order."""
+        return self.enable_snapshots().snapshot()
+
+    def record_change(self, product, product_id, removed=False) -> bool:
+        """Adds a changed product to the innermost lock_products batch of
+        the current thread holding its stock lock, to be published with
+        the batch. Returns False if the thread doesn't hold the lock."""
+        stripe = hash(product) % LOCK_STRIPES
+        for stripes, changes in reversed(self._held_batches()):
+            if stripe in stripes:
+                changes[product_id] = None if removed else product
+                return True
+        return False
+
+    def _held_batches(self) -> list:
+        """Returns the (stripes, changes) batches of the lock_products
+        calls of the current thread, innermost last"""
+        batches = getattr(self.held, "batches", None)
+        if batches is None:
+            batches = self.held.batches = []
+        return batches
+
+    def get_reserved(self, product) -> int:
+        """Returns how many items of a product are held by the store
+        reservation manager, 0 without one"""
+        if self.reservations is None:
+            return 0
+        return self.reservations.get_reserved(product)
+
+    def check_available(self, product, quantity):
+        """Checks a quantity of a product can be bought, like
+        check_withdraw, from the stock not held by reservations.
+        In case of a problem, raises an Exception."""
+        product.check_withdraw(quantity)
+        reserved = self.get_reserved(product)
+        if reserved and quantity > product.quantity - reserved:
+            if metrics.ENABLED:
+                metrics.STOCK_OUTS.inc()
+            raise ValueError(f"Insufficient stock of {product.name}")
+
+    def enable_ledger(self) -> OrderLedger:
+        """Starts recording committed order lines, if not already done,
+        and returns the order ledger"""
+        if self.ledger is None:
+            self.ledger = OrderLedger(self)
+        return self.ledger
+
+    def record_sales(self, lines: List[tuple]):
+        """Records committed lines in the order ledger, if it is enabled.
+        Lines are SaleLine tuples, priced while the stock locks of the
+        order were held."""
+        if self.ledger is not None and lines:
+            self.ledger.record(lines)
+
+    @contextmanager
+    def lock_products(self, products):
+        """Context manager that holds the stock locks of the given products.
+        Locks are always taken in ascending stripe order, so concurrent
+        multi-product orders can't deadlock. The products changed while
+        the locks are held are published to the snapshots together,
+        before the locks are released.
+        """
+        stripes = sorted({hash(product) % LOCK_STRIPES
+                          for product in products})
+        for stripe in stripes:
+            self.stock_locks[stripe].acquire()
+        batches = self._held_batches()
+        changes = {}
+        batches.append((set(stripes), changes))
+        try:
+            yield
+        finally:
+            batches.pop()
+            if changes and self.snapshots is not None:
+                self.snapshots.publish(changes)
+            for stripe in reversed(stripes):
+                self.stock_locks[stripe].release()
+
+    @property
+    def products_list(self) -> List:
+        """Returns all products in the store, in the order they were added"""
+        return list(self.catalog)
+
+    def bulk_update(self, updates) -> UpdateReport:
+        """Applies many product changes in a single validated pass.
+        Every update is a dict referencing a product by "id" or "name",
+        with any of the new "quantity", "price", "promotion" (a promotion
+        or None) and "active" values. The products of the rows are looked
+        up first, then under their stock locks all rows are validated, so
+        no order changes the stock they were validated against, bad rows
+        are skipped and reported, and the valid ones are applied without
+        validating again.
+        Products going from 0 to positive stock are reactivated, and
+        products reaching 0 are deactivated, unless the row sets active.
+        """
+        report = UpdateReport()
+        changes = []
+        quantities = {}
+        rows = []
+        for update in updates:
+            try:
+                rows.append((update, self._update_product(update), None))
+            except (ValueError, TypeError) as error:
+                rows.append((update, None, error))
+        with self.lock_products({product for _, product, _ in rows
+                                 if product is not None}):
+            for row_number, (update, product, error) in enumerate(rows):
+                if error is None:
+                    try:
+                        changes.append(self._validate_update(
+                            update, product, quantities))
+                    except (ValueError, TypeError) as validation_error:
+                        error = validation_error
+                if error is not None:
+                    report.add_error(row_number,
+                                     str(error) or "Invalid field type")
+            with self.aggregate_lock:
+                self.deferred_prices = []
+            try:
+                for product, fields in changes:
+                    self._apply_update(product, fields)
+            finally:
+                with self.aggregate_lock:
+                    deferred, self.deferred_prices = \
+                        self.deferred_prices, None
+                    if len(deferred) > PRICE_INDEX_REBUILD:
+                        self.catalog.rebuild_price_index()
+                    else:
+                        for product, old_price, new_price in deferred:
+                            self.catalog.update_price(product, old_price,
+                                                      new_price)
+        report.updated = len(changes)
+        return report
+
+    def _update_product(self, update):
+        """Returns the product a bulk update row refers to.
+        Raises ValueError if the row is not a dict or the product is
+        unknown."""
+        if not isinstance(update, dict):
+            raise ValueError("Update is not a dict")
+        if "id" in update:
+            product = self.get_product_by_id(update["id"])
+        else:
+            product = self.get_product(update.get("name"))
+        if product is None:
+            raise ValueError(f"Unknown product "
+                             f"{update.get('id', update.get('name'))!r}")
+        return product
+
+    @staticmethod
+    def _validate_update(update, product, quantities) -> tuple:
+        """Returns the product and fields of a bulk update row.
+        quantities holds the stock set by the rows validated before.
+        The stock lock of the product must be held.
+        Raises ValueError or TypeError if the row is invalid."""
+        fields = {field: value for field, value in update.items()
+                  if field not in ("id", "name")}
+        for field in fields:
+            if field not in UPDATE_FIELDS:
+                raise ValueError(f"Unknown field {field!r}")
+        for field in ("quantity", "price"):
+            if field in fields:
+                validate_type(fields[field], int)
+                validate_positive_number(fields[field])
+        if "quantity" in fields and isinstance(product, NonStockedProduct):
+            raise ValueError(f"{product.name} doesn't track quantity")
+        if fields.get("promotion") is not None:
+            validate_type(fields["promotion"], Promotion)
+        quantity = fields.get("quantity",
+                              quantities.get(product, product.quantity))
+        if "active" in fields:
+            validate_type(fields["active"], bool)
+            if fields["active"] and not quantity \
+                    and not isinstance(product, NonStockedProduct):
+                raise ValueError(f"{product.name} can't be active "
+                                 f"without stock")
+        quantities[product] = quantity
+        return product, fields
+
+    @staticmethod
+    def _apply_update(product, fields):
+        """Applies validated fields to a product and notifies its
+        observers, which keep the aggregates and indexes in sync"""
+        if "price" in fields:
+            product.price = fields["price"]
+        if "promotion" in fields:
+            product.set_promotion(fields["promotion"])
+        active = fields.get("active")
+        if "quantity" in fields and fields["quantity"] != product.quantity:
+            old_quantity = product.quantity
+            product.quantity = fields["quantity"]
+            if active is None and not (old_quantity and product.quantity):
+                active = bool(product.quantity)
+        if active:
+            product.activate()
+        elif active is not None:
+            product.deactivate()
+
+    def get_product(self, name):
+        """Returns the product with the given name, or None"""
+        return self.catalog.get_by_name(name)
+
+    def get_product_by_id(self, product_id):
+        """Returns the product with the given stable id, or None"""
+        return self.catalog.get_by_id(product_id)
+
+    def get_product_id(self, product) -> int:
+        """Returns the stable id of a product in the store"""
+        return self.catalog.get_id(product)
+
+    def get_products_in_price_range(self, min_price, max_price) -> List:
+        """Returns active products priced between min_price and max_price,
+        ordered by price."""
+        return [product
+                for product in self.catalog.price_range(min_price, max_price)
+                if product in self.active_products]
+
+    def search(self, **query) -> SearchResult:
+        """Returns a page of products matching a query, see
+        SearchIndex.search for the filters, sorting and paging.
+        The search indexes are built on first use and maintained on
+        every change afterwards."""
+        if self.search_index is None:
+            self.search_index = SearchIndex(self)
+        return self.search_index.search(**query)
+
+    def get_products_page(self, after_id, limit) -> List[tuple]:
+        """Returns up to limit (id, product) pairs of active products in
+        id order, with ids greater than after_id, the last id of the
+        previous page. Products are read from a catalog snapshot, so
+        pages are consistent."""
+        active = (record for record in self.snapshot().iter_after(after_id)
+                  if record.active)
+        return [(record.product_id, record)
+                for record in islice(active, limit)]
 
     def get_total_quantity(self) -> int:
         """Returns how many items are in the store in total."""
-        total_quantity = 0
-        for product in self.products_list:
-            total_quantity += product.get_quantity()
-        return total_quantity
+        return self.total_quantity
 
     def get_all_products(self) -> List:
         """Returns all products in the store that are active."""
-        return [product for product in self.products_list if product.active]
+        with self.aggregate_lock:
+            return list(self.active_products)
+
+    def get_active_count(self) -> int:
+        """Returns how many products in the store are active."""
+        return len(self.active_products)
 
     def generate_order_dict(self, shopping_list: List[tuple]) -> Dict:
         """Generate and return a final shopping dictionary from shopping list,
@@ -42,15 +457,80 @@ class Store:
         Product (Product class) and quantity (int).
         Buys the products and returns the total price of the order.
         In case of a problem, prints the error.
+        Safe to call from several threads sharing the store.
         """
-        total_cost = 0
+        start = perf_counter() if metrics.ENABLED else None
+        purchased = []
         shopping_dict = self.generate_order_dict(shopping_list)
-        for product, quantity in shopping_dict.items():
-            try:
-                buy_price = product.buy(quantity)
-                print(f"{product.name} was successfully purchased.")
-            except ValueError as error:
-                print(f"Error while processing the order! {error}")
-                break
-            total_cost += buy_price
+        with self.lock_products(shopping_dict):
+            for product, quantity in shopping_dict.items():
+                try:
+                    self.check_available(product, quantity)
+                    product.withdraw(quantity)
+                    print(f"{product.name} was successfully purchased.")
+                except ValueError as error:
+                    print(f"Error while processing the order! {error}")
+                    break
+                purchased.append((product, quantity))
+            sales = price_sale_lines(purchased)
+        self.record_sales(sales)
+        total_cost = to_dollars(sum(line.cents for line in sales))
+        if start is not None:
+            metrics.ORDERS.inc()
+            metrics.ORDER_SECONDS.observe(perf_counter() - start)
         return total_cost
+
+    def checkout(self, shopping_list: List[tuple]) -> OrderResult:
+        """Atomic version of order. Validates stock, active state and
+        per order limits of the whole aggregated cart first, and only if
+        every line is valid takes all of it out of stock.
+        Returns an OrderResult instead of printing, nothing is bought
+        if any line fails.
+        """
+        start = perf_counter() if metrics.ENABLED else None
+        shopping_dict = self.generate_order_dict(shopping_list)
+        errors = []
+        with self.lock_products(shopping_dict):
+            buy_start = perf_counter() if metrics.ENABLED else None
+            for product, quantity in shopping_dict.items():
+                try:
+                    self.check_available(product, quantity)
+                except (ValueError, TypeError) as error:
+                    errors.append(str(error) or f"Invalid quantity "
+                                                f"for {product.name}")
+            if not errors:
+                for product, quantity in shopping_dict.items():
+                    product.set_quantity(product.quantity - quantity)
+                if buy_start is not None:
+                    metrics.record_buys(len(shopping_dict), buy_start)
+                sales = price_sale_lines(list(shopping_dict.items()))
+        if errors:
+            result = OrderResult([], errors)
+        else:
+            result = OrderResult([(line.product, line.quantity, line.cents)
+                                  for line in sales], [])
+            self.record_sales(sales)
+        if start is not None:
+            metrics.ORDERS.inc()
+            if errors:
+                metrics.ORDERS_REJECTED.inc()
+            metrics.ORDER_SECONDS.observe(perf_counter() - start)
+        return result
+
+    def quote(self, shopping_list: List[tuple], snapshot=None) -> Quote:
+        """Returns the price breakdown of a shopping list without buying
+        anything. Quantities of the same product are aggregated like in
+        order, and promoted prices are served from the store price cache.
+        If a catalog snapshot is given, products are priced as they are
+        in the snapshot instead of their live state.
+        """
+        lines = list(self.generate_order_dict(shopping_list).items())
+        priced = lines
+        if snapshot is not None:
+            priced = [(snapshot.get(self.get_product_id(product)), quantity)
+                      for product, quantity in lines]
+        prices = self.price_cache.price_lines_cents(priced)
+        return Quote([(product, quantity, record.price_cents * quantity,
+                       price)
+                      for (product, quantity), (record, _), price
+                      in zip(lines, priced, prices)])
@@ -0,0 +1,69 @@
+import threading
+from batching import commit_orders, OrderBatcher
+
+
+PRODUCTS = ("Google Pixel 7", "Windows License", "Shipping")
+STOCK = {"Google Pixel 7": 5}
+
+
+def test_commit_orders_arrival_order(make_store):
+    best_buy, product_list = make_store(*PRODUCTS, quantities=STOCK)
+    pixel, license_, shipping = product_list
+    results = commit_orders(best_buy, [[(pixel, 3), (shipping, 1)],
+                                       [(pixel, 3)],
+                                       [(pixel, 2), (license_, 4)],
+                                       [(shipping, 2)]])
+    assert [result.success for result in results] == [True, False,
+                                                      True, False]
+    assert results[0].total == 1510
+    assert results[2].total == 1500
+    assert pixel.quantity == 0
+    assert pixel.active is False
+    assert shipping.quantity == 249
+    assert best_buy.get_total_quantity() == 249
+
+
+def test_commit_orders_malformed_cart(make_store):
+    best_buy, (pixel, license_, _) = make_store(*PRODUCTS, quantities=STOCK)
+    results = commit_orders(best_buy, [[(pixel, 1)], [(pixel, None)],
+                                       [(pixel, "2")], [(license_, 1)],
+                                       [(pixel, 1.5)], [(pixel, 2)]])
+    assert [result.success for result in results] == [True, False, False,
+                                                      True, False, True]
+    assert all(result.errors for result in results[1:3])
+    assert pixel.quantity == 2
+
+
+def test_order_batcher_malformed_cart(make_store):
+    best_buy, (pixel, _, _) = make_store(*PRODUCTS, quantities=STOCK)
+    with OrderBatcher(best_buy, window=0.05) as batcher:
+        futures = [batcher.submit([(pixel, 1)]),
+                   batcher.submit([(pixel, "1")]),
+                   batcher.submit([(pixel, 1)])]
+        results = [future.result(timeout=5) for future in futures]
+    assert [result.success for result in results] == [True, False, True]
+    assert pixel.quantity == 3
+
+
+def test_order_batcher_groups_orders(make_store):
+    best_buy, product_list = make_store(*PRODUCTS, quantities=STOCK)
+    pixel = product_list[0]
+    results = []
+    with OrderBatcher(best_buy, window=0.05) as batcher:
+        threads = [threading.Thread(
+            target=lambda: results.append(batcher.order([(pixel, 1)])))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert sum(result.success for result in results) == 5
+    assert pixel.quantity == 0
+
+
+def test_order_batcher_flushes_on_close(make_store):
+    best_buy, product_list = make_store(*PRODUCTS, quantities=STOCK)
+    batcher = OrderBatcher(best_buy, window=10)
+    future = batcher.submit([(product_list[0], 2)])
+    batcher.close()
+    assert future.result().total == 1000
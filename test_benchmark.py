@@ -0,0 +1,21 @@
+from benchmark import make_catalog, run_benchmarks, compare
+
+
+def test_make_catalog_is_reproducible():
+    first = make_catalog(200, seed=3)
+    second = make_catalog(200, seed=3)
+    assert len(first.products_list) == 200
+    assert [product.to_dict() for product in first.products_list] == \
+        [product.to_dict() for product in second.products_list]
+
+
+def test_run_benchmarks_report(monkeypatch):
+    monkeypatch.setattr("benchmark.measure", lambda func: (
+        func(), {"calls": 1, "seconds": 1.0, "ops_per_sec": 1.0})[1])
+    report = run_benchmarks([50], memory=True)
+    names = {result["benchmark"] for result in report["results"]}
+    assert {"get_total_quantity", "get_all_products", "order[5]",
+            "generate_order_dict[25]", "Product.buy",
+            "ThirdOneFree.apply_promotion"} <= names
+    assert report["memory"][0]["peak_bytes"] > 0
+    assert all(ratio == 1.0 for _, _, ratio in compare(report, report))
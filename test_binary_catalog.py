@@ -0,0 +1,84 @@
+import pytest
+from binary_catalog import BinaryCatalogSource, write_binary_catalog
+from lazy_catalog import LazyStore
+from products import Product, NonStockedProduct, LimitedProduct
+from promotions import SecondHalfPrice, PercentDiscount
+from store import Store
+
+
+def write_catalog(path, size=100):
+    promotion = SecondHalfPrice("Second Half price!")
+    product_list = [Product(f"Product {i:03}", price=i + 1, quantity=10)
+                    for i in range(size)]
+    product_list[1].set_promotion(promotion)
+    product_list[2].deactivate()
+    product_list.append(NonStockedProduct("Windows License", price=125))
+    product_list.append(LimitedProduct("Shipping", price=10, quantity=250,
+                                       maximum=1))
+    product_list.append(Product("Café ☕", price=4, quantity=20))
+    product_list[-1].set_promotion(PercentDiscount("30% off!", percent=30))
+    store = Store(product_list)
+    store.remove_product(product_list[size // 2])
+    assert write_binary_catalog(store, path) == size + 2
+    return store
+
+
+def test_binary_store_round_trip(tmp_path):
+    path = str(tmp_path / "catalog.bin")
+    original = write_catalog(path)
+    store = LazyStore(path, cache_size=10)
+    assert len(store.catalog) == 102
+    assert store.get_total_quantity() == original.get_total_quantity()
+    assert store.get_active_count() == 101
+    assert store.catalog.resident == {}
+    for product in original.catalog:
+        loaded = store.get_product(product.name)
+        assert loaded.to_dict() == product.to_dict()
+        assert store.get_product_id(loaded) == \
+            original.get_product_id(product)
+    assert store.get_product("Product 050") is None
+    assert store.get_product_by_id(51) is None
+    assert store.get_product("Product 051") is store.get_product_by_id(52)
+    assert store.get_product("Shipping").max_per_order == 1
+    assert store.get_product_by_id(2).promotion is \
+        store.get_product_by_id(2).promotion
+    assert [product_id for product_id, _
+            in store.get_products_page(1, 3)] == [2, 4, 5]
+    store.close()
+
+
+def test_binary_store_orders(tmp_path):
+    path = str(tmp_path / "catalog.bin")
+    write_catalog(path)
+    store = LazyStore(path, cache_size=10)
+    assert store.order([(store.get_product_by_id(2), 2),
+                        (store.get_product("Café ☕"), 10)]) == 31
+    assert store.get_product_by_id(2).quantity == 8
+    assert store.get_total_quantity() == 1248
+    write_binary_catalog(store, path)
+    store.close()
+    store = LazyStore(path)
+    assert store.get_product_by_id(2).quantity == 8
+    assert store.get_total_quantity() == 1248
+    store.close()
+
+
+def test_shared_source(tmp_path):
+    path = str(tmp_path / "catalog.bin")
+    write_catalog(path, size=5)
+    first, second = BinaryCatalogSource(path), BinaryCatalogSource(path)
+    assert first.size == second.size == 7
+    assert first.index_of(8) == 6
+    assert first.index_of(3) is None
+    assert [second.name_at(position)[0] for position in range(3)] == \
+        ["Café ☕", "Product 000", "Product 001"]
+    first.close()
+    assert second.load(0).name == "Product 000"
+    second.close()
+
+
+def test_not_a_binary_catalog(tmp_path):
+    path = tmp_path / "catalog.bin"
+    path.write_bytes(b"{}\n")
+    with pytest.raises(ValueError):
+        BinaryCatalogSource(str(path))
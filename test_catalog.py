@@ -0,0 +1,91 @@
+import random
+import pytest
+import catalog as catalog_module
+from catalog import Catalog, PriceIndex
+from products import Product, NonStockedProduct
+
+
+def test_catalog_stable_ids():
+    catalog = Catalog()
+    first = Product("MacBook Air M2", price=1450, quantity=100)
+    second = Product("Google Pixel 7", price=500, quantity=250)
+    assert catalog.add(first) == 1
+    assert catalog.add(second) == 2
+    catalog.remove(first)
+    third = NonStockedProduct("Windows License", price=125)
+    assert catalog.add(third) == 3
+    assert catalog.get_id(second) == 2
+    assert list(catalog) == [second, third]
+
+
+def test_catalog_lookup():
+    catalog = Catalog()
+    product = Product("MacBook Air M2", price=1450, quantity=100)
+    product_id = catalog.add(product)
+    assert catalog.get_by_name("MacBook Air M2") is product
+    assert catalog.get_by_id(product_id) is product
+    assert product_id in catalog
+    catalog.remove(product)
+    assert catalog.get_by_name("MacBook Air M2") is None
+    assert product_id not in catalog
+
+
+def test_catalog_duplicates_and_missing():
+    catalog = Catalog()
+    product = Product("MacBook Air M2", price=1450, quantity=100)
+    catalog.add(product)
+    with pytest.raises(ValueError):
+        catalog.add(product)
+    with pytest.raises(ValueError):
+        catalog.add(Product("MacBook Air M2", price=10, quantity=1))
+    with pytest.raises(ValueError):
+        catalog.remove(Product("Other", price=10, quantity=1))
+
+
+def test_catalog_price_range():
+    catalog = Catalog()
+    product_list = [Product("MacBook Air M2", price=1450, quantity=100),
+                    Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                    Product("Google Pixel 7", price=500, quantity=250),
+                    NonStockedProduct("Windows License", price=125)]
+    for product in product_list:
+        catalog.add(product)
+    assert catalog.price_range(100, 500) == [product_list[3],
+                                             product_list[1],
+                                             product_list[2]]
+    catalog.update_price(product_list[0], 1450, 300)
+    product_list[0].price = 300
+    assert catalog.price_range(260, 1000) == [product_list[0],
+                                              product_list[2]]
+
+
+def test_price_index_matches_sorted_list(monkeypatch):
+    monkeypatch.setattr(catalog_module, "BLOCK_SIZE", 4)
+    rng = random.Random(0)
+    expected = [(rng.randint(1, 50), product_id)
+                for product_id in range(1, 40)]
+    index = PriceIndex(expected)
+    for product_id in range(40, 400):
+        if expected and rng.random() < 0.4:
+            entry = expected.pop(rng.randrange(len(expected)))
+            index.discard(entry)
+        else:
+            entry = (rng.randint(1, 50), product_id)
+            expected.append(entry)
+            index.add(entry)
+        index.discard((51, 0))
+    expected.sort()
+    assert list(index) == expected
+    assert len(index) == len(expected)
+    assert max(map(len, index.blocks)) <= 8
+    assert list(index.irange((10, 0), (20, 400))) == \
+        [entry for entry in expected if 10 <= entry[0] <= 20]
+    assert list(index.irange((60, 0), (70, 400))) == []
+
+
+def test_store_builds_price_index_once(make_store):
+    store, product_list = make_store()
+    assert list(store.catalog.price_index) == sorted(
+        (product.price, store.get_product_id(product))
+        for product in product_list)
+    assert not store.catalog.price_index_deferred
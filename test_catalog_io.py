@@ -0,0 +1,57 @@
+import json
+from catalog_io import import_catalog, export_catalog
+from store import Store
+from products import LimitedProduct, NonStockedProduct
+from promotions import SecondHalfPrice, PercentDiscount
+
+PROMOTIONS = {"Second Half price!": SecondHalfPrice("Second Half price!"),
+              "30% off!": PercentDiscount("30% off!", percent=30)}
+
+
+def test_import_csv_reports_bad_rows(tmp_path):
+    path = tmp_path / "catalog.csv"
+    path.write_text(
+        "type,name,price,quantity,max_per_order,active,promotion\n"
+        "Product,MacBook Air M2,1450,100,,,Second Half price!\n"
+        "NonStockedProduct,Windows License,125,,,true,30% off!\n"
+        "LimitedProduct,Shipping,10,250,1,,\n"
+        "Product,Broken price,abc,1,,,\n"
+        "Product,,10,1,,,\n"
+        "Product,Bad promotion,10,1,,,Free stuff\n"
+        "LimitedProduct,No maximum,10,1,,,\n"
+        "Product,MacBook Air M2,1,1,,,\n"
+        "Product,Inactive,5,3,,false,\n", encoding="utf-8")
+    best_buy = Store([])
+    report = import_catalog(best_buy, path, PROMOTIONS, batch_size=3)
+    assert report.imported == 4
+    assert report.failed == 5
+    assert [row_number for row_number, _ in report.errors] == [5, 6, 7, 8, 9]
+    assert isinstance(best_buy.get_product("Shipping"), LimitedProduct)
+    assert isinstance(best_buy.get_product("Windows License"),
+                      NonStockedProduct)
+    assert best_buy.get_product("MacBook Air M2").promotion is \
+        PROMOTIONS["Second Half price!"]
+    assert best_buy.get_product("Inactive").active is False
+    assert best_buy.get_total_quantity() == 353
+
+
+def test_export_import_round_trip(tmp_path):
+    source = tmp_path / "source.jsonl"
+    rows = [{"name": "MacBook Air M2", "price": 1450, "quantity": 100,
+             "promotion": "Second Half price!"},
+            {"type": "LimitedProduct", "name": "Shipping", "price": 10,
+             "quantity": 250, "max_per_order": 1}]
+    source.write_text("".join(json.dumps(row) + "\n" for row in rows)
+                      + "not json\n", encoding="utf-8")
+    best_buy = Store([])
+    report = import_catalog(best_buy, source, PROMOTIONS)
+    assert report.imported == 2
+    assert report.errors == [(3, "Row is not a JSON object")]
+
+    for file_name in ("export.csv", "export.jsonl"):
+        assert export_catalog(best_buy, tmp_path / file_name) == 2
+        copy = Store([])
+        assert import_catalog(copy, tmp_path / file_name,
+                              PROMOTIONS).failed == 0
+        assert [product.to_dict() for product in copy.products_list] == \
+            [product.to_dict() for product in best_buy.products_list]
@@ -0,0 +1,78 @@
+import io
+import json
+import commands
+from commands import run_commands
+
+
+PRODUCTS = ("MacBook Air M2", "Google Pixel 7", "Windows License")
+STOCK = {"Google Pixel 7": 2}
+
+
+def run(store_class, requests, batch_size=1000):
+    lines = [request if isinstance(request, str) else json.dumps(request)
+             for request in requests]
+    output = io.StringIO()
+    count = run_commands(store_class, lines, output, batch_size)
+    responses = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(responses) == count
+    return responses
+
+
+def test_run_commands_in_order(make_store):
+    order = {"action": "order", "items": [{"product": 2, "quantity": 1}]}
+    responses = run(make_store(*PRODUCTS, quantities=STOCK)[0], [
+        order, {"action": "total"}, order, "", "not json", order,
+        {"action": "quote", "items": [{"product": "Windows License",
+                                       "quantity": 2}]},
+        {"action": "order", "items": [{"product": 9, "quantity": 1}]},
+        [1, 2], {"action": "dance"}])
+    assert responses == [
+        {"ok": True, "total": 500},
+        {"ok": True, "total_quantity": 101},
+        {"ok": True, "total": 500},
+        {"ok": False, "errors": ["Invalid JSON"]},
+        {"ok": False, "errors": ["Insufficient stock of Google Pixel 7"]},
+        {"ok": True, "total": 250, "discount": 0},
+        {"ok": False, "errors": ["Unknown product 9"]},
+        {"ok": False, "errors": ["Unknown action None"]},
+        {"ok": False, "errors": ["Unknown action 'dance'"]}]
+
+
+def test_run_commands_in_batches(make_store):
+    store_class = make_store(*PRODUCTS, quantities=STOCK)[0]
+    order = {"action": "order", "items": [{"product": 1, "quantity": 1}]}
+    responses = run(store_class, [order] * 25, batch_size=10)
+    assert all(response == {"ok": True, "total": 1450}
+               for response in responses)
+    assert store_class.get_total_quantity() == 77
+
+
+def test_run_commands_malformed_orders(make_store, monkeypatch):
+    store_class = make_store(*PRODUCTS, quantities=STOCK)[0]
+    order = {"action": "order", "items": [{"product": 1, "quantity": 1}]}
+    responses = run(store_class, [
+        order, {"action": "order", "items": [{"product": 1,
+                                              "quantity": "2"}]},
+        {"action": "order", "items": [{"product": 1}]}, order])
+    assert responses == [
+        {"ok": True, "total": 1450},
+        {"ok": False, "errors": ["Invalid quantity for MacBook Air M2"]},
+        {"ok": False, "errors": ["Invalid quantity for MacBook Air M2"]},
+        {"ok": True, "total": 1450}]
+
+    commit_orders = commands.commit_orders
+
+    def failing_commit(store_class, shopping_lists):
+        if any(quantity == 3 for shopping_list in shopping_lists
+               for _, quantity in shopping_list):
+            raise RuntimeError("Commit failed")
+        return commit_orders(store_class, shopping_lists)
+
+    monkeypatch.setattr(commands, "commit_orders", failing_commit)
+    responses = run(store_class, [
+        order, {"action": "order", "items": [{"product": 1,
+                                              "quantity": 3}]}, order])
+    assert responses == [{"ok": True, "total": 1450},
+                         {"ok": False, "errors": ["Commit failed"]},
+                         {"ok": True, "total": 1450}]
+    assert store_class.get_product("MacBook Air M2").quantity == 96
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+from events import (InventoryEvents, STOCK_CHANGED, LOW_STOCK, RESTOCKED,
+                    DEACTIVATED, REACTIVATED, PROMOTION_CHANGED)
+from products import Product
+from promotions import PercentDiscount
+from store import Store
+
+
+PRODUCTS = ("Google Pixel 7", "Windows License")
+STOCK = {"Google Pixel 7": 20}
+
+
+def kinds(events):
+    return [(event.kind, event.old_value, event.new_value, event.count)
+            for event in events]
+
+
+def test_events_from_orders(make_store):
+    best_buy, (pixel, license_) = make_store(*PRODUCTS, quantities=STOCK)
+    stream = InventoryEvents(best_buy, low_stock=5)
+    events = stream.subscribe()
+    best_buy.order([(pixel, 10)])
+    assert kinds(events.drain()) == [(STOCK_CHANGED, 20, 10, 1)]
+    best_buy.order([(pixel, 6)])
+    best_buy.order([(pixel, 4), (license_, 1)])
+    assert kinds(events.drain()) == [(LOW_STOCK, 10, 4, 1),
+                                     (STOCK_CHANGED, 10, 0, 2),
+                                     (DEACTIVATED, True, False, 1)]
+    pixel.set_quantity(8)
+    pixel.activate()
+    license_.set_promotion(PercentDiscount("Sale", percent=10))
+    assert kinds(events.drain())[1:3] == [(RESTOCKED, 0, 8, 1),
+                                          (REACTIVATED, False, True, 1)]
+    assert events.poll() is None
+
+
+def test_coalesced_events_keep_the_final_state(make_store):
+    best_buy, (pixel, _) = make_store(*PRODUCTS, quantities=STOCK)
+    stream = InventoryEvents(best_buy, low_stock=5)
+    events = stream.subscribe()
+    pixel.deactivate()
+    pixel.set_quantity(3)
+    pixel.activate()
+    pixel.deactivate()
+    assert kinds(events.drain()) == [(STOCK_CHANGED, 20, 3, 1),
+                                     (LOW_STOCK, 20, 3, 1),
+                                     (DEACTIVATED, True, False, 1)]
+    pixel.set_quantity(8)
+    pixel.set_quantity(2)
+    pixel.activate()
+    pixel.set_quantity(9)
+    assert kinds(events.drain()) == [(REACTIVATED, False, True, 1),
+                                     (STOCK_CHANGED, 3, 9, 3),
+                                     (RESTOCKED, 2, 9, 1)]
+    pixel.set_quantity(4)
+    pixel.set_quantity(9)
+    assert events.drain() == []
+
+
+def test_thresholds_and_kinds(make_store):
+    best_buy, (pixel, license_) = make_store(*PRODUCTS, quantities=STOCK)
+    stream = InventoryEvents(best_buy)
+    stream.set_threshold(pixel, 15)
+    assert stream.get_threshold(pixel) == 15
+    assert stream.get_threshold(license_) == 10
+    low_stock = stream.subscribe(kinds=[LOW_STOCK, PROMOTION_CHANGED])
+    pixel.set_quantity(14)
+    license_.set_promotion(PercentDiscount("Sale", percent=10))
+    event = low_stock.get(timeout=1)
+    assert (event.kind, event.product, event.new_value) == \
+        (LOW_STOCK, pixel, 14)
+    assert low_stock.get(timeout=1).to_dict()["new"] == "Sale"
+    assert low_stock.get(timeout=0.01) is None
+    stream.unsubscribe(low_stock)
+    pixel.set_quantity(1)
+    assert len(low_stock) == 0
+
+
+def test_slow_consumer_drops_oldest():
+    best_buy = Store([Product(f"Product {i}", price=1, quantity=100)
+                      for i in range(10)])
+    stream = InventoryEvents(best_buy)
+    events = stream.subscribe(kinds=[STOCK_CHANGED], max_size=4)
+    for product in best_buy.products_list:
+        best_buy.order([(product, 1)])
+    assert len(events) == 4
+    assert events.dropped == 6
+    assert [event.product.name for event in events.drain()] == \
+        [f"Product {i}" for i in range(6, 10)]
+
+
+def test_async_consumer(make_store):
+    best_buy, (pixel, _) = make_store(*PRODUCTS, quantities=STOCK)
+    stream = InventoryEvents(best_buy)
+    events = stream.subscribe(kinds=[STOCK_CHANGED])
+
+    async def consume():
+        waiting = asyncio.ensure_future(events.get_async())
+        await asyncio.sleep(0.01)
+        threading.Thread(target=pixel.set_quantity, args=(3,)).start()
+        return await asyncio.wait_for(waiting, 1)
+
+    event = asyncio.run(consume())
+    assert (event.old_value, event.new_value) == (20, 3)
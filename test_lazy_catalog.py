@@ -0,0 +1,112 @@
+import gc
+import pytest
+import os
+from catalog_io import export_catalog
+from lazy_catalog import LazyStore, index_path
+from products import Product, NonStockedProduct, LimitedProduct
+from promotions import SecondHalfPrice
+from store import Store
+
+
+def write_catalog(path, size=100):
+    promotion = SecondHalfPrice("Second Half price!")
+    product_list = [Product(f"Product {i:03}", price=i + 1, quantity=10)
+                    for i in range(size)]
+    product_list[1].set_promotion(promotion)
+    product_list[2].deactivate()
+    product_list.append(NonStockedProduct("Windows License", price=125))
+    product_list.append(LimitedProduct("Shipping", price=10, quantity=250,
+                                       maximum=1))
+    export_catalog(Store(product_list), path)
+    return {promotion.name: promotion}
+
+
+def test_lazy_store_lookups(tmp_path):
+    path = str(tmp_path / "catalog.jsonl")
+    promotions = write_catalog(path)
+    store = LazyStore(path, promotions, cache_size=10)
+    assert os.path.exists(index_path(path))
+    assert len(store.catalog) == 102
+    assert store.get_total_quantity() == 1250
+    assert store.get_active_count() == 101
+    assert store.catalog.resident == {}
+    shipping = store.get_product("Shipping")
+    assert shipping.max_per_order == 1
+    assert store.get_product_id(shipping) == 102
+    assert store.get_product("Product 050") is store.get_product_by_id(51)
+    assert store.get_product("Nothing") is None
+    assert store.get_product_by_id(1).promotion is None
+    assert store.get_product_by_id(2).promotion is \
+        promotions["Second Half price!"]
+    assert [product_id for product_id, _
+            in store.get_products_page(1, 3)] == [2, 4, 5]
+    store.close()
+
+
+def test_lazy_store_keeps_changes(tmp_path):
+    path = str(tmp_path / "catalog.jsonl")
+    promotions = write_catalog(path)
+    store = LazyStore(path, promotions, cache_size=10)
+    assert store.order([(store.get_product_by_id(1), 10),
+                        (store.get_product_by_id(2), 2)]) == 13
+    for product_id in range(3, 103):
+        store.get_product_by_id(product_id)
+    gc.collect()
+    assert len(store.catalog.resident) == 10
+    assert not store.get_product_by_id(1).is_active()
+    assert store.get_product_by_id(2).quantity == 8
+    assert store.get_total_quantity() == 1238
+    assert store.get_active_count() == 100
+    assert len(store.get_all_products()) == 100
+
+    ipad = Product("iPad", price=800, quantity=2)
+    assert store.add_product(ipad) == 103
+    assert store.get_product("iPad") is ipad
+    store.remove_product(store.get_product("Product 099"))
+    assert store.get_product("Product 099") is None
+    assert store.get_total_quantity() == 1230
+    assert [product.name for product
+            in store.get_products_in_price_range(99, 800)] == \
+        ["Product 098", "Windows License", "iPad"]
+    store.close()
+
+
+def test_index_rebuilt_when_catalog_changes(tmp_path):
+    path = str(tmp_path / "catalog.jsonl")
+    write_catalog(path)
+    LazyStore(path).close()
+    write_catalog(path, size=5)
+    os.utime(path, ns=(0, 0))
+    store = LazyStore(path)
+    assert len(store.catalog) == 7
+    assert store.get_product("Product 004").price == 5
+    store.close()
+
+
+def test_lazy_store_search_and_pages_stay_lazy(tmp_path):
+    path = str(tmp_path / "catalog.jsonl")
+    promotions = write_catalog(path)
+    store = LazyStore(path, promotions, cache_size=10)
+    result = store.search(text="product 09", sort_by="name", limit=3)
+    assert result.total == 10
+    assert [product.name for product in result.products] == \
+        ["Product 090", "Product 091", "Product 092"]
+    del result
+    gc.collect()
+    assert len(store.catalog.loaded) == 10
+    with pytest.raises(TypeError):
+        store.snapshot()
+
+    pages = []
+    last_id = 0
+    while True:
+        page = store.get_products_page(last_id, 40)
+        if not page:
+            break
+        pages.append([product_id for product_id, _ in page])
+        last_id = page[-1][0]
+    assert [len(page) for page in pages] == [40, 40, 21]
+    assert sum(pages, []) == [product_id for product_id in range(1, 103)
+                              if product_id != 3]
+    assert store.get_products_page(101, 5)[0][0] == 102
+    store.close()
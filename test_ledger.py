@@ -0,0 +1,128 @@
+import threading
+import pytest
+import ledger as ledger_module
+from batching import commit_orders
+from ledger import NO_SALES, OrderLedger
+from promotions import SecondHalfPrice, PercentDiscount
+
+
+@pytest.fixture
+def create_store(make_store):
+    """Factory of stores whose earbuds have a promotion"""
+    def create():
+        store_class, product_list = make_store(
+            "MacBook Air M2", "Bose QuietComfort Earbuds", "Windows License")
+        product_list[1].set_promotion(SecondHalfPrice("Second Half price!"))
+        return store_class, product_list
+    return create
+
+
+def test_ledger_disabled_by_default(create_store):
+    store, product_list = create_store()
+    assert store.order([(product_list[0], 1)]) == 1450
+    assert store.ledger is None
+
+
+def test_running_totals(create_store):
+    store, product_list = create_store()
+    ledger = store.enable_ledger()
+    assert store.enable_ledger() is ledger
+    store.order([(product_list[0], 1), (product_list[1], 2)])
+    assert store.checkout([(product_list[1], 3),
+                           (product_list[2], 1)]).success
+    assert not store.checkout([(product_list[0], 1000)]).success
+    commit_orders(store, [[(product_list[0], 2)],
+                          [(product_list[1], 1000)]])
+    assert len(ledger) == 5
+    assert ledger.product_totals(product_list[0]) == (2, 3, 435000, 435000)
+    earbuds = ledger.product_totals(product_list[1])
+    assert earbuds == (2, 5, 125000, 100000)
+    assert earbuds.revenue == 1000
+    assert earbuds.discount == 250
+    assert ledger.promotion_totals("Second Half price!") == earbuds
+    assert ledger.promotion_totals("Nothing") is NO_SALES
+    assert ledger.totals().cents == 435000 + 100000 + 12500
+
+
+def test_time_windows(create_store, clock):
+    store, product_list = create_store()
+    ledger = store.ledger = OrderLedger(store, chunk_size=4, clock=clock)
+    for hour in range(10):
+        clock.now = 3600.0 * hour
+        store.checkout([(product_list[hour % 2], 1)])
+    assert len(ledger.chunks) == 3
+    assert ledger.totals(3600, 7200 * 2) == (3, 3, 195000, 195000)
+    assert ledger.totals(start=3600 * 8).lines == 2
+    assert ledger.totals(end=1).lines == 1
+    assert ledger.totals(3600 * 20) is NO_SALES
+    assert ledger.totals(0, 3600 * 5, product=product_list[1]) == \
+        (2, 2, 50000, 50000)
+    assert ledger.totals(promotion="Second Half price!").lines == 5
+    assert ledger.sales_by_product(3600, 3600 * 3) == {
+        1: (1, 1, 145000, 145000), 2: (1, 1, 25000, 25000)}
+    entries = list(ledger.entries(3600 * 9))
+    assert [(entry.product_id, entry.promotion) for entry in entries] == \
+        [(2, "Second Half price!")]
+
+
+def test_ledger_times_never_go_backwards(create_store, clock):
+    store, product_list = create_store()
+    clock.now = 100.0
+    ledger = store.ledger = OrderLedger(store, clock=clock)
+    store.checkout([(product_list[0], 1)])
+    clock.now = 50.0
+    store.checkout([(product_list[0], 1)])
+    assert [entry.time for entry in ledger.entries()] == [100.0, 100.0]
+
+
+def test_removed_product_keeps_history(create_store):
+    store, product_list = create_store()
+    ledger = store.enable_ledger()
+    store.checkout([(product_list[0], 1)])
+    store.remove_product(product_list[0])
+    assert ledger.totals().lines == 1
+    with pytest.raises(KeyError):
+        ledger.product_totals(product_list[0])
+
+
+def test_records_the_price_paid(create_store, monkeypatch):
+    store, product_list = create_store()
+    ledger = store.enable_ledger()
+    earbuds = product_list[1]
+    apply_batch = SecondHalfPrice.apply_promotion_batch_cents
+
+    def reprice_during_order(promotion, prices, quantities):
+        # Another thread changes the price and promotion meanwhile
+        thread = threading.Thread(target=lambda: (
+            earbuds.set_price(300),
+            earbuds.set_promotion(PercentDiscount("10% off!", percent=10))))
+        thread.start()
+        thread.join()
+        return apply_batch(promotion, prices, quantities)
+
+    monkeypatch.setattr(SecondHalfPrice, "apply_promotion_batch_cents",
+                        reprice_during_order)
+    result = store.checkout([(earbuds, 2)])
+    assert result.total_cents == 37500
+    assert ledger.product_totals(earbuds) == (1, 2, 50000, 37500)
+    assert ledger.promotion_totals("Second Half price!").lines == 1
+    assert ledger.promotion_totals("10% off!") is NO_SALES
+
+
+@pytest.mark.parametrize("numpy_min_rows", [256, 1])
+def test_sales_by_product_matches_entries(create_store, clock, monkeypatch,
+                                          numpy_min_rows):
+    monkeypatch.setattr(ledger_module, "NUMPY_MIN_ROWS", numpy_min_rows)
+    store, product_list = create_store()
+    ledger = store.ledger = OrderLedger(store, chunk_size=8, clock=clock)
+    for hour in range(30):
+        clock.now = 3600.0 * hour
+        store.checkout([(product_list[hour % 3], hour % 4 + 1)])
+    expected = {}
+    for entry in ledger.entries(3600 * 5, 3600 * 27):
+        expected[entry.product_id] = expected.get(entry.product_id,
+                                                  NO_SALES) + \
+            (1, entry.quantity, entry.list_cents, entry.cents)
+    assert ledger.sales_by_product(3600 * 5, 3600 * 27) == expected
+    assert sum(ledger.sales_by_product().values(), NO_SALES) == \
+        ledger.totals()
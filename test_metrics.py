@@ -0,0 +1,87 @@
+import metrics
+from metrics import (MetricsRegistry, Histogram, InMemorySink,
+                     PrometheusFileSink, JsonLogSink, prometheus_text)
+from batching import commit_orders
+from reservations import ReservationManager
+from store import Store
+from products import Product, LimitedProduct
+from promotions import SecondHalfPrice
+
+
+def test_instrumented_order_paths(capsys):
+    product_list = [Product("Google Pixel 7", price=500, quantity=5),
+                    LimitedProduct("Shipping", price=10, quantity=250,
+                                   maximum=1)]
+    product_list[0].set_promotion(SecondHalfPrice("Half"))
+    best_buy = Store(product_list)
+    metrics.REGISTRY.reset()
+    metrics.enable()
+    try:
+        best_buy.order([(product_list[0], 2), (product_list[1], 1)])
+        best_buy.order([(product_list[0], 10)])
+        best_buy.checkout([(product_list[1], 2)])
+    finally:
+        metrics.disable()
+    capsys.readouterr()
+    best_buy.order([(product_list[0], 1)])
+    capsys.readouterr()
+
+    snapshot = metrics.REGISTRY.snapshot()
+    assert snapshot["store_orders_total"]["value"] == 3
+    assert snapshot["store_orders_rejected_total"]["value"] == 1
+    assert snapshot["store_order_seconds"]["count"] == 3
+    assert snapshot["product_buys_total"]["value"] == 2
+    assert snapshot["promotion_evaluations_total"]["value"] == 1
+    assert snapshot["product_stock_outs_total"]["value"] == 1
+    assert snapshot["product_limit_rejections_total"]["value"] == 1
+    metrics.REGISTRY.reset()
+
+
+def test_every_purchase_path_is_instrumented(make_store):
+    best_buy, (pixel, shipping) = make_store("Google Pixel 7", "Shipping")
+    manager = ReservationManager(best_buy)
+    reservation = manager.reserve([(pixel, 1)])
+    metrics.REGISTRY.reset()
+    metrics.enable()
+    try:
+        assert best_buy.checkout([(pixel, 2), (shipping, 1)]).success
+        commit_orders(best_buy, [[(pixel, 1)], [(pixel, 1000)],
+                                 [(pixel, 1), (shipping, 1)]])
+        assert manager.commit(reservation).success
+    finally:
+        metrics.disable()
+
+    snapshot = metrics.REGISTRY.snapshot()
+    assert snapshot["product_buys_total"]["value"] == 6
+    assert snapshot["product_buy_seconds"]["count"] == 6
+    assert snapshot["store_orders_total"]["value"] == 5
+    assert snapshot["store_orders_rejected_total"]["value"] == 1
+    assert snapshot["store_order_seconds"]["count"] == 5
+    metrics.REGISTRY.reset()
+
+
+def test_histogram_buckets():
+    histogram = Histogram("latency", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.to_dict()["buckets"] == {"0.1": 2, "1.0": 1, "+Inf": 1}
+    assert histogram.count == 4
+
+
+def test_sinks(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("orders_total", "Orders").inc(3)
+    registry.histogram("order_seconds", "Order time").observe(0.002)
+    memory_sink = InMemorySink()
+    registry.add_sink(memory_sink)
+    registry.add_sink(PrometheusFileSink(tmp_path / "metrics.prom"))
+    registry.add_sink(JsonLogSink(tmp_path / "metrics.jsonl"))
+    registry.flush()
+    registry.flush()
+
+    assert memory_sink.snapshots[0]["orders_total"]["value"] == 3
+    text = (tmp_path / "metrics.prom").read_text()
+    assert text == prometheus_text(registry)
+    assert "orders_total 3\n" in text
+    assert 'order_seconds_bucket{le="+Inf"} 1\n' in text
+    assert len((tmp_path / "metrics.jsonl").read_text().splitlines()) == 2
@@ -0,0 +1,20 @@
+import pytest
+from money import (div_round, to_cents, to_dollars, format_cents,
+                   ROUND_HALF_UP, ROUND_HALF_EVEN, ROUND_DOWN, ROUND_UP)
+
+
+def test_div_round_modes():
+    assert [div_round(n, 2, ROUND_HALF_UP) for n in (3, 5, 4)] == [2, 3, 2]
+    assert [div_round(n, 2, ROUND_HALF_EVEN) for n in (3, 5, 4)] == [2, 2, 2]
+    assert [div_round(n, 3, ROUND_DOWN) for n in (5, 6)] == [1, 2]
+    assert [div_round(n, 3, ROUND_UP) for n in (4, 6)] == [2, 2]
+    with pytest.raises(ValueError):
+        div_round(1, 2, "sideways")
+
+
+def test_cents_conversions():
+    assert to_cents(12) == 1200
+    assert to_cents(0.1) == 10
+    assert to_cents("19.995") == 2000
+    assert to_dollars(1999) == 19.99
+    assert format_cents(1205) == "$12.05"
@@ -0,0 +1,131 @@
+import threading
+import time
+import pytest
+from persistence import StorePersistence, WriteAheadLog
+from store import Store
+from products import Product
+from promotions import SecondHalfPrice, PercentDiscount
+
+
+@pytest.fixture
+def create_store(make_products):
+    """Factory of the store persisted by the tests"""
+    def create():
+        product_list = make_products("MacBook Air M2", "Google Pixel 7",
+                                     "Windows License", "Shipping")
+        half_price = SecondHalfPrice("Second Half price!")
+        product_list[0].set_promotion(half_price)
+        product_list[2].set_promotion(half_price)
+        return Store(product_list)
+    return create
+
+
+def store_state(store_class):
+    return [(store_class.get_product_id(product), product.to_dict())
+            for product in store_class.products_list]
+
+
+def wait_until(check, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_persistence_replays_log(tmp_path, create_store):
+    persistence = StorePersistence(tmp_path)
+    best_buy = persistence.open(create_store)
+    best_buy.order([(best_buy.get_product("MacBook Air M2"), 10)])
+    best_buy.get_product("Google Pixel 7").set_quantity(0)
+    best_buy.get_product("Shipping").set_price(15)
+    best_buy.get_product("Windows License").set_promotion(
+        PercentDiscount("30% off!", percent=30))
+    best_buy.remove_product(best_buy.get_product("MacBook Air M2"))
+    best_buy.add_product(Product("Bose QuietComfort Earbuds", price=250,
+                                 quantity=500))
+    persistence.close()
+
+    restored = StorePersistence(tmp_path).open()
+    assert store_state(restored) == store_state(best_buy)
+    assert restored.get_total_quantity() == best_buy.get_total_quantity()
+    assert restored.get_product("Bose QuietComfort Earbuds") is not None
+    assert restored.get_product_id(
+        restored.get_product("Bose QuietComfort Earbuds")) == 5
+
+
+def test_persistence_snapshot_empties_log(tmp_path, create_store):
+    persistence = StorePersistence(tmp_path, snapshot_every=3)
+    best_buy = persistence.open(create_store)
+    pixel = best_buy.get_product("Google Pixel 7")
+    for quantity in range(240, 237, -1):
+        pixel.set_quantity(quantity)
+    wait_until(lambda: not list(WriteAheadLog.read(persistence.log_path)))
+    pixel.set_quantity(237)
+    persistence.close()
+
+    records = list(WriteAheadLog.read(persistence.log_path))
+    assert [record["value"] for record in records] == [237]
+
+    restored = StorePersistence(tmp_path).open()
+    assert restored.get_product("Google Pixel 7").quantity == 237
+    half_price = restored.get_product("MacBook Air M2").promotion
+    assert restored.get_product("Windows License").promotion is half_price
+
+
+def test_log_ignores_torn_record(tmp_path, create_store):
+    persistence = StorePersistence(tmp_path)
+    best_buy = persistence.open(create_store)
+    best_buy.get_product("Google Pixel 7").set_quantity(10)
+    persistence.close()
+    with open(persistence.log_path, "a", encoding="utf-8") as log_file:
+        log_file.write('{"seq": 99, "event": "quan')
+
+    persistence = StorePersistence(tmp_path)
+    restored = persistence.open()
+    assert restored.get_product("Google Pixel 7").quantity == 10
+    restored.get_product("Google Pixel 7").set_quantity(5)
+    persistence.close()
+
+    restored = StorePersistence(tmp_path).open()
+    assert restored.get_product("Google Pixel 7").quantity == 5
+
+
+def test_replay_skips_records_in_snapshot(tmp_path, create_store):
+    persistence = StorePersistence(tmp_path)
+    best_buy = persistence.open(create_store)
+    earbuds = Product("Bose QuietComfort Earbuds", price=250, quantity=500)
+    best_buy.add_product(earbuds)
+    best_buy.remove_product(best_buy.get_product("Shipping"))
+    earbuds.set_quantity(400)
+    persistence.close()
+    # Changes logged while the snapshot was taken, but already in it
+    persistence.seq, persistence.log = 0, None
+    persistence.snapshot()
+
+    restored = StorePersistence(tmp_path).open()
+    assert store_state(restored) == store_state(best_buy)
+
+
+def test_snapshots_while_changing(tmp_path, create_store):
+    persistence = StorePersistence(tmp_path, snapshot_every=5)
+    best_buy = persistence.open(create_store)
+    pixel = best_buy.get_product("Google Pixel 7")
+
+    def add_products(first):
+        for number in range(first, first + 50):
+            best_buy.add_product(Product(f"Product {number}", price=1,
+                                         quantity=number))
+
+    workers = [threading.Thread(target=add_products, args=(first,))
+               for first in (0, 100)]
+    for worker in workers:
+        worker.start()
+    for _ in range(50):
+        best_buy.order([(pixel, 1)])
+    for worker in workers:
+        worker.join()
+    persistence.close()
+
+    restored = StorePersistence(tmp_path).open()
+    assert sorted(store_state(restored)) == sorted(store_state(best_buy))
+    assert restored.get_product("Google Pixel 7").quantity == 200
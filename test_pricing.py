@@ -0,0 +1,82 @@
+from pricing import price_lines, price_lines_cents, quote, PriceCache
+from products import Product, NonStockedProduct
+from promotions import SecondHalfPrice, PercentDiscount
+
+
+def test_price_lines_keeps_line_order():
+    half_price = SecondHalfPrice("Half")
+    first = Product("MacBook Air M2", price=1450, quantity=100)
+    second = Product("Google Pixel 7", price=500, quantity=250)
+    third = NonStockedProduct("Windows License", price=125)
+    first.set_promotion(half_price)
+    third.set_promotion(half_price)
+    second.set_promotion(PercentDiscount("30% off!", percent=30))
+    lines = [(first, 3), (second, 2), (third, 4), (first, 1)]
+    assert price_lines(lines) == [product.get_price(quantity)
+                                  for product, quantity in lines]
+
+
+def test_quote_has_no_side_effects():
+    product = Product("MacBook Air M2", price=1450, quantity=100)
+    assert quote([(product, 10)]) == 14500
+    assert product.quantity == 100
+    assert quote([]) == 0
+
+
+def test_price_cache_hits_and_eviction():
+    half_price = SecondHalfPrice("Half")
+    product = Product("MacBook Air M2", price=1450, quantity=100)
+    product.set_promotion(half_price)
+    cache = PriceCache(max_size=2)
+    assert cache.price_lines_cents([(product, 3)]) == \
+        [product.get_price_cents(3)]
+    assert cache.price_lines_cents([(product, 3), (product, 4)]) == \
+        [product.get_price_cents(3), product.get_price_cents(4)]
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.price_lines_cents([(product, 5)])
+    assert len(cache) == 2
+    cache.price_lines_cents([(product, 3)])
+    assert cache.misses == 4
+
+
+def test_price_cache_follows_price_and_promotion_changes():
+    percent = PercentDiscount("Percent", percent=30)
+    product = Product("MacBook Air M2", price=1000, quantity=100)
+    product.set_promotion(percent)
+    cache = PriceCache()
+    assert cache.price_lines_cents([(product, 2)]) == [140000]
+    product.set_price(2000)
+    assert cache.price_lines_cents([(product, 2)]) == [280000]
+    product.set_promotion(SecondHalfPrice("Half"))
+    assert cache.price_lines_cents([(product, 2)]) == [300000]
+    product.set_promotion(percent)
+    percent.percent = 50
+    cache.invalidate(percent)
+    assert cache.price_lines_cents([(product, 2)]) == [200000]
+
+
+def test_price_cache_keys_match_the_priced_values(monkeypatch):
+    percent = PercentDiscount("Percent", percent=30)
+    product = Product("MacBook Air M2", price=1000, quantity=100)
+    product.set_promotion(percent)
+    apply_batch = PercentDiscount.apply_promotion_batch_cents
+
+    def reprice_while_pricing(promotion, prices, quantities):
+        product.set_price(2000)
+        return apply_batch(promotion, prices, quantities)
+
+    cache = PriceCache()
+    monkeypatch.setattr(PercentDiscount, "apply_promotion_batch_cents",
+                        reprice_while_pricing)
+    assert cache.price_lines_cents([(product, 2)]) == [140000]
+    monkeypatch.setattr(PercentDiscount, "apply_promotion_batch_cents",
+                        apply_batch)
+    assert cache.price_lines_cents([(product, 2)]) == [280000]
+
+
+def test_price_lines_cents_are_exact():
+    percent = PercentDiscount("12.5% off", percent=12.5)
+    product = Product("Cable", price=1, quantity=100)
+    product.set_promotion(percent)
+    assert price_lines_cents([(product, 1), (product, 3)]) == [88, 263]
+    assert quote([(product, 1)] * 10) == 8.8
@@ -0,0 +1,70 @@
+import threading
+import pytest
+from product_table import ProductTable
+from products import Product, NonStockedProduct, LimitedProduct
+
+
+def test_products_share_table_columns():
+    table = ProductTable()
+    product = Product("MacBook Air M2", price=1450, quantity=100, table=table)
+    limited = LimitedProduct("Shipping", price=10, quantity=250, maximum=1,
+                             table=table)
+    assert list(table.prices) == [1450, 10]
+    assert list(table.quantities) == [100, 250]
+    product.buy(40)
+    assert table.quantities[product.row] == 60
+    limited.deactivate()
+    assert table.active[limited.row] == 0
+    assert limited.active is False
+
+
+def test_products_have_no_instance_dict():
+    for product in (Product("MacBook Air M2", price=1450, quantity=100),
+                    NonStockedProduct("Windows License", price=125),
+                    LimitedProduct("Shipping", price=10, quantity=250,
+                                   maximum=1)):
+        assert not hasattr(product, "__dict__")
+
+
+def test_released_rows_are_reused():
+    table = ProductTable()
+    product = Product("MacBook Air M2", price=1450, quantity=100, table=table)
+    row = product.row
+    del product
+    assert len(table) == 0
+    other = NonStockedProduct("Windows License", price=125, table=table)
+    assert other.row == row
+    assert len(table) == 1
+    assert other.price == 125
+    assert other.quantity == 0
+
+
+def test_concurrent_allocations_get_distinct_rows():
+    table = ProductTable()
+    created = [[] for _ in range(4)]
+
+    def create(products):
+        for i in range(5000):
+            products.append(Product(f"Product {i}", price=1, quantity=1,
+                                    table=table))
+
+    threads = [threading.Thread(target=create, args=(products,))
+               for products in created]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    rows = {product.row for products in created for product in products}
+    assert len(rows) == 20000
+    assert len(table) == 20000
+
+
+def test_numpy_columns_are_copies():
+    pytest.importorskip("numpy")
+    table = ProductTable()
+    product = Product("MacBook Air M2", price=1450, quantity=100, table=table)
+    columns = table.as_numpy()
+    other = Product("Google Pixel 7", price=500, quantity=250, table=table)
+    product.set_quantity(99)
+    assert list(columns["quantities"]) == [100]
+    assert other.row == 1
@@ -1,5 +1,7 @@
 import pytest
 from promotions import SecondHalfPrice, ThirdOneFree, PercentDiscount
+from promotions import CompiledPromotion, stack_promotions, promotion_from_dict
+from promotions import Promotion
 from products import Product
 
 
@@ -39,4 +41,107 @@ def test_percent_discount_20():
     assert promotion.apply_promotion(product, 14) == 112
 
 
+def test_batch_matches_scalar_formulas():
+    prices = [price for price in range(0, 50, 7) for _ in range(40)]
+    quantities = [quantity for _ in range(0, 50, 7) for quantity in range(40)]
+    for promotion in (SecondHalfPrice("Half"), ThirdOneFree("Third"),
+                      PercentDiscount("Percent", 35)):
+        batch = promotion.apply_promotion_batch(prices, quantities)
+        for price, quantity, final_price in zip(prices, quantities, batch):
+            product = Product("Test Product", price=price, quantity=2000)
+            assert final_price == promotion.apply_promotion(product, quantity)
+
+
+def test_batch_small_and_empty():
+    promotion = SecondHalfPrice("Half")
+    assert promotion.apply_promotion_batch([10, 10], [10, 13]) == [75, 100]
+    assert promotion.apply_promotion_batch([], []) == []
+
+
+def test_compiled_matches_existing_promotions():
+    for promotion in (SecondHalfPrice("Half"), ThirdOneFree("Third"),
+                      PercentDiscount("Percent", 35),
+                      PercentDiscount("Percent", 30)):
+        compiled = CompiledPromotion("Compiled", promotion.to_rules())
+        for price in range(0, 2000, 13):
+            for quantity in range(60):
+                assert compiled.calculate(price, quantity) == \
+                    promotion.calculate(price, quantity)
+
+
+def test_compiled_buy_n_get_m():
+    promotion = CompiledPromotion("Buy 3 get 2 at 25% off", [
+        {"type": "bundle", "buy": 3, "get": 2, "discount": 25}])
+    product = Product("Test Product", price=100, quantity=2000)
+    assert promotion.apply_promotion(product, 3) == 300
+    assert promotion.apply_promotion(product, 5) == 450
+    assert promotion.apply_promotion(product, 12) == 1100
+    assert promotion.apply_promotion(product, 10 ** 12) == 90 * 10 ** 12
+
+
+def test_stacked_promotions():
+    stacked = stack_promotions("Third free, then 30% off",
+                               [ThirdOneFree("Third"),
+                                PercentDiscount("Percent", 30)])
+    product = Product("Test Product", price=10, quantity=2000)
+    assert stacked.apply_promotion(product, 3) == 14
+    assert stacked.apply_promotion(product, 4) == 21
+    assert stacked.apply_promotion(product, 0) == 0
+    batch = stacked.apply_promotion_batch([10] * 40, list(range(40)))
+    assert batch == [stacked.calculate(10, quantity)
+                     for quantity in range(40)]
+
+
+def test_compiled_promotion_round_trip_and_errors():
+    promotion = CompiledPromotion("Deal", [
+        {"type": "bundle", "buy": 1, "get": 1, "discount": 50},
+        {"type": "percent", "percent": 10}])
+    copy = promotion_from_dict(promotion.to_dict())
+    assert copy.rules == promotion.rules
+    assert copy.calculate(99, 7) == promotion.calculate(99, 7)
+    with pytest.raises(ValueError):
+        CompiledPromotion("Bad", [{"type": "percent", "percent": 120}])
+    with pytest.raises(ValueError):
+        CompiledPromotion("Bad", [{"type": "lottery"}])
+    with pytest.raises(ValueError):
+        CompiledPromotion("Bad", [])
+
+
+def test_cents_match_float_formulas():
+    for promotion in (SecondHalfPrice("Half"), ThirdOneFree("Third"),
+                      PercentDiscount("Percent", 35),
+                      PercentDiscount("Percent", 12.5)):
+        for price in range(0, 300, 7):
+            for quantity in range(30):
+                cents = promotion.calculate_cents(price * 100, quantity)
+                assert cents == round(promotion.calculate(price, quantity)
+                                      * 100 + 1e-9)
+                assert CompiledPromotion("Compiled", promotion.to_rules()) \
+                    .calculate_cents(price * 100, quantity) == cents
+
+
+def test_cents_rounding_modes():
+    half_up = SecondHalfPrice("Half")
+    half_even = SecondHalfPrice("Half", rounding="half_even")
+    assert half_up.calculate_cents(1, 2) == 2
+    assert half_even.calculate_cents(1, 2) == 2
+    assert half_up.calculate_cents(1, 1) == 1
+    assert half_up.calculate_cents(5, 2) == 8
+    assert half_even.calculate_cents(5, 2) == 8
+    assert half_even.calculate_cents(3, 2) == 4
+    assert half_up.apply_promotion_batch_cents([5, 3], [2, 2]) == [8, 5]
+    with pytest.raises(ValueError):
+        PercentDiscount("Bad", 10, rounding="sideways")
+
+
+def test_promotion_without_rules():
+    class Clearance(Promotion):
+        def calculate(self, price, quantity):
+            return price * quantity / 2
+
+    with pytest.raises(TypeError, match="Clearance promotion 'Sale'"):
+        stack_promotions("Stacked", [SecondHalfPrice("Half"),
+                                     Clearance("Sale")])
+
+
 pytest.main()
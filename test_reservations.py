@@ -0,0 +1,93 @@
+import math
+import pytest
+from batching import commit_orders
+from reservations import ReservationManager
+
+
+@pytest.fixture
+def make_manager(make_store, clock):
+    """Factory of (manager, product list, clock) over the cart products"""
+    def make(ttl=60):
+        store_class, product_list = make_store(
+            "Google Pixel 7", "Windows License", "Shipping",
+            quantities={"Google Pixel 7": 5})
+        return (ReservationManager(store_class, ttl=ttl, clock=clock),
+                product_list, clock)
+    return make
+
+
+def test_reserve_holds_stock(make_manager):
+    manager, (pixel, license_, shipping), _ = make_manager()
+    reservation = manager.reserve([(pixel, 2), (pixel, 1), (license_, 3)])
+    assert reservation.lines == {pixel: 3, license_: 3}
+    assert manager.get_reserved(pixel) == 3
+    assert manager.get_available(pixel) == 2
+    assert pixel.quantity == 5
+    with pytest.raises(ValueError, match="Insufficient stock"):
+        manager.reserve([(pixel, 3)])
+    with pytest.raises(ValueError):
+        manager.reserve([(shipping, 2)])
+    assert len(manager) == 1
+    manager.release(reservation)
+    assert manager.get_available(pixel) == 5
+
+
+def test_reservations_expire(make_manager):
+    manager, (pixel, _, _), clock = make_manager(ttl=60)
+    first = manager.reserve([(pixel, 2)])
+    manager.reserve([(pixel, 2)], ttl=120)
+    clock.now = 50
+    manager.extend(first)
+    clock.now = 100
+    assert manager.expire() == 0
+    assert manager.get_reserved(pixel) == 4
+    clock.now = 115
+    assert manager.expire() == 1
+    assert manager.get_reserved(pixel) == 2
+    clock.now = 130
+    assert manager.get_available(pixel) == 5
+    assert not manager.commit(first).success
+    with pytest.raises(ValueError):
+        manager.extend(first)
+
+
+def test_commit_reservation(make_manager):
+    manager, (pixel, license_, _), _ = make_manager()
+    reservation = manager.reserve([(pixel, 5), (license_, 1)])
+    result = manager.commit(reservation)
+    assert result.success
+    assert result.total == 2625
+    assert pixel.quantity == 0
+    assert pixel.active is False
+    assert manager.get_reserved(pixel) == 0
+    assert manager.commit(reservation).errors == \
+        ["Reservation is no longer held"]
+    assert manager.store.get_total_quantity() == 250
+
+
+def test_purchases_respect_reservations(make_manager):
+    manager, (pixel, license_, _), _ = make_manager()
+    store_class = manager.store
+    reservation = manager.reserve([(pixel, 3)])
+    assert store_class.get_reserved(pixel) == 3
+    assert not store_class.checkout([(pixel, 3)]).success
+    assert store_class.checkout([(pixel, 2)]).success
+    assert store_class.order([(pixel, 1)]) == 0
+    assert not commit_orders(store_class, [[(pixel, 1)]])[0].success
+    assert store_class.checkout([(license_, 7)]).success
+    assert pixel.quantity == 3
+    assert manager.commit(reservation).success
+    assert pixel.quantity == 0
+
+
+def test_reserved_cart_survives_competing_orders(make_manager):
+    manager, (pixel, _, _), _ = make_manager()
+    reservation = manager.reserve([(pixel, 5)])
+    assert not manager.store.checkout([(pixel, 5)]).success
+    assert manager.commit(reservation).success
+    assert pixel.quantity == 0
+
+
+def test_non_stocked_availability_is_unlimited(make_manager):
+    manager, (_, license_, _), _ = make_manager()
+    assert manager.get_available(license_) == math.inf
@@ -0,0 +1,85 @@
+import random
+import pytest
+from benchmark import make_catalog
+from products import Product
+from promotions import PercentDiscount
+from search import scan_products
+
+
+def names(result):
+    return [product.name for product in result.products]
+
+
+def test_search_filters(make_store):
+    best_buy, (macbook, bose, pixel, license_, shipping) = make_store()
+    assert names(best_buy.search(text="OO")) == \
+        ["MacBook Air M2", "Google Pixel 7"]
+    assert names(best_buy.search(text="pixel 7")) == ["Google Pixel 7"]
+    assert names(best_buy.search(prefix="s")) == ["Shipping"]
+    assert names(best_buy.search(product_type="NonStockedProduct")) == \
+        ["Windows License"]
+    assert names(best_buy.search(min_price=125, max_price=500,
+                                 sort_by="price", descending=True)) == \
+        ["Google Pixel 7", "Bose QuietComfort Earbuds", "Windows License"]
+    result = best_buy.search(sort_by="name", offset=1, limit=2)
+    assert result.total == 5
+    assert names(result) == ["Google Pixel 7", "MacBook Air M2"]
+    with pytest.raises(ValueError):
+        best_buy.search(sort_by="color")
+
+
+def test_search_follows_changes(make_store):
+    best_buy, (macbook, bose, pixel, license_, shipping) = make_store()
+    assert best_buy.search(in_stock=True).total == 5
+    best_buy.order([(pixel, 250)])
+    macbook.set_promotion(PercentDiscount("Sale", percent=10))
+    bose.set_price(100)
+    best_buy.remove_product(shipping)
+    best_buy.add_product(Product("Google Pixel 8", price=700, quantity=1))
+    assert names(best_buy.search(text="pixel")) == ["Google Pixel 8"]
+    assert names(best_buy.search(text="pixel", include_inactive=True,
+                                 in_stock=False)) == ["Google Pixel 7"]
+    assert names(best_buy.search(promotion="Sale")) == ["MacBook Air M2"]
+    assert names(best_buy.search(max_price=100)) == \
+        ["Bose QuietComfort Earbuds"]
+    assert names(best_buy.search(sort_by="quantity", limit=1)) == \
+        ["Windows License"]
+
+
+def test_search_matches_scan():
+    best_buy = make_catalog(2000, seed=5)
+    rng = random.Random(5)
+    for product in rng.sample(best_buy.products_list, 300):
+        product.set_quantity(0)
+    queries = [{"text": "uct 1"}, {"text": "7"}, {"prefix": "product 19"},
+               {"product_type": "LimitedProduct"},
+               {"promotion": "30% off!"}, {"in_stock": False},
+               {"in_stock": True, "include_inactive": True},
+               {"min_price": 100, "max_price": 300}]
+    for query in queries:
+        for sort_by in ("id", "name", "price", "quantity"):
+            for descending in (False, True):
+                arguments = dict(query, sort_by=sort_by,
+                                 descending=descending, offset=3, limit=15)
+                expected = scan_products(best_buy, **arguments)
+                result = best_buy.search(**arguments)
+                assert result.total == expected.total
+                assert result.products == expected.products
+
+
+def test_value_indexes_refresh_only_when_used(make_store):
+    best_buy, product_list = make_store()
+    best_buy.search(text="pixel")
+    index = best_buy.search_index
+    for product in product_list[:3]:
+        product.set_quantity(product.quantity - 1)
+        product.set_price(product.price + 1)
+    best_buy.search(text="pixel")
+    assert len(index.moved["quantity"]) == len(index.moved["price"]) == 3
+    best_buy.search(min_price=1)
+    assert (len(index.moved["quantity"]), len(index.moved["price"])) == \
+        (3, 0)
+    result = best_buy.search(sort_by="quantity", include_inactive=True)
+    assert index.moved["quantity"] == {}
+    assert [product.quantity for product in result.products] == \
+        sorted(product.quantity for product in product_list)
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import pytest
+import service as service_module
+from service import StoreService
+
+
+@pytest.fixture
+def service(make_store):
+    return StoreService(make_store(
+        "MacBook Air M2", "Google Pixel 7", "Windows License",
+        quantities={"Google Pixel 7": 2})[0])
+
+
+def test_service_list_and_quote(service):
+    response = asyncio.run(service.handle_request({"action": "list"}))
+    assert response["ok"]
+    assert [product["id"] for product in response["products"]] == [1, 2, 3]
+    response = asyncio.run(service.handle_request(
+        {"action": "quote", "items": [{"product": "Google Pixel 7",
+                                       "quantity": 2}]}))
+    assert response == {"ok": True, "total": 1000, "discount": 0}
+
+
+def test_service_bad_requests(service):
+    for request in ({"action": "dance"},
+                    {"action": "order", "items": "MacBook"},
+                    {"action": "order", "items": [{"product": 42,
+                                                   "quantity": 1}]}):
+        response = asyncio.run(service.handle_request(request))
+        assert not response["ok"]
+        assert response["errors"]
+
+
+def test_service_orders_committed_in_one_batch(service):
+    order = {"action": "order", "items": [{"product": 2, "quantity": 1}]}
+
+    async def place_orders():
+        return await asyncio.gather(*(service.handle_request(order)
+                                      for _ in range(3)))
+
+    responses = asyncio.run(place_orders())
+    assert [response["ok"] for response in responses] == [True, True, False]
+    assert service.batches_committed == 1
+    assert service.store.get_product("Google Pixel 7").quantity == 0
+
+
+def test_service_malformed_quantities(service):
+    good = {"action": "order", "items": [{"product": 1, "quantity": 1}]}
+    bad = [{"action": "order", "items": [{"product": 1}]},
+           {"action": "order", "items": [{"product": 1, "quantity": "2"}]},
+           {"action": "order", "items": [{"product": 1, "quantity": True}]},
+           {"action": "order", "items": [{"product": 1, "quantity": -1}]}]
+
+    async def place_orders():
+        return await asyncio.wait_for(asyncio.gather(
+            *(service.handle_request(order) for order in [good, *bad])), 5)
+
+    responses = asyncio.run(place_orders())
+    assert responses[0] == {"ok": True, "total": 1450}
+    assert [response["errors"] for response in responses[1:]] == \
+        [["Invalid quantity for MacBook Air M2"]] * 4
+
+
+def test_service_commit_errors_reach_every_order(service, monkeypatch):
+    def broken_commit(store_class, shopping_lists):
+        raise RuntimeError("Commit failed")
+
+    monkeypatch.setattr(service_module, "commit_orders", broken_commit)
+    order = {"action": "order", "items": [{"product": 1, "quantity": 1}]}
+
+    async def place_orders():
+        return await asyncio.wait_for(asyncio.gather(
+            *(service.handle_request(order) for _ in range(3)),
+            return_exceptions=True), 5)
+
+    errors = asyncio.run(place_orders())
+    assert [str(error) for error in errors] == ["Commit failed"] * 3
+
+
+def test_service_over_tcp(service):
+
+    async def round_trip():
+        server = await service.start(port=0)
+        host, port = server.sockets[0].getsockname()[:2]
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(b'{"action": "total"}\nnot json\n')
+        await writer.drain()
+        responses = [json.loads(await reader.readline()) for _ in range(2)]
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return responses
+
+    responses = asyncio.run(round_trip())
+    assert responses[0] == {"ok": True, "total_quantity": 102}
+    assert responses[1]["ok"] is False
@@ -0,0 +1,67 @@
+import pytest
+from promotions import SecondHalfPrice
+from sharding import ShardedStore, shard_of
+
+
+@pytest.fixture
+def create_products(make_products):
+    """Factory of the sharded test products"""
+    def create():
+        product_list = make_products(
+            "Google Pixel 7", "Windows License", "Shipping",
+            "MacBook Air M2", quantities={"Google Pixel 7": 5})
+        product_list[0].set_promotion(SecondHalfPrice("Second Half price!"))
+        return product_list
+    return create
+
+
+def test_shard_of_is_stable():
+    assert shard_of("Shipping", 4) == shard_of("Shipping", 4)
+    assert {shard_of(f"Product {i}", 4) for i in range(100)} == \
+        {0, 1, 2, 3}
+
+
+def test_sharded_order_and_counters(create_products):
+    with ShardedStore(create_products(), shards=3) as store:
+        assert store.get_total_quantity() == 355
+        assert store.get_active_count() == 4
+        assert store.order([("Google Pixel 7", 2), ("MacBook Air M2", 1),
+                            ("Windows License", 2)]) == 2450
+        assert store.get_total_quantity() == 352
+
+        results = store.order_many([[("Google Pixel 7", 3)],
+                                    [("Google Pixel 7", 1)],
+                                    [("Shipping", 2)],
+                                    [("Nothing", 1)]])
+        assert [result.success for result in results] == [True, False,
+                                                          False, False]
+        assert results[0].lines == [("Google Pixel 7", 3, 125000)]
+        assert results[3].errors == ["Unknown product Nothing"]
+        assert store.get_total_quantity() == 349
+        assert store.get_active_count() == 3
+
+
+def test_sharded_order_is_atomic_per_shard(create_products):
+    products = create_products()
+    shards = 2
+    names = [product.name for product in products]
+    with ShardedStore(products, shards=shards) as store:
+        result = store.order_many([[(name, 1) for name in names]
+                                   + [("Shipping", 1)]])[0]
+        shipping_shard = shard_of("Shipping", shards)
+        assert result.errors
+        assert sorted(name for name, _, _ in result.lines) == \
+            sorted(name for name in names
+                   if shard_of(name, shards) != shipping_shard)
+
+
+def test_sharded_store_survives_malformed_carts(create_products):
+    with ShardedStore(create_products(), shards=2) as store:
+        results = store.order_many([[("Google Pixel 7", "2")],
+                                    [("Google Pixel 7", None)],
+                                    [("MacBook Air M2", 1.5)],
+                                    [("Google Pixel 7", 1)]])
+        assert [result.success for result in results] == [False, False,
+                                                          False, True]
+        assert store.order([("MacBook Air M2", 1)]) == 1450
+        assert store.get_total_quantity() == 353
@@ -0,0 +1,136 @@
+import threading
+from products import Product
+from promotions import PercentDiscount
+from snapshots import CHUNK_SIZE
+from store import Store
+
+
+PRODUCTS = ("Google Pixel 7", "Windows License", "Shipping")
+STOCK = {"Google Pixel 7": 5}
+
+
+def test_snapshot_is_immutable(make_store):
+    best_buy, (pixel, license_, shipping) = make_store(*PRODUCTS, quantities=STOCK)
+    before = best_buy.snapshot()
+    assert len(before) == 3
+    assert before.total_quantity == 255
+    assert before.active_count == 3
+    assert best_buy.checkout([(pixel, 5), (shipping, 1)]).success
+    after = best_buy.snapshot()
+    assert after.version > before.version
+    assert before.get(best_buy.get_product_id(pixel)).quantity == 5
+    record = after.get(best_buy.get_product_id(pixel))
+    assert (record.quantity, record.active) == (0, False)
+    assert after.total_quantity == 249
+    assert [record.name for record in after.get_all_products()] == \
+        ["Windows License", "Shipping"]
+    assert after.get(best_buy.get_product_id(shipping)).show() == \
+        shipping.show()
+
+
+def test_snapshot_shares_unchanged_chunks():
+    best_buy = Store([Product(f"Product {i}", price=1, quantity=1)
+                      for i in range(3 * CHUNK_SIZE)])
+    before = best_buy.snapshot()
+    product = best_buy.get_product_by_id(1)
+    best_buy.order([(product, 1)])
+    after = best_buy.snapshot()
+    assert after.chunks[0] is not before.chunks[0]
+    assert after.chunks[1:] == before.chunks[1:]
+    assert all(new is old for new, old in zip(after.chunks[1:],
+                                              before.chunks[1:]))
+
+
+def test_snapshot_tracks_catalog_changes(make_store):
+    best_buy, (pixel, license_, _) = make_store(*PRODUCTS, quantities=STOCK)
+    best_buy.enable_snapshots()
+    best_buy.remove_product(license_)
+    ipad = Product("iPad", price=800, quantity=2)
+    best_buy.add_product(ipad)
+    pixel.set_price(450)
+    snapshot = best_buy.snapshot()
+    assert [record.name for record in snapshot] == \
+        ["Google Pixel 7", "Shipping", "iPad"]
+    assert snapshot.get(best_buy.get_product_id(pixel)).price == 450
+    assert snapshot.total_quantity == 257
+
+
+def test_snapshot_reads_current_state(make_store):
+    best_buy, (pixel, _, _) = make_store(*PRODUCTS, quantities=STOCK)
+    best_buy.enable_snapshots()
+    pixel.set_quantity(50)
+    thread = threading.Thread(target=best_buy.checkout, args=([(pixel, 5)],))
+    thread.start()
+    thread.join()
+    assert best_buy.snapshot().get(best_buy.get_product_id(pixel)) \
+        .quantity == 45
+    assert best_buy.snapshot().total_quantity == 295
+
+
+def test_changes_of_exited_threads_are_published(make_store):
+    best_buy, (pixel, _, _) = make_store(*PRODUCTS, quantities=STOCK)
+    best_buy.enable_snapshots()
+
+    def writer():
+        pixel.set_quantity(3)
+        best_buy.add_product(Product("iPad", price=800, quantity=2))
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    thread.join()
+    snapshot = best_buy.snapshot()
+    assert [record.name for record in snapshot] == \
+        ["Google Pixel 7", "Windows License", "Shipping", "iPad"]
+    assert snapshot.total_quantity == 255
+
+
+def test_quote_from_snapshot(make_store):
+    best_buy, (pixel, _, _) = make_store(*PRODUCTS, quantities=STOCK)
+    snapshot = best_buy.snapshot()
+    pixel.set_promotion(PercentDiscount("Half", percent=50))
+    assert best_buy.quote([(pixel, 2)], snapshot=snapshot).total == 1000
+    assert best_buy.quote([(pixel, 2)]).total == 500
+
+
+def test_snapshots_never_show_part_of_an_order(make_store):
+    best_buy, (pixel, earbuds) = make_store(
+        "Google Pixel 7", "Bose QuietComfort Earbuds",
+        quantities={"Google Pixel 7": 3000,
+                    "Bose QuietComfort Earbuds": 3000})
+    pixel_id = best_buy.get_product_id(pixel)
+    earbuds_id = best_buy.get_product_id(earbuds)
+    best_buy.enable_snapshots()
+    done = threading.Event()
+    torn = []
+
+    def buyer():
+        for number in range(1000):
+            best_buy.checkout([(pixel, 1), (earbuds, 1)])
+            best_buy.bulk_update([{"id": pixel_id, "quantity": 5000},
+                                  {"id": earbuds_id, "quantity": 5000}])
+            best_buy.order([(pixel, 2), (earbuds, 2)])
+            pixel.set_price(500 + number % 10)
+        done.set()
+
+    thread = threading.Thread(target=buyer)
+    thread.start()
+    while not done.is_set():
+        snapshot = best_buy.snapshot()
+        if snapshot.get(pixel_id).quantity != \
+                snapshot.get(earbuds_id).quantity:
+            torn.append(snapshot)
+    thread.join()
+    assert torn == []
+    snapshot = best_buy.snapshot()
+    assert snapshot.get(pixel_id).quantity == 4998
+    assert snapshot.get(pixel_id).price == 509
+
+
+def test_products_page_resumes_after_id():
+    best_buy = Store([Product(f"Product {i}", price=1, quantity=1)
+                      for i in range(3 * CHUNK_SIZE)])
+    best_buy.get_product_by_id(CHUNK_SIZE + 1).deactivate()
+    page = best_buy.get_products_page(CHUNK_SIZE - 1, 3)
+    assert [product_id for product_id, _ in page] == \
+        [CHUNK_SIZE, CHUNK_SIZE + 2, CHUNK_SIZE + 3]
+    assert best_buy.get_products_page(3 * CHUNK_SIZE, 3) == []
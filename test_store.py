@@ -1,6 +1,10 @@
+import random
+import sys
+import threading
 import pytest
 from store import Store
 from products import Product, LimitedProduct, NonStockedProduct
+from promotions import SecondHalfPrice, PercentDiscount
 
 
 # Test store creation
@@ -95,4 +99,234 @@ def test_store_order_errors():
     assert best_buy.order(shopping_list) == 18750
 
 
+# Test store aggregates follow product changes
+def test_store_aggregates_follow_products():
+    product_list = [Product("MacBook Air M2", price=1450, quantity=100),
+                    Product("Google Pixel 7", price=500, quantity=250),
+                    NonStockedProduct("Windows License", price=125)]
+
+    best_buy = Store(product_list)
+    product_list[0].buy(100)
+    assert best_buy.get_total_quantity() == 250
+    assert best_buy.get_all_products() == product_list[1:]
+
+    product_list[0].set_quantity(10)
+    product_list[0].activate()
+    product_list[2].deactivate()
+    assert best_buy.get_total_quantity() == 260
+    assert product_list[0] in best_buy.get_all_products()
+    assert product_list[2] not in best_buy.get_all_products()
+
+    best_buy.remove_product(product_list[1])
+    assert best_buy.get_total_quantity() == 10
+    assert best_buy.get_all_products() == [product_list[0]]
+
+
+# Test lookups and price range queries
+def test_store_lookup_and_price_range():
+    product_list = [Product("MacBook Air M2", price=1450, quantity=100),
+                    Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                    Product("Google Pixel 7", price=500, quantity=250),
+                    NonStockedProduct("Windows License", price=125)]
+
+    best_buy = Store(product_list)
+    assert best_buy.get_product("Google Pixel 7") is product_list[2]
+    assert best_buy.get_product_by_id(1) is product_list[0]
+    assert best_buy.get_products_in_price_range(100, 500) == \
+        [product_list[3], product_list[1], product_list[2]]
+
+    product_list[1].deactivate()
+    product_list[0].set_price(400)
+    assert best_buy.get_products_in_price_range(100, 500) == \
+        [product_list[3], product_list[0], product_list[2]]
+
+
+# Test concurrent orders never oversell stock
+def test_store_concurrent_orders(capsys):
+    product_list = [Product(f"Product {i}", price=10, quantity=300)
+                    for i in range(8)]
+    best_buy = Store(product_list)
+    totals = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        total = 0
+        for _ in range(200):
+            cart = [(rng.choice(product_list), rng.randint(1, 3))
+                    for _ in range(rng.randint(1, 4))]
+            total += best_buy.order(cart)
+        totals.append(total)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=(seed,))
+                   for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    capsys.readouterr()
+
+    assert all(product.quantity >= 0 for product in product_list)
+    sold = sum(300 - product.quantity for product in product_list)
+    assert sum(totals) == sold * 10
+    assert best_buy.get_total_quantity() == 8 * 300 - sold
+
+
+# Test atomic checkout - normal
+def test_store_checkout():
+    product_list = [Product("MacBook Air M2", price=1450, quantity=100),
+                    Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                    Product("Google Pixel 7", price=500, quantity=250),
+                    NonStockedProduct("Windows License", price=125),
+                    LimitedProduct("Shipping", price=10, quantity=250, maximum=1)]
+
+    best_buy = Store(product_list)
+    shopping_list = [(product_list[1], 30),
+                     (product_list[3], 50),
+                     (product_list[1], 20),
+                     (product_list[-1], 1)]
+    result = best_buy.checkout(shopping_list)
+    assert result.success
+    assert result.total == 18760
+    assert [line[:2] for line in result.lines] == [(product_list[1], 50),
+                                                   (product_list[3], 50),
+                                                   (product_list[-1], 1)]
+    assert product_list[1].quantity == 450
+    assert best_buy.get_total_quantity() == 1049
+
+
+# Test atomic checkout - nothing is bought when any line fails
+def test_store_checkout_errors():
+    product_list = [Product("MacBook Air M2", price=1450, quantity=100),
+                    Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                    Product("Google Pixel 7", price=500, quantity=250),
+                    NonStockedProduct("Windows License", price=125),
+                    LimitedProduct("Shipping", price=10, quantity=250, maximum=1)]
+
+    best_buy = Store(product_list)
+    shopping_list = [(product_list[1], 50),
+                     (product_list[0], 101),
+                     (product_list[-1], 1),
+                     (product_list[-1], 1)]
+    result = best_buy.checkout(shopping_list)
+    assert not result.success
+    assert result.total == 0
+    assert len(result.errors) == 2
+    assert product_list[1].quantity == 500
+    assert product_list[-1].quantity == 250
+    assert best_buy.get_total_quantity() == 1100
+
+
+# Test quote - prices without buying
+def test_store_quote():
+    product_list = [Product("MacBook Air M2", price=1450, quantity=100),
+                    Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                    NonStockedProduct("Windows License", price=125)]
+    product_list[0].set_promotion(SecondHalfPrice("Second Half price!"))
+
+    best_buy = Store(product_list)
+    shopping_list = [(product_list[0], 1),
+                     (product_list[1], 2),
+                     (product_list[0], 1)]
+    quote = best_buy.quote(shopping_list)
+    assert [line[:2] for line in quote.lines] == [(product_list[0], 2),
+                                                  (product_list[1], 2)]
+    assert quote.list_total == 3400
+    assert quote.total == 2675
+    assert quote.discount == 725
+    assert best_buy.get_total_quantity() == 600
+    assert best_buy.quote(shopping_list).total == 2675
+    assert best_buy.price_cache.hits == 1
+
+
+def test_bulk_update():
+    pixel = Product("Google Pixel 7", price=500, quantity=2)
+    license_ = NonStockedProduct("Windows License", price=125)
+    macbook = Product("MacBook Air M2", price=1450, quantity=100)
+    best_buy = Store([pixel, license_, macbook])
+    best_buy.order([(pixel, 2)])
+    snapshot_version = best_buy.snapshot().version
+    assert best_buy.search(text="pixel").total == 0
+    sale = PercentDiscount("Sale", percent=10)
+    report = best_buy.bulk_update([
+        {"name": "Google Pixel 7", "quantity": 7, "price": 450},
+        {"id": 3, "quantity": 0},
+        {"id": 2, "promotion": sale},
+        {"id": 9, "quantity": 1},
+        {"name": "Windows License", "quantity": 3},
+        {"id": 1, "price": -1},
+        {"id": 1, "quantity": "many"},
+        {"id": 1, "colour": "red"},
+        {"id": 3, "active": True},
+        "nonsense"])
+    assert report.updated == 3
+    assert report.failed == 7
+    assert [row for row, _ in report.errors] == [3, 4, 5, 6, 7, 8, 9]
+    assert report.errors[0] == (3, "Unknown product 9")
+    assert pixel.quantity == 7 and pixel.price == 450 and pixel.is_active()
+    assert not macbook.is_active()
+    assert license_.promotion is sale
+    assert best_buy.get_total_quantity() == 7
+    assert best_buy.get_all_products() == [license_, pixel]
+    assert best_buy.get_products_in_price_range(400, 500) == [pixel]
+    assert best_buy.search(text="pixel").products == [pixel]
+    snapshot = best_buy.snapshot()
+    assert snapshot.version == snapshot_version + 1
+    assert snapshot.total_quantity == 7
+
+
+def test_bulk_update_active_flag():
+    pixel = Product("Google Pixel 7", price=500, quantity=5)
+    best_buy = Store([pixel])
+    report = best_buy.bulk_update([{"id": 1, "quantity": 0,
+                                    "active": True}])
+    assert report.errors == [(0, "Google Pixel 7 can't be active "
+                                 "without stock")]
+    best_buy.bulk_update([{"id": 1, "active": False}])
+    best_buy.bulk_update([{"id": 1, "quantity": 8}])
+    assert not pixel.is_active()
+    best_buy.bulk_update([{"id": 1, "quantity": 0},
+                          {"id": 1, "quantity": 3}])
+    assert pixel.is_active()
+    assert best_buy.get_active_count() == 1
+
+
+def test_store_price_assignment_updates_index():
+    first = Product("First", price=10, quantity=1)
+    second = Product("Second", price=20, quantity=1)
+    third = Product("Third", price=30, quantity=1)
+    best_buy = Store([first, second, third])
+    first.price = 25
+    assert best_buy.get_products_in_price_range(20, 30) == [second, first,
+                                                            third]
+    assert best_buy.get_total_quantity() == 3
+    first.quantity = 5
+    assert best_buy.get_total_quantity() == 7
+    best_buy.remove_product(first)
+    assert best_buy.get_products_in_price_range(0, 100) == [second, third]
+
+
+def test_bulk_update_validates_stock_under_locks(monkeypatch, capsys):
+    pixel = Product("Google Pixel 7", price=500, quantity=5)
+    best_buy = Store([pixel])
+    find_product = best_buy._update_product
+
+    def drain_after_lookup(update):
+        # An order sells the last items before the locks are taken
+        product = find_product(update)
+        best_buy.order([(pixel, 5)])
+        return product
+
+    monkeypatch.setattr(best_buy, "_update_product", drain_after_lookup)
+    report = best_buy.bulk_update([{"id": 1, "active": True}])
+    capsys.readouterr()
+    assert report.errors == [(0, "Google Pixel 7 can't be active "
+                                 "without stock")]
+    assert pixel.quantity == 0 and not pixel.is_active()
+
+
 pytest.main()